@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+import jwt
+from fastapi import Header, HTTPException
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Supabase access tokens are verified locally, without a request to Supabase.
+# Projects on the legacy shared secret sign with HS256 (Settings > API > JWT Secret);
+# projects with asymmetric signing keys publish them at the JWKS URL.
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or f"{os.getenv('SUPABASE_URL', '').rstrip('/')}/auth/v1/.well-known/jwks.json"
+# Signing keys are refetched at most this often (key rotation picks up within this window)
+JWKS_REFRESH_SECONDS = int(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "authenticated")
+# Tolerated clock skew between Supabase and this server
+JWT_LEEWAY_SECONDS = int(os.getenv("JWT_LEEWAY_SECONDS", "30"))
+# Comma-separated admin emails, in addition to users with app_metadata.role = "admin"
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "admin@test.com").split(",") if email.strip()}
+
+# Verified tokens are remembered until they expire (at most JWKS_REFRESH_SECONDS),
+# so a client polling with the same token rarely pays for the signature check
+TOKEN_CACHE_SIZE = 10000
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+class AuthUser(BaseModel):
+    id: str
+    # Phone and anonymous sign-ins have no email claim
+    email: Optional[str] = None
+    is_admin: bool = False
+
+class TokenVerifier:
+    def __init__(self, secret=None, jwks_url=None, audience=JWT_AUDIENCE, refresh_seconds=JWKS_REFRESH_SECONDS):
+        self.secret = secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.refresh_seconds = refresh_seconds
+        self.jwks_client = None
+        self.cache = {} # token -> (exp, AuthUser)
+        self.lock = threading.Lock()
+
+    def signing_key(self, token):
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == "HS256":
+            if not self.secret:
+                raise jwt.InvalidTokenError("HS256 tokens need SUPABASE_JWT_SECRET")
+            return self.secret, ["HS256"]
+        with self.lock:
+            if self.jwks_client is None:
+                # The key set is cached for refresh_seconds (an unknown kid also
+                # refetches it, at most every 30 s). Keys are not cached past
+                # that, so a key removed from the set stops being accepted.
+                self.jwks_client = jwt.PyJWKClient(self.jwks_url, lifespan=self.refresh_seconds)
+        return self.jwks_client.get_signing_key_from_jwt(token).key, ASYMMETRIC_ALGORITHMS
+
+    def decode(self, token):
+        """
+        Checks the signature, expiry and audience and returns the claims.
+        Raises jwt.InvalidTokenError (or jwt.PyJWKClientError) otherwise.
+        """
+        key, algorithms = self.signing_key(token)
+        return jwt.decode(
+            token, key, algorithms=algorithms, audience=self.audience,
+            leeway=JWT_LEEWAY_SECONDS, options={"require": ["sub", "exp"]}
+        )
+
+    def verify(self, token):
+        now = time.time()
+        cached = self.cache.get(token)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        claims = self.decode(token)
+        user = user_from_claims(claims)
+        with self.lock:
+            if len(self.cache) >= TOKEN_CACHE_SIZE:
+                self.cache = {t: entry for t, entry in self.cache.items() if entry[0] > now}
+                if len(self.cache) >= TOKEN_CACHE_SIZE:
+                    self.cache.clear()
+            # Re-verified at least every refresh_seconds, so a token signed
+            # with a key removed from the JWKS stops working within that window
+            self.cache[token] = (min(claims["exp"], now + self.refresh_seconds), user)
+        return user
+
+def user_from_claims(claims):
+    email = claims.get("email")
+    role = (claims.get("app_metadata") or {}).get("role")
+    return AuthUser(
+        id=claims["sub"],
+        email=email,
+        is_admin=role == "admin" or (email or "").lower() in ADMIN_EMAILS
+    )
+
+token_verifier = TokenVerifier(SUPABASE_JWT_SECRET, SUPABASE_JWKS_URL)
+
+def authenticate(token):
+    """
+    Returns the AuthUser of a Supabase access token, or raises HTTPException 401.
+    """
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return token_verifier.verify(token)
+    except (jwt.InvalidTokenError, jwt.PyJWKClientError) as e:
+        logger.info(f"Rejected access token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+
+def get_current_user(authorization: str = Header(None)):
+    """
+    FastAPI dependency: the user of the "Authorization: Bearer <access_token>" header.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer":
+        token = None
+    return authenticate(token.strip() if token else None)
+
+def require_admin(user: AuthUser):
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin only")
+
+def require_task_access(task, user: AuthUser):
+    """
+    Tasks are visible to their owner and to admins. Other users get 404, so
+    task ids of other users cannot be probed.
+    """
+    if not task or (task.user_id != user.id and not user.is_admin):
+        raise HTTPException(status_code=404, detail="Task not found")
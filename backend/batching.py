@@ -0,0 +1,215 @@
+import os
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from engines import DEFAULT_ENGINE, DEFAULT_MODEL_SIZE, resolve_decoding_options
+from vad import detect_speech_regions, build_speech_audio, remap_segments, VAD_ENABLED
+from longform import probe_duration
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+WINDOW_SECONDS = 30 # Whisper's fixed input length
+TIME_PRECISION = 0.02 # Seconds per timestamp token
+
+# 0 disables batching. Otherwise short clips queued within this many ms are decoded together.
+BATCH_WINDOW_MS = int(os.getenv("WHISPER_BATCH_WINDOW_MS", "0"))
+BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+BATCH_MAX_CLIP_SECONDS = float(os.getenv("WHISPER_BATCH_MAX_CLIP_SECONDS", "90"))
+
+def tokens_to_segments(tokens, tokenizer, offset, window_duration):
+    """
+    Splits a decoded token sequence at its timestamp tokens, e.g.
+    <|0.00|> text <|2.40|><|2.40|> text <|5.00|>, into (start, end, text_tokens).
+    """
+    segments = []
+    start = None
+    text_tokens = []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            t = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+            if start is not None and text_tokens:
+                segments.append((offset + start, offset + min(t, window_duration), text_tokens))
+                text_tokens = []
+                start = None
+            else:
+                start = t
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        # The window ended before a closing timestamp
+        segments.append((offset + (start or 0.0), offset + window_duration, text_tokens))
+    return segments
+
+def transcribe_batch(model, audios, decoding_options):
+    """
+    Transcribes several short clips with batched encoder/decoder passes.
+
+    Every clip is cut into 30 s windows, all windows are decoded as one padded
+    batch, and the segments are split back per clip with their window offsets.
+    Windows are decoded independently and without temperature fallback, which
+    is what makes them batchable. Returns one {"text", "segments"} per clip.
+    """
+    import torch
+    import whisper
+    from whisper.tokenizer import get_tokenizer
+
+    windows = [] # (clip index, offset seconds, duration seconds, mel)
+    for clip_index, audio in enumerate(audios):
+        for start in range(0, max(len(audio), 1), WINDOW_SECONDS * SAMPLE_RATE):
+            chunk = audio[start:start + WINDOW_SECONDS * SAMPLE_RATE]
+            mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(chunk), model.dims.n_mels)
+            windows.append((clip_index, start / SAMPLE_RATE, len(chunk) / SAMPLE_RATE, mel))
+
+    options = whisper.DecodingOptions(
+        task="transcribe",
+        language=decoding_options.get("language"), # None = detected per window
+        beam_size=decoding_options["beam_size"] if decoding_options.get("beam_size", 1) > 1 else None,
+        temperature=0.0,
+        without_timestamps=False,
+        fp16=model.device != torch.device("cpu"),
+    )
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, task="transcribe")
+
+    mel_batch = torch.stack([mel for _, _, _, mel in windows]).to(model.device)
+    decoded = whisper.decode(model, mel_batch, options)
+
+    results = [{"text": "", "segments": []} for _ in audios]
+    for (clip_index, offset, duration, _), result in zip(windows, decoded):
+        # Same silence rule as whisper.transcribe
+        if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+            continue
+        clip_segments = results[clip_index]["segments"]
+        for start, end, text_tokens in tokens_to_segments(result.tokens, tokenizer, offset, duration):
+            text = tokenizer.decode(text_tokens)
+            if not text.strip():
+                continue
+            clip_segments.append({
+                "id": len(clip_segments),
+                "seek": int(offset * 100),
+                "start": round(start, 2),
+                "end": round(end, 2),
+                "text": text,
+                "tokens": text_tokens,
+                "temperature": 0.0,
+                "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio,
+                "no_speech_prob": result.no_speech_prob,
+            })
+    for result in results:
+        result["text"] = "".join(seg["text"] for seg in result["segments"])
+    return results
+
+class TranscriptionBatcher:
+    """
+    Collects short clips submitted by concurrent tasks and transcribes them in
+    batches on a single worker thread.
+
+    A batch is started once `batch_size` compatible clips are queued or
+    `window_ms` after the first one arrived. The model runs under `lock`, the
+    same lock that serializes regular transcription.
+    """
+    def __init__(self, lock, window_ms=BATCH_WINDOW_MS, batch_size=BATCH_SIZE, max_clip_seconds=BATCH_MAX_CLIP_SECONDS):
+        self.lock = lock
+        self.window_ms = window_ms
+        self.batch_size = batch_size
+        self.max_clip_seconds = max_clip_seconds
+        self.requests = queue.Queue()
+        self.worker = None
+        self.worker_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.window_ms > 0
+
+    def accepts(self, options):
+        """
+        Only the PyTorch Whisper engine is batched.
+        """
+        return self.enabled and (options.get("engine") or DEFAULT_ENGINE) == "whisper"
+
+    def try_transcribe(self, audio_path, options):
+        """
+        Transcribes through a batch if the clip is short enough, otherwise
+        returns None and the caller falls back to the regular path.
+        """
+        if not self.accepts(options) or options.get("streaming_decode"):
+            return None
+        # Check the length before decoding: long recordings must never be
+        # loaded whole, they go to the bounded-memory streaming decode
+        duration = probe_duration(audio_path)
+        if duration is None or duration > self.max_clip_seconds:
+            return None
+        import whisper
+
+        audio = whisper.load_audio(audio_path)
+
+        timeline = None
+        if options.get("vad", VAD_ENABLED):
+            speech_audio, timeline = build_speech_audio(audio, detect_speech_regions(audio))
+            if not timeline:
+                return {"text": "", "segments": []}
+            audio = speech_audio
+
+        decoding_options = resolve_decoding_options(options.get("preset"), **{k: v for k, v in options.items() if k != "preset"})
+        result = self.submit(audio, options.get("model_size") or DEFAULT_MODEL_SIZE, decoding_options).result()
+        if timeline:
+            result["segments"] = remap_segments(result["segments"], timeline)
+        return result
+
+    def submit(self, audio, model_size, decoding_options):
+        self._ensure_worker()
+        future = Future()
+        # Clips can share a batch only with identical model and decoding settings
+        key = (model_size, decoding_options.get("language"), decoding_options.get("beam_size"))
+        self.requests.put((key, audio, future))
+        return future
+
+    def _ensure_worker(self):
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+
+    def _collect(self):
+        pending = [self.requests.get()]
+        deadline = time.monotonic() + self.window_ms / 1000
+        while len(pending) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        from logic import load_whisper_model
+
+        while True:
+            pending = self._collect()
+            groups = {}
+            for key, audio, future in pending:
+                groups.setdefault(key, []).append((audio, future))
+
+            for (model_size, language, beam_size), items in groups.items():
+                try:
+                    with self.lock:
+                        model = load_whisper_model(model_size)
+                        logger.info(f"Batch-transcribing {len(items)} clips...")
+                        results = transcribe_batch(
+                            model,
+                            [np.asarray(audio, dtype=np.float32) for audio, _ in items],
+                            {"language": language, "beam_size": beam_size}
+                        )
+                    for (_, future), result in zip(items, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
@@ -63,6 +63,39 @@ class Task(Base):
     # Diarization (Pyannote)
     diarization = Column(JSON, nullable=True)
 
+    # Speaker display names, e.g. {"SPEAKER_00": "Alice"}. Stored text keeps the
+    # original speaker codes; aliases are applied when rendering/exporting.
+    speaker_aliases = Column(JSON, nullable=True)
+
+    # Per-task transcription settings, e.g. {"engine": "faster-whisper"}
+    transcription_options = Column(JSON, nullable=True)
+
+    # Per-task LLM stage settings, e.g. {"correction_mode": "full"}
+    llm_options = Column(JSON, nullable=True)
+
+    # LLM stage statistics, e.g. {"correction": {...}, "summary": {"compact_tokens_est": ...}}
+    llm_usage = Column(JSON, nullable=True)
+
+    # Cached chunk summaries of hierarchical summarization:
+    # {"chunk_seconds": 600, "chunks": [{"start", "end", "hash", "summary"}]}
+    summary_chunks = Column(JSON, nullable=True)
+
+    # Progress of the running LLM stage, e.g. {"stage": "correcting", "completed": 20, "total": 57}
+    progress = Column(JSON, nullable=True)
+
+    # Edit version of the corrected content, bumped on every write so that
+    # concurrent edits can be rejected instead of silently overwritten.
+    version = Column(Integer, default=0)
+
+class UserPreference(Base):
+    __tablename__ = "user_preferences"
+
+    # Supabase Auth UUID
+    user_id = Column(String, primary_key=True)
+    # Default transcription settings for new tasks, e.g. {"preset": "fast", "language": "zh"}
+    transcription_options = Column(JSON, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
 
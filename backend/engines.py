@@ -0,0 +1,218 @@
+import os
+import logging
+import threading
+
+from metrics import record_model_cache
+
+logger = logging.getLogger(__name__)
+
+# Deployment-wide defaults; a task can override the engine via its transcription options
+DEFAULT_ENGINE = os.getenv("TRANSCRIPTION_ENGINE", "whisper")
+DEFAULT_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "tiny")
+# Set to "int8" to quantize the PyTorch Whisper model's Linear layers on CPU
+DEFAULT_QUANTIZE = os.getenv("WHISPER_QUANTIZE") or None
+
+# Named speed/accuracy trade-offs. Explicit options given with a task override these.
+#   beam_size 1 = greedy decoding
+#   temperature_fallback = re-decode at higher temperatures when the output looks bad
+DECODING_PRESETS = {
+    "fast": {"beam_size": 1, "best_of": 1, "temperature_fallback": False, "condition_on_previous_text": False},
+    "balanced": {"beam_size": 1, "best_of": 3, "temperature_fallback": True, "condition_on_previous_text": True},
+    "accurate": {"beam_size": 5, "best_of": 5, "temperature_fallback": True, "condition_on_previous_text": True},
+}
+
+DECODING_OPTIONS = ["language", "beam_size", "best_of", "temperature_fallback", "condition_on_previous_text"]
+TRANSCRIPTION_OPTIONS = ["engine", "model_size", "preset", "vad", "streaming_decode"] + DECODING_OPTIONS
+
+FALLBACK_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+INTEGER_OPTIONS = ["beam_size", "best_of"]
+BOOLEAN_OPTIONS = ["temperature_fallback", "condition_on_previous_text", "vad", "streaming_decode"]
+
+def _as_int(key, value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{key} must be an integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{key} must be an integer")
+    if value < 1:
+        raise ValueError(f"{key} must be at least 1")
+    return value
+
+def _as_bool(key, value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower() if isinstance(value, (int, str)) else None
+    if text in ("true", "1", "yes", "on"):
+        return True
+    if text in ("false", "0", "no", "off"):
+        return False
+    raise ValueError(f"{key} must be true or false")
+
+def validate_transcription_options(options):
+    """
+    Returns the stored/requested transcription options with numbers and flags
+    given as strings converted to their types. Raises ValueError if they are invalid.
+    """
+    if not isinstance(options, dict):
+        raise ValueError("Transcription options must be an object")
+    unknown = set(options) - set(TRANSCRIPTION_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown transcription options: {', '.join(sorted(unknown))}")
+    normalized = {}
+    for key, value in options.items():
+        if value is None:
+            normalized[key] = None
+        elif key in INTEGER_OPTIONS:
+            normalized[key] = _as_int(key, value)
+        elif key in BOOLEAN_OPTIONS:
+            normalized[key] = _as_bool(key, value)
+        elif not isinstance(value, str):
+            raise ValueError(f"{key} must be a string")
+        else:
+            normalized[key] = value
+    if normalized.get("engine") and normalized["engine"] not in ENGINES:
+        raise ValueError(f"Unknown engine '{normalized['engine']}'. Available: {', '.join(ENGINES)}")
+    if normalized.get("preset") and normalized["preset"] not in DECODING_PRESETS:
+        raise ValueError(f"Unknown preset '{normalized['preset']}'. Available: {', '.join(DECODING_PRESETS)}")
+    return normalized
+
+def resolve_decoding_options(preset=None, **overrides):
+    """
+    Merges a preset with explicit options. Returns only the options that are set,
+    so with no preset and no overrides the engine's own defaults apply.
+    """
+    options = dict(DECODING_PRESETS[preset]) if preset else {}
+    options.update({k: v for k, v in overrides.items() if k in DECODING_OPTIONS and v is not None})
+    return options
+
+class TranscriptionEngine:
+    """
+    Interface behind logic.transcribe_audio.
+
+    transcribe() takes an audio file path (or a 16 kHz float32 array) and returns
+    the openai-whisper result shape: {"text": str, "segments": [{"start", "end", "text", ...}]}.
+    """
+    name = None
+
+    def transcribe(self, audio, model_size=None, **decoding_options):
+        """
+        decoding_options are the engine-independent keys of DECODING_OPTIONS.
+        """
+        raise NotImplementedError
+
+    def preload(self, model_size=None):
+        """
+        Loads the model ahead of the first transcription. Engines without a model to load do nothing.
+        """
+
+class WhisperEngine(TranscriptionEngine):
+    """
+    openai-whisper on PyTorch (the original engine).
+    """
+    name = "whisper"
+
+    @staticmethod
+    def decode_kwargs(decoding_options):
+        kwargs = {}
+        if decoding_options.get("language"):
+            kwargs["language"] = decoding_options["language"]
+        if decoding_options.get("beam_size", 1) > 1:
+            kwargs["beam_size"] = decoding_options["beam_size"] # Greedy otherwise
+        if decoding_options.get("best_of"):
+            kwargs["best_of"] = decoding_options["best_of"]
+        if decoding_options.get("temperature_fallback") is False:
+            kwargs["temperature"] = 0.0
+        if decoding_options.get("condition_on_previous_text") is not None:
+            kwargs["condition_on_previous_text"] = decoding_options["condition_on_previous_text"]
+        return kwargs
+
+    def preload(self, model_size=None):
+        from logic import load_whisper_model
+        load_whisper_model(model_size or DEFAULT_MODEL_SIZE)
+
+    def transcribe(self, audio, model_size=None, **decoding_options):
+        from logic import load_whisper_model
+        model = load_whisper_model(model_size or DEFAULT_MODEL_SIZE)
+        return model.transcribe(audio, **self.decode_kwargs(decoding_options))
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """
+    faster-whisper (CTranslate2). Defaults to int8 on CPU, which is typically
+    several times faster than fp32 PyTorch and uses less memory.
+    """
+    name = "faster-whisper"
+
+    def __init__(self):
+        self.device = os.getenv("FASTER_WHISPER_DEVICE", "cpu")
+        self.compute_type = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+        self.cpu_threads = int(os.getenv("FASTER_WHISPER_CPU_THREADS", "0")) # 0 = CTranslate2 default
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def load_model(self, model_size):
+        with self.lock:
+            record_model_cache("faster-whisper", model_size in self.models)
+            if model_size not in self.models:
+                from faster_whisper import WhisperModel
+                logger.info(f"Loading faster-whisper model: {model_size} ({self.device}, {self.compute_type})...")
+                self.models[model_size] = WhisperModel(
+                    model_size,
+                    device=self.device,
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads
+                )
+                logger.info("faster-whisper model loaded.")
+            return self.models[model_size]
+
+    def preload(self, model_size=None):
+        self.load_model(model_size or DEFAULT_MODEL_SIZE)
+
+    @staticmethod
+    def decode_kwargs(decoding_options):
+        kwargs = {key: decoding_options[key] for key in ["language", "beam_size", "best_of", "condition_on_previous_text"] if decoding_options.get(key) is not None}
+        if decoding_options.get("temperature_fallback") is False:
+            kwargs["temperature"] = 0.0
+        return kwargs
+
+    def transcribe(self, audio, model_size=None, **decoding_options):
+        model = self.load_model(model_size or DEFAULT_MODEL_SIZE)
+        segments_iter, info = model.transcribe(audio, **self.decode_kwargs(decoding_options))
+        segments = [
+            {
+                "id": seg.id,
+                "seek": seg.seek,
+                "start": seg.start,
+                "end": seg.end,
+                "text": seg.text,
+                "tokens": list(seg.tokens),
+                "temperature": seg.temperature,
+                "avg_logprob": seg.avg_logprob,
+                "compression_ratio": seg.compression_ratio,
+                "no_speech_prob": seg.no_speech_prob,
+            }
+            for seg in segments_iter # Decoding happens lazily while iterating
+        ]
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "segments": segments,
+            "language": info.language,
+        }
+
+ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+}
+
+_engine_instances = {}
+_engine_lock = threading.Lock()
+
+def get_engine(name=None):
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown transcription engine: {name}. Available: {', '.join(ENGINES)}")
+    with _engine_lock:
+        if name not in _engine_instances:
+            _engine_instances[name] = ENGINES[name]()
+        return _engine_instances[name]
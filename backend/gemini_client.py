@@ -0,0 +1,208 @@
+import os
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from metrics import GEMINI_REQUESTS, GEMINI_RETRIES, GEMINI_RATE_LIMIT_WAIT_SECONDS, record_gemini_usage
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
+
+# Per-API-key budgets. The defaults match the Gemini 2.5 Flash free tier;
+# raise them for paid keys. Requests over budget wait instead of failing.
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "10"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "250000"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+GEMINI_BACKOFF_SECONDS = float(os.getenv("GEMINI_BACKOFF_SECONDS", "2.0"))
+GEMINI_MAX_BACKOFF_SECONDS = 60.0
+# Plaintext gRPC endpoint (host:port) used instead of Google's, e.g. the load-test stub
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+def is_retryable(error):
+    """
+    Rate limits (429) and transient server errors are retried; everything else
+    (invalid key, blocked prompt, ...) fails immediately.
+    """
+    from google.api_core import exceptions
+    return isinstance(error, (
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.InternalServerError,
+        exceptions.DeadlineExceeded,
+    ))
+
+def is_rate_limited(error):
+    from google.api_core import exceptions
+    return isinstance(error, exceptions.ResourceExhausted)
+
+def backoff_seconds(attempt, base=GEMINI_BACKOFF_SECONDS):
+    # Exponential backoff with full jitter, so queued retries do not fire together
+    return random.uniform(0, min(GEMINI_MAX_BACKOFF_SECONDS, base * 2 ** attempt))
+
+class TokenBucket:
+    """
+    A per-minute budget refilled continuously. reserve() always succeeds and
+    returns how long the caller must wait; reservations beyond the budget put
+    the bucket into debt, so concurrent callers queue up in arrival order.
+    """
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        # A single request larger than the whole budget waits for a full bucket only
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+    def drain(self, now):
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+class RateLimiter:
+    """
+    RPM and TPM token buckets for one API key.
+    """
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """
+        Reserves one request and `tokens` prompt tokens. Returns the seconds to wait before sending.
+        """
+        with self.lock:
+            now = time.monotonic()
+            return max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+
+    async def acquire(self, tokens):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            logger.info(f"Gemini rate limit: waiting {wait:.1f}s")
+            GEMINI_RATE_LIMIT_WAIT_SECONDS.observe(wait)
+            await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        with self.lock:
+            self.tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+
+    def throttled(self):
+        # The server disagrees with our budget; stop sending until it refills
+        with self.lock:
+            now = time.monotonic()
+            self.requests.drain(now)
+            self.tokens.drain(now)
+
+class GeminiClient:
+    """
+    Gemini access for one API key. The API clients are bound to the key
+    directly instead of through genai.configure(), which is process-global and
+    would race between concurrent tasks using different keys.
+
+    Calls are async and must run on the LLM loop (see llm_loop).
+    """
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.limiter = RateLimiter()
+        self.client = None
+        self.lock = threading.Lock()
+
+    def _get_client(self):
+        with self.lock:
+            if self.client is None:
+                from google.ai import generativelanguage as glm
+                if GEMINI_API_ENDPOINT:
+                    import grpc
+                    from google.ai.generativelanguage_v1beta.services.generative_service.transports import GenerativeServiceGrpcAsyncIOTransport
+                    channel = grpc.aio.insecure_channel(GEMINI_API_ENDPOINT)
+                    self.client = glm.GenerativeServiceAsyncClient(transport=GenerativeServiceGrpcAsyncIOTransport(channel=channel))
+                else:
+                    self.client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+            return self.client
+
+    def model(self, model_name=GEMINI_MODEL):
+        import google.generativeai as genai
+        model = genai.GenerativeModel(model_name)
+        model._async_client = self._get_client()
+        return model
+
+    async def generate_content(self, prompt, tokens, **kwargs):
+        """
+        GenerativeModel.generate_content_async within this key's budget. `tokens` is
+        the estimated prompt size. Rate-limit and transient errors are retried
+        with backoff; a streamed response is retried only if it fails before the
+        first chunk (which is when generate_content_async returns).
+        """
+        model = self.model()
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            await self.limiter.acquire(tokens)
+            try:
+                response = await model.generate_content_async(prompt, **kwargs)
+            except Exception as e:
+                if attempt == GEMINI_MAX_RETRIES or not is_retryable(e):
+                    GEMINI_REQUESTS.labels(outcome="error").inc()
+                    raise
+                rate_limited = is_rate_limited(e)
+                GEMINI_RETRIES.labels(reason="rate_limited" if rate_limited else "server_error").inc()
+                if rate_limited:
+                    self.limiter.throttled()
+                wait = backoff_seconds(attempt)
+                logger.warning(f"Gemini request failed ({e.__class__.__name__}), retry {attempt + 1}/{GEMINI_MAX_RETRIES} in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                continue
+
+            GEMINI_REQUESTS.labels(outcome="ok").inc()
+            if kwargs.get("stream"):
+                # Token counts are only known once the stream is consumed
+                return UsageRecordingStream(response, lambda r: self._record_usage(r, tokens))
+            self._record_usage(response, tokens)
+            return response
+
+    def _record_usage(self, response, estimated_tokens):
+        record_gemini_usage(response)
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is not None and metadata.prompt_token_count:
+            self.limiter.record_usage(estimated_tokens, metadata.prompt_token_count)
+
+class UsageRecordingStream:
+    """
+    Wraps a streamed response and calls on_done(response) after the last chunk.
+    Everything else (usage_metadata, text, ...) is passed through.
+    """
+    def __init__(self, response, on_done):
+        self.response = response
+        self.on_done = on_done
+
+    async def __aiter__(self):
+        async for chunk in self.response:
+            yield chunk
+        self.on_done(self.response)
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_gemini_client(api_key):
+    """
+    Returns the shared client (and rate limiter) for an API key.
+    """
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = GeminiClient(api_key)
+        return _clients[api_key]
@@ -0,0 +1,28 @@
+import asyncio
+import threading
+
+# All LLM stages run as coroutines on one event loop thread, so a task waiting
+# on Gemini costs a coroutine instead of a worker thread. Async API clients are
+# bound to the loop they were created on, which is why there is exactly one.
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_llm_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+        return _loop
+
+def submit_llm(coro):
+    """
+    Schedules a coroutine on the LLM loop from any thread. Returns a concurrent.futures.Future.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_llm_loop())
+
+async def run_llm(coro):
+    """
+    Awaits a coroutine on the LLM loop from another event loop (e.g. an endpoint).
+    """
+    return await asyncio.wrap_future(submit_llm(coro))
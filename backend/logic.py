@@ -1,78 +1,741 @@
-import whisper
-import google.generativeai as genai
 import os
+import re
+import json
+import math
+import hashlib
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
-# Global variable to store the loaded model
-model = None
-
-def load_whisper_model(model_size="tiny"):
-    global model
-    if model is None:
-        print(f"Loading Whisper model: {model_size}...")
-        model = whisper.load_model(model_size)
-        print("Whisper model loaded.")
-    return model
-
-def transcribe_audio(audio_path):
-    model = load_whisper_model()
-    print(f"Transcribing {audio_path}...")
-    result = model.transcribe(audio_path)
+from engines import get_engine, resolve_decoding_options, DEFAULT_MODEL_SIZE, DEFAULT_QUANTIZE
+from vad import detect_speech_regions, build_speech_audio, remap_segments, SAMPLE_RATE, VAD_ENABLED
+from longform import use_streaming_decode, transcribe_streaming, diarize_streaming
+from gemini_client import get_gemini_client
+from metrics import record_model_cache
+
+logger = logging.getLogger(__name__)
+
+# Loaded Whisper models, keyed by (model size, quantization)
+models = {}
+
+# Per-worker torch thread pinning (0 = torch default)
+WHISPER_NUM_THREADS = int(os.getenv("WHISPER_NUM_THREADS", "0"))
+WHISPER_INTEROP_THREADS = int(os.getenv("WHISPER_INTEROP_THREADS", "0"))
+torch_threads_configured = False
+
+def configure_torch_threads(num_threads=WHISPER_NUM_THREADS, interop_threads=WHISPER_INTEROP_THREADS):
+    global torch_threads_configured
+    if torch_threads_configured or not (num_threads or interop_threads):
+        return
+    import torch
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # Can only be set before torch runs any inter-op parallel work
+            logger.warning(f"Could not set interop threads: {e}")
+    torch_threads_configured = True
+
+def quantize_whisper_model(model):
+    """
+    Applies dynamic int8 quantization to the model's Linear layers (CPU only).
+    """
+    import torch
+    from whisper.model import Linear as WhisperLinear
+
+    # Whisper uses its own Linear subclass, which quantize_dynamic does not
+    # recognize. In fp32 on CPU it behaves exactly like nn.Linear, so swap it.
+    for module in list(model.modules()):
+        for name, child in module.named_children():
+            if type(child) is WhisperLinear:
+                linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.weight = child.weight
+                linear.bias = child.bias
+                setattr(module, name, linear)
+
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_whisper_model(model_size=DEFAULT_MODEL_SIZE, quantize=DEFAULT_QUANTIZE):
+    configure_torch_threads()
+    key = (model_size, quantize)
+    record_model_cache("whisper", key in models)
+    if key not in models:
+        import whisper
+        if quantize == "int8":
+            logger.info(f"Loading Whisper model: {model_size} (dynamic int8, CPU)...")
+            models[key] = quantize_whisper_model(whisper.load_model(model_size, device="cpu"))
+        elif quantize:
+            raise ValueError(f"Unsupported quantization mode: {quantize}")
+        else:
+            logger.info(f"Loading Whisper model: {model_size}...")
+            models[key] = whisper.load_model(model_size)
+        logger.info("Whisper model loaded.")
+    return models[key]
+
+def transcribe_audio(audio_path, engine=None, model_size=None, preset=None, vad=None, streaming_decode=None, **decoding_options):
+    transcription_engine = get_engine(engine)
+    decoding_options = resolve_decoding_options(preset, **decoding_options)
+    if vad is None:
+        vad = VAD_ENABLED
+
+    if use_streaming_decode(audio_path, streaming_decode):
+        # Long recording: decode through a pipe window by window
+        logger.info(f"Transcribing {audio_path} with {transcription_engine.name} {decoding_options} (streaming decode)...")
+        return transcribe_streaming(audio_path, transcription_engine, model_size=model_size, vad=vad, **decoding_options)
+
+    if not vad:
+        logger.info(f"Transcribing {audio_path} with {transcription_engine.name} {decoding_options}...")
+        return transcription_engine.transcribe(audio_path, model_size=model_size, **decoding_options)
+
+    # Feed only the speech regions to the model, then map timestamps back
+    import whisper
+    audio = whisper.load_audio(audio_path)
+    regions = detect_speech_regions(audio)
+    speech_audio, timeline = build_speech_audio(audio, regions)
+    logger.info(f"VAD: {len(speech_audio) / SAMPLE_RATE:.1f}s of speech in {len(audio) / SAMPLE_RATE:.1f}s ({len(regions)} regions).")
+    if not timeline:
+        return {"text": "", "segments": []}
+
+    logger.info(f"Transcribing {audio_path} with {transcription_engine.name} {decoding_options}...")
+    result = transcription_engine.transcribe(speech_audio, model_size=model_size, **decoding_options)
+    result["segments"] = remap_segments(result["segments"], timeline)
     return result
 
+def format_segment(segment):
+    start = segment["start"]
+    end = segment["end"]
+    text = segment["text"]
+    speaker = segment.get("speaker", "")
+    speaker_str = f"[{speaker}] " if speaker else ""
+    return f"[{start:.2f}s -> {end:.2f}s] {speaker_str}{text}\n"
+
 def format_segments(segments):
-    formatted_text = ""
-    for segment in segments:
-        start = segment["start"]
-        end = segment["end"]
-        text = segment["text"]
-        speaker = segment.get("speaker", "")
-        speaker_str = f"[{speaker}] " if speaker else ""
-        formatted_text += f"[{start:.2f}s -> {end:.2f}s] {speaker_str}{text}\n"
-    return formatted_text
-
-def summarize_text(transcription_text, api_key):
+    return "".join(format_segment(segment) for segment in segments)
+
+def update_subtitle_lines(subtitles, segments, indices):
+    """
+    Rewrites only the subtitle lines of the given segment indices.
+    Falls back to formatting every segment when the stored subtitles are not
+    one line per segment (e.g. free-form LLM output).
+    """
+    lines = subtitles.splitlines() if subtitles else []
+    if len(lines) != len(segments):
+        return format_segments(segments)
+    for idx in indices:
+        lines[idx] = format_segment(segments[idx]).rstrip("\n")
+    return "\n".join(lines) + "\n"
+
+@lru_cache(maxsize=128)
+def _speaker_alias_pattern(codes):
+    # Longest codes first, and never match inside a longer token, so that
+    # renaming SPEAKER_1 leaves SPEAKER_10 untouched. The boundaries are ASCII
+    # only: in Chinese text a code is usually followed directly by a CJK
+    # character (e.g. "SPEAKER_00說"), which Unicode \w would count as a word character.
+    alternation = "|".join(re.escape(code) for code in sorted(codes, key=len, reverse=True))
+    return re.compile(rf"(?<![A-Za-z0-9_])(?:{alternation})(?![A-Za-z0-9_])")
+
+def apply_speaker_aliases(text, aliases):
+    """
+    Replaces speaker codes with their display names in a single pass.
+    """
+    if not text or not aliases:
+        return text
+    pattern = _speaker_alias_pattern(tuple(sorted(aliases)))
+    return pattern.sub(lambda m: aliases[m.group(0)], text)
+
+# --- Compact Prompt Encoding ---
+# Consecutive lines of the same speaker are merged into one prompt line of at most this many seconds
+COMPACT_MERGE_MAX_SECONDS = float(os.getenv("COMPACT_MERGE_MAX_SECONDS", "60"))
+COMPACT_FORMAT_NOTE = "逐字稿每行格式為 `起始秒-結束秒 說話者代號: 內容`，說話者代號如 S1、S2。"
+
+_cjk_pattern = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+def estimate_tokens(text):
+    """
+    Rough Gemini token count: about one token per CJK character and four
+    characters per token otherwise. Good enough to compare prompt encodings.
+    """
+    if not text:
+        return 0
+    cjk = len(_cjk_pattern.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def encode_segments_compact(segments, merge_max_seconds=COMPACT_MERGE_MAX_SECONDS, with_ids=False):
+    """
+    Serializes segments for LLM prompts with fewer tokens than format_segments:
+    `12-31 S1: text` instead of `[12.34s -> 15.67s] [SPEAKER_00] text` per segment.
+    Times are whole seconds of the original recording, speakers get short codes
+    and consecutive segments of the same speaker are merged into one line.
+    With `with_ids`, nothing is merged and every line starts with the segment
+    index (`7 12-15 S1: text`) so the model can refer to single segments.
+    Returns (text, speaker_codes), e.g. speaker_codes = {"S1": "SPEAKER_00"},
+    which decode_compact_speakers uses to map model output back.
+    """
+    speaker_codes = {}
+    codes = {}
+    lines = [] # [start, end, code, texts, id]
+    for idx, seg in enumerate(segments):
+        text = (seg.get("text") or "").strip()
+        if not text:
+            continue
+        code = None
+        speaker = seg.get("speaker")
+        if speaker:
+            if speaker not in codes:
+                codes[speaker] = f"S{len(codes) + 1}"
+                speaker_codes[codes[speaker]] = speaker
+            code = codes[speaker]
+        start, end = math.floor(seg["start"]), math.ceil(seg["end"])
+        if not with_ids and lines and lines[-1][2] == code and end - lines[-1][0] <= merge_max_seconds:
+            lines[-1][1] = max(lines[-1][1], end)
+            lines[-1][3].append(text)
+        else:
+            lines.append([start, end, code, [text], idx])
+
+    encoded = []
+    for start, end, code, texts, idx in lines:
+        id_str = f"{idx} " if with_ids else ""
+        speaker_str = f" {code}" if code else ""
+        encoded.append(f"{id_str}{start}-{end}{speaker_str}: {' '.join(texts)}")
+    return "\n".join(encoded), speaker_codes
+
+def decode_compact_speakers(text, speaker_codes):
+    """
+    Maps short speaker codes in model output back to the original speaker codes.
+    Times need no mapping: compact timestamps are seconds of the recording.
+    """
+    return apply_speaker_aliases(text, speaker_codes)
+
+def compact_prompt_usage(segments, compact_text):
+    """
+    Verbose vs. compact prompt size for one task, stored in Task.llm_usage.
+    """
+    verbose_text = format_segments(segments)
+    verbose_tokens = estimate_tokens(verbose_text)
+    compact_tokens = estimate_tokens(compact_text)
+    return {
+        "verbose_chars": len(verbose_text),
+        "compact_chars": len(compact_text),
+        "verbose_tokens_est": verbose_tokens,
+        "compact_tokens_est": compact_tokens,
+        "saved_ratio": round(1 - compact_tokens / verbose_tokens, 3) if verbose_tokens else 0.0,
+    }
+
+async def generate_summary(prompt, api_key, usage=None, on_text=None):
+    """
+    Runs one summary prompt and raises on API errors.
+    If `usage` is a dict, the prompt/response token counts reported by Gemini are added to it.
+    With `on_text`, the response is streamed and on_text(text_so_far) is called per chunk.
+    """
+    client = get_gemini_client(api_key)
+    if on_text:
+        response = await client.generate_content(prompt, estimate_tokens(prompt), stream=True)
+        text = ""
+        async for chunk in response:
+            text += chunk.text
+            on_text(text)
+    else:
+        response = await client.generate_content(prompt, estimate_tokens(prompt))
+        text = response.text
+    metadata = getattr(response, "usage_metadata", None)
+    if usage is not None and metadata is not None:
+        add_token_usage(usage, {"prompt_tokens": metadata.prompt_token_count, "response_tokens": metadata.candidates_token_count})
+    return text
+
+def add_token_usage(usage, other):
+    for key in ["prompt_tokens", "response_tokens"]:
+        if other.get(key) is not None:
+            usage[key] = usage.get(key, 0) + other[key]
+
+async def summarize_text(transcription_text, api_key, format_note="", usage=None, on_text=None):
+    """
+    `format_note` describes a non-default transcript format to the model.
+    """
     if not api_key:
         return "Error: No Google API Key provided."
     
     try:
-        genai.configure(api_key=api_key)
-        model_llm = genai.GenerativeModel('models/gemini-2.5-flash')
-        
         prompt = (
             f"請根據以下音頻逐字稿，提取主要關鍵點或重要段落，並為每個關鍵點提供大致的起始時間和結束時間。"
-            f"時間格式為 `[起始時間s -> 結束時間s]`，摘要內容。\n\n"
+            f"時間格式為 `[起始時間s -> 結束時間s]`，摘要內容。{format_note}\n\n"
             f"逐字稿內容：\n{transcription_text}\n\n"
             f"請以以下格式輸出：\n"
             f"[起始時間s -> 結束時間s] 摘要內容\n"
             f"[起始時間s -> 結束時間s] 摘要內容\n..."
         )
-        
-        response = model_llm.generate_content(prompt)
-        return response.text
+        return await generate_summary(prompt, api_key, usage, on_text)
     except Exception as e:
         return f"Error generating summary: {str(e)}"
 
-def correct_transcription(transcription_text, api_key):
+# --- Hierarchical Summarization ---
+# "single": one call over the whole transcript
+# "hierarchical": summarize fixed time chunks concurrently, then merge the chunk summaries
+# "auto": hierarchical for recordings of at least SUMMARY_AUTO_MIN_SECONDS
+SUMMARY_MODES = ["auto", "single", "hierarchical"]
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "auto")
+SUMMARY_CHUNK_SECONDS = int(os.getenv("SUMMARY_CHUNK_SECONDS", "600"))
+SUMMARY_AUTO_MIN_SECONDS = float(os.getenv("SUMMARY_AUTO_MIN_SECONDS", "1800"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
+def resolve_summary_mode(segments, mode=SUMMARY_MODE):
+    if mode != "auto":
+        return mode
+    duration = max((seg["end"] for seg in segments), default=0)
+    return "hierarchical" if duration >= SUMMARY_AUTO_MIN_SECONDS else "single"
+
+def split_time_chunks(segments, chunk_seconds=SUMMARY_CHUNK_SECONDS):
+    """
+    Groups segments into fixed time bins by start time. Bins are fixed rather
+    than balanced so that an edit only changes the bin it falls in.
+    Returns a list of (start, end, segments).
+    """
+    bins = {}
+    for seg in segments:
+        bins.setdefault(int(seg["start"] // chunk_seconds), []).append(seg)
+    return [(index * chunk_seconds, (index + 1) * chunk_seconds, bins[index]) for index in sorted(bins)]
+
+def chunk_hash(segments):
+    content = json.dumps(
+        [[round(seg["start"], 2), round(seg["end"], 2), seg.get("speaker"), seg.get("text")] for seg in segments],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+async def summarize_chunk(segments, start, end, api_key):
+    """
+    Map step: key points of one time chunk. Returns (summary, usage) with
+    original speaker codes, so cached chunk summaries do not depend on the
+    short codes of other chunks. Raises on API errors.
+    """
+    compact_text, speaker_codes = encode_segments_compact(segments)
+    usage = {}
+    prompt = (
+        f"以下是一段長錄音中 {start}s 至 {end}s 的逐字稿。{COMPACT_FORMAT_NOTE}"
+        f"請提取這個時段的主要關鍵點，並為每個關鍵點提供起始時間和結束時間。\n\n"
+        f"逐字稿內容：\n{compact_text}\n\n"
+        f"請以以下格式輸出，不要輸出其他說明：\n"
+        f"[起始時間s -> 結束時間s] 摘要內容\n"
+        f"[起始時間s -> 結束時間s] 摘要內容\n..."
+    )
+    summary = await generate_summary(prompt, api_key, usage)
+    return decode_compact_speakers(summary.strip(), speaker_codes), usage
+
+async def reduce_chunk_summaries(chunks, speakers, api_key, usage, on_text=None):
+    """
+    Reduce step: merges the chunk key points into the final key-point list.
+    `chunks` is a list of (start, end, summary).
+    """
+    speaker_codes = {f"S{i + 1}": speaker for i, speaker in enumerate(speakers)}
+    to_codes = {speaker: code for code, speaker in speaker_codes.items()}
+    chunk_text = "\n\n".join(
+        f"# {start}s - {end}s\n{apply_speaker_aliases(summary, to_codes)}"
+        for start, end, summary in chunks
+    )
+    prompt = (
+        f"以下是一段長錄音依時段整理的重點摘要，每行格式為 `[起始時間s -> 結束時間s] 摘要內容`，說話者代號如 S1、S2。"
+        f"請整合為整份錄音的主要關鍵點，合併重複或相關的內容，並保留每個關鍵點大致的起始時間和結束時間。\n\n"
+        f"各時段摘要：\n{chunk_text}\n\n"
+        f"請以以下格式輸出：\n"
+        f"[起始時間s -> 結束時間s] 摘要內容\n"
+        f"[起始時間s -> 結束時間s] 摘要內容\n..."
+    )
+    decode_text = (lambda text: on_text(decode_compact_speakers(text, speaker_codes))) if on_text else None
+    return decode_compact_speakers(await generate_summary(prompt, api_key, usage, decode_text), speaker_codes)
+
+async def summarize_hierarchical(segments, api_key, chunk_cache=None, chunk_seconds=SUMMARY_CHUNK_SECONDS, on_text=None):
+    """
+    Map-reduce summary for long recordings. Time chunks are summarized
+    concurrently and then merged. `chunk_cache` is the task's previous
+    summary_chunks; chunks whose content hash is unchanged reuse their cached
+    summary, so re-summarizing after an edit only redoes the edited chunks.
+    Returns (summary, usage, chunk_cache).
+    """
+    cached = {}
+    if chunk_cache and chunk_cache.get("chunk_seconds") == chunk_seconds:
+        cached = {chunk["hash"]: chunk["summary"] for chunk in chunk_cache.get("chunks", [])}
+
+    chunks = [(start, end, chunk_hash(chunk_segments), chunk_segments) for start, end, chunk_segments in split_time_chunks(segments, chunk_seconds)]
+    pending = [chunk for chunk in chunks if chunk[2] not in cached]
+    usage = {"mode": "hierarchical", "chunks": len(chunks), "cached_chunks": len(chunks) - len(pending)}
+    logger.info(f"Hierarchical summary: {len(pending)}/{len(chunks)} chunks to summarize.")
+
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize_pending(chunk):
+        async with semaphore:
+            return await summarize_chunk(chunk[3], chunk[0], chunk[1], api_key)
+
+    errors = []
+    results = await asyncio.gather(*[summarize_pending(chunk) for chunk in pending], return_exceptions=True)
+    for (_, _, hash_, _), result in zip(pending, results):
+        if isinstance(result, Exception):
+            errors.append(str(result))
+            continue
+        summary, chunk_usage = result
+        cached[hash_] = summary
+        add_token_usage(usage, chunk_usage)
+
+    # Keep only current chunks; failed ones are retried on the next run
+    chunk_cache = {
+        "chunk_seconds": chunk_seconds,
+        "chunks": [{"start": start, "end": end, "hash": hash_, "summary": cached[hash_]} for start, end, hash_, _ in chunks if hash_ in cached]
+    }
+    if errors:
+        return f"Error generating summary: {errors[0]}", usage, chunk_cache
+
+    chunk_summaries = [(start, end, cached[hash_]) for start, end, hash_, _ in chunks]
+    if len(chunk_summaries) == 1:
+        return chunk_summaries[0][2], usage, chunk_cache
+
+    speakers = list(dict.fromkeys(seg["speaker"] for seg in segments if seg.get("speaker")))
+    try:
+        summary = await reduce_chunk_summaries(chunk_summaries, speakers, api_key, usage, on_text)
+    except Exception as e:
+        return f"Error generating summary: {str(e)}", usage, chunk_cache
+    return summary, usage, chunk_cache
+
+async def summarize_segments(segments, api_key, mode=SUMMARY_MODE, chunk_cache=None, on_text=None):
+    """
+    Summarizes segments from their compact encoding, in one call or
+    hierarchically (see SUMMARY_MODES). Returns (summary, usage, chunk_cache);
+    speaker codes in the summary are mapped back to the original ones.
+    `on_text` receives the partial summary while the final call streams.
+    """
     if not api_key:
-        return "Error: No Google API Key provided."
-    
+        return "Error: No Google API Key provided.", {}, chunk_cache
+
+    compact_text, speaker_codes = encode_segments_compact(segments)
+    usage = compact_prompt_usage(segments, compact_text)
+    logger.debug(f"Summary prompt ~{usage['compact_tokens_est']} tokens (verbose ~{usage['verbose_tokens_est']}).")
+
+    if resolve_summary_mode(segments, mode) == "hierarchical":
+        summary, hierarchical_usage, chunk_cache = await summarize_hierarchical(segments, api_key, chunk_cache, on_text=on_text)
+        usage.update(hierarchical_usage)
+        return summary, usage, chunk_cache
+
+    usage["mode"] = "single"
+    decode_text = (lambda text: on_text(decode_compact_speakers(text, speaker_codes))) if on_text else None
+    summary = await summarize_text(compact_text, api_key, COMPACT_FORMAT_NOTE, usage, decode_text)
+    return decode_compact_speakers(summary, speaker_codes), usage, chunk_cache
+
+async def correct_segment_texts(items, api_key, on_corrections=None):
+    """
+    Index-aligned correction. `items` is a list of {"id", "text"}; timestamps and
+    speakers are never sent, so they cannot drift. Returns {id: corrected_text}
+    for the ids the model returned; ids it skipped simply keep their text.
+
+    With `on_corrections`, the response is streamed and on_corrections({id: text})
+    is called for the items completed by each chunk.
+    """
+    if not api_key:
+        raise ValueError("No Google API Key provided.")
+
+    client = get_gemini_client(api_key)
+
+    prompt = (
+        f"請修正以下逐字稿段落中的錯別字，並將所有簡體中文字轉換為繁體中文字。"
+        f"輸入為 JSON 陣列，每個元素包含段落編號 `id` 與文字 `text`。"
+        f"請輸出相同格式的 JSON 陣列 `[{{\"id\": 編號, \"text\": \"修正後文字\"}}]`，"
+        f"保留每個 id，不要合併、拆分或新增段落，也不要輸出任何額外說明。\n\n"
+        f"段落：\n{json.dumps(items, ensure_ascii=False, separators=(',', ':'))}\n"
+    )
+
+    if on_corrections:
+        response = await client.generate_content(
+            prompt,
+            estimate_tokens(prompt),
+            generation_config={"response_mime_type": "application/json"},
+            stream=True
+        )
+        parser = CorrectionStreamParser()
+        corrections = {}
+        async for chunk in response:
+            new_corrections = parser.feed(chunk.text)
+            if new_corrections:
+                corrections.update(new_corrections)
+                on_corrections(new_corrections)
+        logger.info(f"LLM correction streamed {len(corrections)} items.")
+        return corrections
+
+    response = await client.generate_content(
+        prompt,
+        estimate_tokens(prompt),
+        generation_config={"response_mime_type": "application/json"}
+    )
+    logger.debug(f"LLM correction response: {response.text[:200]}...") # Log first 200 chars
+    return parse_corrected_items(response.text)
+
+def correction_item(item):
+    """
+    Returns (id, text) for a well-formed correction item, otherwise None.
+    """
+    if isinstance(item, dict) and isinstance(item.get("text"), str):
+        try:
+            return int(item["id"]), item["text"].strip()
+        except (KeyError, TypeError, ValueError):
+            return None
+    return None
+
+class CorrectionStreamParser:
+    """
+    Incrementally parses a streamed JSON array of {"id", "text"} objects,
+    returning each object as soon as it is complete.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.started = False
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, text):
+        self.buffer += text
+        corrections = {}
+        if not self.started:
+            start = self.buffer.find("[")
+            if start < 0:
+                return corrections
+            self.buffer = self.buffer[start + 1:]
+            self.started = True
+        while True:
+            self.buffer = self.buffer.lstrip(" \t\r\n,")
+            if not self.buffer or self.buffer[0] == "]":
+                return corrections
+            try:
+                item, end = self.decoder.raw_decode(self.buffer)
+            except json.JSONDecodeError:
+                return corrections # Incomplete object; wait for more text
+            self.buffer = self.buffer[end:]
+            parsed = correction_item(item)
+            if parsed:
+                corrections[parsed[0]] = parsed[1]
+
+def parse_corrected_items(response_text):
+    """
+    Parses the JSON correction output into {id: text}, ignoring malformed items.
+    """
+    text = response_text.strip()
+    # Remove markdown code blocks if present
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("segments", [])
+    return collect_corrections(data)
+
+def collect_corrections(items):
+    corrections = {}
+    for item in items:
+        parsed = correction_item(item)
+        if parsed:
+            corrections[parsed[0]] = parsed[1]
+    return corrections
+
+# --- Selective Correction ---
+# "selective": convert scripts locally and only send low-confidence segments to Gemini
+# "full": send every segment to Gemini
+CORRECTION_MODES = ["selective", "full"]
+CORRECTION_MODE = os.getenv("CORRECTION_MODE", "selective")
+# Whisper confidence below which a segment is worth an LLM correction
+CORRECTION_MIN_AVG_LOGPROB = float(os.getenv("CORRECTION_MIN_AVG_LOGPROB", "-0.5"))
+CORRECTION_MAX_COMPRESSION_RATIO = float(os.getenv("CORRECTION_MAX_COMPRESSION_RATIO", "2.0"))
+# Streamed corrections are reported to the caller (and persisted) in batches of this many segments
+CORRECTION_PROGRESS_BATCH = int(os.getenv("CORRECTION_PROGRESS_BATCH", "10"))
+# OpenCC conversion config: Simplified -> Traditional (Taiwan, with phrases)
+OPENCC_CONFIG = os.getenv("OPENCC_CONFIG", "s2twp")
+
+opencc_converter = None
+
+def get_opencc_converter():
+    """
+    Returns a cached OpenCC converter, or None if OpenCC is not installed.
+    """
+    global opencc_converter
+    if opencc_converter is None:
+        try:
+            from opencc import OpenCC
+        except ImportError:
+            return None
+        try:
+            opencc_converter = OpenCC(OPENCC_CONFIG)
+        except Exception:
+            # The native package expects the config file name
+            opencc_converter = OpenCC(f"{OPENCC_CONFIG}.json")
+    return opencc_converter
+
+def needs_llm_correction(segment):
+    avg_logprob = segment.get("avg_logprob")
+    compression_ratio = segment.get("compression_ratio")
+    if avg_logprob is None or compression_ratio is None:
+        # No confidence information (e.g. live sessions): let the LLM check it
+        return True
+    return avg_logprob < CORRECTION_MIN_AVG_LOGPROB or compression_ratio > CORRECTION_MAX_COMPRESSION_RATIO
+
+def prepare_correction(segments, mode=CORRECTION_MODE):
+    """
+    Converts every segment to Traditional Chinese in-process and picks the
+    segments to send to Gemini: in "selective" mode only those with low
+    Whisper confidence. Returns (corrected_segments, selected_ids, stats).
+    """
+    converter = get_opencc_converter()
+    if converter:
+        corrected = [{**seg, "text": converter.convert(seg["text"])} for seg in segments]
+    else:
+        logger.warning("OpenCC not installed; the LLM does the script conversion.")
+        corrected = [dict(seg) for seg in segments]
+
+    if mode == "selective" and converter:
+        selected = [i for i, seg in enumerate(segments) if needs_llm_correction(seg)]
+    else:
+        selected = list(range(len(segments)))
+
+    stats = {"total_segments": len(segments), "llm_segments": len(selected), "corrected_segments": 0}
+    logger.info(f"Correction ({mode}): {len(selected)}/{len(segments)} segments sent to the LLM.")
+    return corrected, selected, stats
+
+class CorrectionProgress:
+    """
+    Applies LLM corrections to the selected segments by id and calls
+    on_progress(corrected_segments, done, total) every CORRECTION_PROGRESS_BATCH
+    corrected segments and from finish().
+    """
+    def __init__(self, corrected, selected, stats, on_progress=None):
+        self.corrected = corrected
+        self.selected = set(selected)
+        self.stats = stats
+        self.on_progress = on_progress
+        self.done = set()
+        self.reported = 0
+
+    def apply(self, corrections):
+        for idx, text in corrections.items():
+            if idx in self.selected and idx not in self.done:
+                self.done.add(idx)
+                if text:
+                    self.corrected[idx]["text"] = text
+                    self.stats["corrected_segments"] += 1
+        if self.on_progress and len(self.done) - self.reported >= CORRECTION_PROGRESS_BATCH:
+            self.reported = len(self.done)
+            self.on_progress(self.corrected, len(self.done), len(self.selected))
+
+    def finish(self):
+        if self.on_progress:
+            self.on_progress(self.corrected, len(self.selected), len(self.selected))
+
+async def correct_segments(segments, api_key, mode=CORRECTION_MODE, on_progress=None):
+    """
+    Corrects segments in place of their original indices (see prepare_correction).
+    LLM results are mapped back by segment id, so timestamps and speakers always
+    come from the original segments. Returns (corrected_segments, stats).
+
+    With `on_progress`, the LLM response is streamed and progress is reported
+    as described in CorrectionProgress.
+    """
+    corrected, selected, stats = prepare_correction(segments, mode)
+    if not selected:
+        return corrected, stats
+
+    progress = CorrectionProgress(corrected, selected, stats, on_progress)
     try:
-        genai.configure(api_key=api_key)
-        model_llm = genai.GenerativeModel('models/gemini-2.5-flash')
-        
-        prompt = (
-            f"請檢查以下音頻逐字稿，並修正其中的錯別字。特別是，請將所有簡體中文字轉換為繁體中文字。"
-            f"**重要：請務必保留每一行的時間戳記 `[start -> end]` 和說話者標籤 `[SPEAKER_xx]`，不要修改它們，只需修改文字部分。**"
-            f"輸出時，只返回修正後的文本，不需要任何額外的說明或格式。\n\n"
-            f"逐字稿內容：\n{transcription_text}\n"
+        corrections = await correct_segment_texts(
+            [{"id": i, "text": corrected[i]["text"]} for i in selected],
+            api_key,
+            progress.apply if on_progress else None
         )
-        
-        response = model_llm.generate_content(prompt)
-        print(f"DEBUG: LLM Correction Response: {response.text[:200]}...") # Log first 200 chars
-        return response.text
+        progress.apply(corrections)
+    except Exception as e:
+        # Keep the locally converted text (and anything already streamed)
+        # rather than discarding the whole correction
+        logger.exception("Error in correct_segments")
+        stats["error"] = str(e)
+    progress.finish()
+    return corrected, stats
+
+# --- Combined Correction + Summary ---
+# "separate": correction and summary are two calls (default, best quality)
+# "combined": one structured-output call returns both, so the transcript is sent once
+PIPELINE_MODES = ["separate", "combined"]
+PIPELINE_MODE = os.getenv("LLM_PIPELINE_MODE", "separate")
+INDEXED_FORMAT_NOTE = "逐字稿每行格式為 `編號 起始秒-結束秒 說話者代號: 內容`，說話者代號如 S1、S2。"
+
+def format_key_points(key_points):
+    """
+    Renders structured key points as the usual `[start -> end] text` summary lines.
+    """
+    lines = []
+    for point in key_points or []:
+        if not isinstance(point, dict) or not isinstance(point.get("text"), str):
+            continue
+        try:
+            start, end = float(point["start"]), float(point["end"])
+        except (KeyError, TypeError, ValueError):
+            lines.append(point["text"].strip())
+            continue
+        lines.append(f"[{start:g}s -> {end:g}s] {point['text'].strip()}")
+    return "\n".join(lines)
+
+async def correct_and_summarize(segments, api_key, mode=CORRECTION_MODE, on_progress=None):
+    """
+    Correction and summary in one Gemini call. The transcript is sent once in
+    the indexed compact encoding, and the response is a JSON object with the
+    corrected segments (streamed and applied like correct_segments) followed by
+    the key points. Returns (corrected_segments, correction_stats, summary, summary_usage).
+    """
+    corrected, selected, stats = prepare_correction(segments, mode)
+    progress = CorrectionProgress(corrected, selected, stats, on_progress)
+
+    transcript, speaker_codes = encode_segments_compact(corrected, with_ids=True)
+    usage = compact_prompt_usage(segments, transcript)
+    usage["mode"] = "combined"
+    if len(selected) == len(segments):
+        targets = "請修正所有段落。"
+    elif selected:
+        targets = f"只需修正以下編號的段落：{json.dumps(selected)}。"
+    else:
+        targets = "不需要修正任何段落，`segments` 請輸出空陣列。"
+
+    prompt = (
+        f"以下是一份音頻逐字稿。{INDEXED_FORMAT_NOTE}\n"
+        f"請完成兩件事：\n"
+        f"1. 修正段落中的錯別字，並將所有簡體中文字轉換為繁體中文字。{targets}"
+        f"保留每個編號，不要合併、拆分或新增段落。\n"
+        f"2. 提取主要關鍵點或重要段落，並為每個關鍵點提供大致的起始時間和結束時間 (秒)。\n\n"
+        f"逐字稿內容：\n{transcript}\n\n"
+        f"請輸出 JSON 物件，先輸出 `segments` 再輸出 `key_points`，不要輸出任何額外說明：\n"
+        f"{{\"segments\": [{{\"id\": 編號, \"text\": \"修正後文字\"}}], "
+        f"\"key_points\": [{{\"start\": 起始秒, \"end\": 結束秒, \"text\": \"摘要內容\"}}]}}\n"
+    )
+
+    try:
+        if not api_key:
+            raise ValueError("No Google API Key provided.")
+        client = get_gemini_client(api_key)
+        response = await client.generate_content(
+            prompt,
+            estimate_tokens(prompt),
+            generation_config={"response_mime_type": "application/json"},
+            stream=True
+        )
+        # The segments array comes first, so corrections can be applied while the key points stream
+        parser = CorrectionStreamParser()
+        text = ""
+        async for chunk in response:
+            text += chunk.text
+            progress.apply(parser.feed(chunk.text))
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is not None:
+            add_token_usage(usage, {"prompt_tokens": metadata.prompt_token_count, "response_tokens": metadata.candidates_token_count})
+
+        data = json.loads(re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip()))
+        progress.apply(collect_corrections(data.get("segments", [])))
+        summary = decode_compact_speakers(format_key_points(data.get("key_points")), speaker_codes)
     except Exception as e:
-        print(f"DEBUG: Error in correct_transcription: {str(e)}")
-        return f"Error correcting transcription: {str(e)}"
+        logger.exception("Error in correct_and_summarize")
+        stats["error"] = str(e)
+        summary = f"Error generating summary: {str(e)}"
+    progress.finish()
+    return corrected, stats, summary, usage
 
 def parse_corrected_segments(corrected_text):
     """
@@ -86,7 +749,6 @@ def parse_corrected_segments(corrected_text):
     corrected_text = corrected_text.replace("```python", "").replace("```", "").strip()
     
     lines = corrected_text.strip().split('\n')
-    import re
     
     # Regex to extract start, end, speaker (optional), and text
     # Matches: [0.00s -> 5.00s] [SPEAKER_00] Some text
@@ -97,7 +759,7 @@ def parse_corrected_segments(corrected_text):
     # Flexible with spaces and 's' unit
     pattern = re.compile(r'\[\s*(\d+\.?\d*)\s*s?\s*->\s*(\d+\.?\d*)\s*s?\s*\]\s*(?:\[(.*?)\])?\s*(.*)')
     
-    print(f"DEBUG: Parsing {len(lines)} lines of corrected text.")
+    logger.debug(f"Parsing {len(lines)} lines of corrected text.")
     
     for line in lines:
         line = line.strip()
@@ -120,69 +782,83 @@ def parse_corrected_segments(corrected_text):
                 
             segments.append(segment)
         else:
-            print(f"DEBUG: Failed to match line: {line}")
+            logger.debug(f"Failed to match line: {line}")
             
-    print(f"DEBUG: Parsed {len(segments)} segments.")
+    logger.debug(f"Parsed {len(segments)} segments.")
     return segments
 
-def diarize_audio(audio_path, hf_token, num_speakers=None):
-    try:
+# Loaded diarization pipelines, keyed by HF token, least recently used first.
+# Each is a full model, so tokens beyond DIARIZATION_CACHE_SIZE evict the oldest.
+DIARIZATION_CACHE_SIZE = max(1, int(os.getenv("DIARIZATION_CACHE_SIZE", "1")))
+diarization_pipelines = OrderedDict()
+# A pyannote pipeline is not safe to call from several threads at once (batch
+# tasks diarize concurrently), so loading and inference hold this lock
+diarization_lock = threading.Lock()
+
+def load_diarization_pipeline(hf_token):
+    """
+    Returns the cached pipeline for the token, loading it if needed. Call with diarization_lock held.
+    """
+    record_model_cache("diarization", hf_token in diarization_pipelines)
+    if hf_token not in diarization_pipelines:
         from pyannote.audio import Pipeline
         import torch
-        
-        print(f"Diarizing {audio_path} with num_speakers={num_speakers}...")
+
         pipeline = Pipeline.from_pretrained(
             "pyannote/speaker-diarization-3.1",
             use_auth_token=hf_token
         )
-        
         if pipeline is None:
-            print("Error: Could not load diarization pipeline. Check HF token.")
-            return []
+            return None
 
         # Use GPU if available
         if torch.cuda.is_available():
             pipeline.to(torch.device("cuda"))
-            
-        if num_speakers:
-            diarization = pipeline(audio_path, num_speakers=num_speakers)
-        else:
-            diarization = pipeline(audio_path)
-        
-        # Convert to list of dicts
-        diarization_result = []
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            diarization_result.append({
-                "start": turn.start,
-                "end": turn.end,
-                "speaker": speaker
-            })
-            
-        with open("debug_diarization.txt", "a", encoding="utf-8") as f:
-            f.write(f"Audio: {audio_path}\n")
-            f.write(f"Segments found: {len(diarization_result)}\n")
-            if len(diarization_result) > 0:
-                f.write(f"First segment: {diarization_result[0]}\n")
+        while len(diarization_pipelines) >= DIARIZATION_CACHE_SIZE:
+            diarization_pipelines.popitem(last=False)
+        diarization_pipelines[hf_token] = pipeline
+    diarization_pipelines.move_to_end(hf_token)
+    return diarization_pipelines[hf_token]
+
+def diarize_audio(audio_path, hf_token, num_speakers=None, streaming_decode=None):
+    try:
+        logger.info(f"Diarizing {audio_path} with num_speakers={num_speakers}...")
+        with diarization_lock:
+            pipeline = load_diarization_pipeline(hf_token)
+
+            if pipeline is None:
+                logger.error("Could not load diarization pipeline. Check HF token.")
+                return []
+
+            if use_streaming_decode(audio_path, streaming_decode):
+                # Long recording: diarize window by window and link speakers across windows
+                diarization_result = diarize_streaming(pipeline, audio_path, num_speakers)
             else:
-                f.write("No segments found.\n")
+                if num_speakers:
+                    diarization = pipeline(audio_path, num_speakers=num_speakers)
+                else:
+                    diarization = pipeline(audio_path)
 
-        print(f"DEBUG: Diarization found {len(diarization_result)} segments.")
+                # Convert to list of dicts
+                diarization_result = []
+                for turn, _, speaker in diarization.itertracks(yield_label=True):
+                    diarization_result.append({
+                        "start": turn.start,
+                        "end": turn.end,
+                        "speaker": speaker
+                    })
+
+        logger.info(f"Diarization found {len(diarization_result)} segments.")
         if len(diarization_result) > 0:
-            print(f"DEBUG: First segment: {diarization_result[0]}")
-            
+            logger.debug(f"First segment: {diarization_result[0]}")
+
         return diarization_result
-    except Exception as e:
-        error_msg = f"Error in diarization: {str(e)}"
-        print(error_msg)
-        with open("debug_diarization.txt", "a", encoding="utf-8") as f:
-            f.write(f"Audio: {audio_path}\n")
-            f.write(f"ERROR: {error_msg}\n")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception(f"Error in diarization of {audio_path}")
         return []
 
 def merge_diarization_with_transcript(transcript_segments, diarization_segments):
-    print(f"DEBUG: Merging {len(transcript_segments)} transcript segments with {len(diarization_segments)} diarization segments.")
+    logger.debug(f"Merging {len(transcript_segments)} transcript segments with {len(diarization_segments)} diarization segments.")
     
     # Simple merging strategy: assign speaker with max overlap
     for segment in transcript_segments:
@@ -0,0 +1,169 @@
+import os
+import logging
+import subprocess
+import numpy as np
+
+from vad import detect_speech_regions, build_speech_audio, remap_segments
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# Streaming decode reads ffmpeg output in windows of this length instead of
+# decoding the whole file into memory (~230 MB per hour of audio as float32).
+STREAMING_DECODE_WINDOW_SECONDS = float(os.getenv("STREAMING_DECODE_WINDOW_SECONDS", "600"))
+# Recordings at least this long use streaming decode automatically (0 = always, unless a task opts out)
+STREAMING_DECODE_MIN_SECONDS = float(os.getenv("STREAMING_DECODE_MIN_SECONDS", "1800"))
+# Audio after the last complete segment of a window is decoded again with the next window
+CARRY_MARGIN_SECONDS = 5.0
+MAX_CARRY_SECONDS = 30.0
+# Cosine similarity above which a window-local speaker is the same as a known one
+SPEAKER_MATCH_THRESHOLD = float(os.getenv("STREAMING_SPEAKER_MATCH_THRESHOLD", "0.5"))
+
+def probe_duration(audio_path):
+    """
+    Returns the duration in seconds from ffprobe, or None if it cannot be read.
+    """
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", audio_path],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return float(output)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+def use_streaming_decode(audio_path, streaming_decode=None):
+    if streaming_decode is not None:
+        return streaming_decode
+    duration = probe_duration(audio_path)
+    return duration is not None and duration >= STREAMING_DECODE_MIN_SECONDS
+
+def iter_audio_windows(audio_path, window_seconds=STREAMING_DECODE_WINDOW_SECONDS):
+    """
+    Yields the recording as consecutive 16 kHz float32 arrays of `window_seconds`,
+    reading ffmpeg's output through a pipe so only one window is in memory.
+    """
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", audio_path,
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+        stdout=subprocess.PIPE
+    )
+    window_bytes = int(window_seconds * SAMPLE_RATE) * 2
+    try:
+        while True:
+            data = process.stdout.read(window_bytes)
+            if not data:
+                break
+            data = data[:len(data) - len(data) % 2]
+            yield np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+def transcribe_streaming(audio_path, transcription_engine, model_size=None, vad=False, window_seconds=STREAMING_DECODE_WINDOW_SECONDS, **decoding_options):
+    """
+    Transcribes window by window with bounded memory.
+
+    Segments that end close to a window boundary may be cut mid-word, so the
+    audio after the last segment ending `CARRY_MARGIN_SECONDS` before the
+    boundary is carried over and decoded again with the next window.
+    """
+    segments = []
+    carry = np.zeros(0, dtype=np.float32)
+    carry_offset = 0.0 # Absolute time of carry[0]
+
+    windows = iter_audio_windows(audio_path, window_seconds)
+    window = next(windows, None)
+    while window is not None:
+        next_window = next(windows, None)
+        is_last = next_window is None
+
+        buffer = np.concatenate([carry, window])
+        buffer_offset = carry_offset
+        buffer_seconds = len(buffer) / SAMPLE_RATE
+
+        timeline = None
+        audio = buffer
+        if vad:
+            audio, timeline = build_speech_audio(buffer, detect_speech_regions(buffer))
+        window_segments = []
+        if len(audio):
+            result = transcription_engine.transcribe(audio, model_size=model_size, **decoding_options)
+            window_segments = result["segments"]
+            if timeline:
+                window_segments = remap_segments(window_segments, timeline)
+
+        if is_last:
+            keep = window_segments
+            cut_seconds = buffer_seconds
+        else:
+            keep = [s for s in window_segments if s["end"] <= buffer_seconds - CARRY_MARGIN_SECONDS]
+            cut_seconds = keep[-1]["end"] if keep else 0.0
+            # Never carry more than MAX_CARRY_SECONDS (e.g. long stretches of silence)
+            cut_seconds = max(cut_seconds, buffer_seconds - MAX_CARRY_SECONDS)
+
+        for segment in keep:
+            segment["start"] = round(buffer_offset + segment["start"], 3)
+            segment["end"] = round(buffer_offset + segment["end"], 3)
+            segment["id"] = len(segments)
+            segments.append(segment)
+
+        cut = int(cut_seconds * SAMPLE_RATE)
+        carry = buffer[cut:]
+        carry_offset = buffer_offset + cut / SAMPLE_RATE
+        logger.info(f"Streaming decode: {carry_offset:.0f}s processed, {len(segments)} segments.")
+        window = next_window
+
+    return {"text": "".join(s["text"] for s in segments), "segments": segments}
+
+def diarize_streaming(pipeline, audio_path, num_speakers=None, window_seconds=STREAMING_DECODE_WINDOW_SECONDS):
+    """
+    Diarizes window by window with bounded memory.
+
+    Each window is diarized on its own; window-local speakers are linked to
+    recording-wide speakers by the cosine similarity of their embeddings,
+    and a new speaker is created when nothing matches (up to `num_speakers`).
+    """
+    import torch
+
+    centroids = [] # Running mean embedding per global speaker
+    counts = []
+    turns = []
+    offset = 0.0
+
+    for window in iter_audio_windows(audio_path, window_seconds):
+        waveform = torch.from_numpy(window).unsqueeze(0)
+        kwargs = {"max_speakers": num_speakers} if num_speakers else {}
+        diarization, embeddings = pipeline({"waveform": waveform, "sample_rate": SAMPLE_RATE}, return_embeddings=True, **kwargs)
+
+        mapping = {}
+        for local_label, embedding in zip(diarization.labels(), embeddings):
+            if np.any(np.isnan(embedding)):
+                continue
+            embedding = embedding / (np.linalg.norm(embedding) + 1e-10)
+            similarities = [float(np.dot(embedding, c / (np.linalg.norm(c) + 1e-10))) for c in centroids]
+            best = int(np.argmax(similarities)) if similarities else None
+            at_limit = num_speakers is not None and len(centroids) >= num_speakers
+            if best is not None and (similarities[best] >= SPEAKER_MATCH_THRESHOLD or at_limit):
+                counts[best] += 1
+                centroids[best] = centroids[best] + (embedding - centroids[best]) / counts[best]
+                mapping[local_label] = best
+            else:
+                centroids.append(embedding)
+                counts.append(1)
+                mapping[local_label] = len(centroids) - 1
+
+        for turn, _, local_label in diarization.itertracks(yield_label=True):
+            if local_label not in mapping:
+                continue
+            turns.append({
+                "start": offset + turn.start,
+                "end": offset + turn.end,
+                "speaker": f"SPEAKER_{mapping[local_label]:02d}"
+            })
+        offset += len(window) / SAMPLE_RATE
+
+    return turns
@@ -1,37 +1,80 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Depends, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Depends, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, FileResponse, JSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 import shutil
 import os
 import uuid
+import json
+import time
+import asyncio
+import logging
 from typing import List
-from database import init_db, get_db, Task, SessionLocal
-from logic import transcribe_audio, format_segments, summarize_text, correct_transcription, parse_corrected_segments, diarize_audio, merge_diarization_with_transcript
+from contextlib import asynccontextmanager
+from database import init_db, get_db, Task, UserPreference, SessionLocal
+from logic import load_whisper_model, transcribe_audio, format_segments, summarize_segments, parse_corrected_segments, diarize_audio, merge_diarization_with_transcript, apply_speaker_aliases, update_subtitle_lines, correct_segments, correct_and_summarize, resolve_summary_mode, CORRECTION_MODE, CORRECTION_MODES, SUMMARY_MODE, SUMMARY_MODES, PIPELINE_MODE, PIPELINE_MODES
 from pydantic import BaseModel
-from supabase import create_client, Client
+from streaming import StreamingTranscriber, make_decoder
+from batching import TranscriptionBatcher
+from engines import WhisperEngine, resolve_decoding_options, validate_transcription_options, DEFAULT_ENGINE, DEFAULT_MODEL_SIZE
+from longform import probe_duration
+from metrics import stage_timer, observe_stage, observe_real_time_factor, instrument_db_commits, render_metrics, TRANSCRIPTION_QUEUE_DEPTH, BATCH_QUEUE_DEPTH, LLM_TASKS_IN_FLIGHT
+from llm_loop import submit_llm, run_llm
+from observability import setup_logging, task_context, stage_span, task_profiler
+from warmup import warm_up_models, readiness
+from auth import AuthUser, get_current_user, authenticate, require_admin, require_task_access
 from dotenv import load_dotenv
 
 load_dotenv()
+setup_logging()
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background: the server starts answering (and /ready
+    # reports not ready) while the models load
+    threading.Thread(target=warm_up_models, args=(transcription_lock,), name="model-warmup", daemon=True).start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files for audio playback
 os.makedirs("media", exist_ok=True)
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Initialize Database
 init_db()
 
-# Supabase Client
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# Supabase Client, created on first use: importing supabase alone takes a
+# noticeable part of startup, and only /register and /login need it
+supabase_client = None
+supabase_lock = threading.Lock()
+
+def get_supabase():
+    global supabase_client
+    with supabase_lock:
+        if supabase_client is None:
+            from supabase import create_client
+            supabase_client = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+        return supabase_client
 
 # Global lock for sequential processing of local transcription only
 transcription_lock = threading.Lock()
 
+# Batches short clips across concurrent tasks (enabled with WHISPER_BATCH_WINDOW_MS)
+transcription_batcher = TranscriptionBatcher(transcription_lock)
+
+instrument_db_commits(SessionLocal)
+BATCH_QUEUE_DEPTH.set_function(lambda: transcription_batcher.requests.qsize())
+
+# A streaming summary is written to the task at most this often (seconds)
+PROGRESS_COMMIT_SECONDS = float(os.getenv("PROGRESS_COMMIT_SECONDS", "1.0"))
+
 # --- Auth Endpoints ---
 class UserRegister(BaseModel):
     email: str
@@ -44,7 +87,7 @@ class UserLogin(BaseModel):
 @app.post("/register")
 def register(user: UserRegister):
     try:
-        response = supabase.auth.sign_up({
+        response = get_supabase().auth.sign_up({
             "email": user.email, 
             "password": user.password
         })
@@ -60,57 +103,103 @@ def register(user: UserRegister):
 @app.post("/login")
 def login(user: UserLogin):
     try:
-        response = supabase.auth.sign_in_with_password({
+        response = get_supabase().auth.sign_in_with_password({
             "email": user.email, 
             "password": user.password
         })
-        if response.user:
-            # Check if admin (Hardcoded for POC)
-            is_admin = (response.user.email == "admin@test.com")
-            
-            # Extract username
-            username = response.user.email.split("@")[0]
-            
-            return {
-                "id": response.user.id,
-                "email": response.user.email,
-                "username": username,
-                "is_admin": is_admin,
-                "access_token": response.session.access_token
-            }
-        else:
+        if not response.user or not response.session:
              raise HTTPException(status_code=400, detail="Login failed")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-def process_background_task(task_id: int, api_key: str, hf_token: str = None, num_speakers: int = None):
-    # No global lock here, allowing concurrency for API-bound steps
+    # The client sends the access token with every request; verifying it here
+    # too makes the login response agree with what the other endpoints see
+    auth_user = authenticate(response.session.access_token)
+
+    # Extract username
+    username = response.user.email.split("@")[0]
+
+    return {
+        "id": auth_user.id,
+        "email": response.user.email,
+        "username": username,
+        "is_admin": auth_user.is_admin,
+        "access_token": response.session.access_token
+    }
+
+def process_background_task(task_id: int, api_key: str, hf_token: str = None, num_speakers: int = None, transcribe: bool = True):
+    """
+    Runs the local stages (transcription, diarization) on the calling worker
+    thread, then hands the task to the LLM loop and returns without waiting.
+    """
+    with task_context(task_id):
+        with task_profiler.profile(task_id):
+            transcribed = run_local_stages(task_id, hf_token, num_speakers, transcribe)
+    if transcribed:
+        # The worker thread is free for the next transcription while Gemini runs
+        return submit_llm(process_llm_stages(task_id, api_key))
+
+def run_local_stages(task_id: int, hf_token: str = None, num_speakers: int = None, transcribe: bool = True):
+    """
+    Returns True when the task is ready for the LLM stages.
+    """
     db = SessionLocal()
     try:
         task = db.query(Task).filter(Task.id == task_id).first()
         if not task:
-            print(f"Task {task_id} not found in background task.")
-            return
+            logger.warning(f"Task {task_id} not found in background task.")
+            return False
+
+        if task.status == "pending":
+            # updated_at is when the task was created or last retried
+            observe_stage("queue_wait", (datetime.datetime.utcnow() - task.updated_at).total_seconds())
 
         # --- Step 1: Transcribe ---
-        task.status = "transcribing"
-        db.commit()
-        
-        # Only lock during the resource-intensive local transcription
-        with transcription_lock:
-            result = transcribe_audio(task.audio_path)
+        if transcribe:
+            task.status = "transcribing"
+            db.commit()
+            
+            options = task.transcription_options or {}
+            # Observed below without the time spent waiting for the lock
+            with stage_span("transcribe", metric=False):
+                started = time.perf_counter()
+                # Short clips may be decoded together with other queued tasks
+                result = transcription_batcher.try_transcribe(task.audio_path, options)
+                if result is None:
+                    # Only lock during the resource-intensive local transcription
+                    TRANSCRIPTION_QUEUE_DEPTH.inc()
+                    with transcription_lock:
+                        TRANSCRIPTION_QUEUE_DEPTH.dec()
+                        started = time.perf_counter()
+                        result = transcribe_audio(task.audio_path, **options)
+                elapsed = time.perf_counter() - started
+            observe_stage("transcribe", elapsed)
+            observe_real_time_factor(
+                options.get("engine") or DEFAULT_ENGINE,
+                options.get("model_size") or DEFAULT_MODEL_SIZE,
+                elapsed,
+                probe_duration(task.audio_path)
+            )
+        else:
+            # Already transcribed (e.g. live streaming session)
+            result = {"text": task.raw_transcription or "", "segments": task.raw_segments or []}
         
         segments = result["segments"]
         
         # --- Step 1.5: Diarize ---
         if hf_token:
-            print(f"Starting diarization for task {task_id}...")
-            diarization_result = diarize_audio(task.audio_path, hf_token, num_speakers)
+            logger.info("Starting diarization...")
+            streaming_decode = (task.transcription_options or {}).get("streaming_decode")
+            with stage_span("diarize"):
+                diarization_result = diarize_audio(task.audio_path, hf_token, num_speakers, streaming_decode)
             task.diarization = diarization_result
             
             # Merge with raw segments
-            segments = merge_diarization_with_transcript(segments, diarization_result)
-            print(f"Diarization merged. Segments with speakers: {len(segments)}")
+            with stage_span("merge"):
+                segments = merge_diarization_with_transcript(segments, diarization_result)
+            logger.info(f"Diarization merged. Segments with speakers: {len(segments)}")
         
         formatted_subtitles = format_segments(segments)
         
@@ -119,68 +208,237 @@ def process_background_task(task_id: int, api_key: str, hf_token: str = None, nu
         task.raw_subtitles = formatted_subtitles
         task.status = "transcribed"
         db.commit()
-        
-        # --- Step 2: Correct ---
-        task.status = "correcting"
-        db.commit()
-        
-        if not task.raw_subtitles or not task.raw_subtitles.strip():
-            print(f"Task {task_id}: Raw subtitles empty. Skipping correction.")
-            final_transcription = ""
-            final_subtitles = ""
-            final_segments = []
-        else:
-            corrected_transcription = correct_transcription(task.raw_subtitles, api_key)
-            
-            if corrected_transcription.startswith("Error"):
-                final_subtitles = task.raw_subtitles
-                final_segments = [] 
-                final_transcription = "" 
-            else:
-                final_subtitles = corrected_transcription
-                final_segments = parse_corrected_segments(corrected_transcription)
-                
-                if not final_segments:
-                    final_subtitles = task.raw_subtitles
-                    final_segments = []
-                    final_transcription = ""
-                else:
-                    final_transcription = " ".join([s["text"] for s in final_segments])
-        
-        task.corrected_transcription = final_transcription
-        task.corrected_subtitles = final_subtitles
-        task.corrected_segments = final_segments
-        task.status = "corrected"
-        db.commit()
+        return True
 
-        # --- Step 3: Summarize ---
-        task.status = "summarizing"
-        db.commit()
-        
-        source_text = task.corrected_subtitles if task.corrected_subtitles else task.raw_subtitles
-        
-        if not source_text or not source_text.strip():
-            print(f"Task {task_id}: Source text is empty. Skipping summary.")
-            task.summary = "No transcription available."
-        else:
-            summary = summarize_text(source_text, api_key)
-            task.summary = summary
-        
-        task.status = "completed"
-        db.commit()
-
-    except Exception as e:
-        print(f"Error in background task {task_id}: {str(e)}")
-        # Re-query task to ensure we have the latest session state if needed, 
-        # but here we just want to mark it failed.
+    except Exception:
+        logger.exception(f"Error in background task {task_id}")
         try:
             task.status = "failed"
             db.commit()
         except:
             pass
+        return False
     finally:
         db.close()
 
+# Database work of the LLM stages runs on these threads: the LLM loop is shared
+# by all tasks and must never wait for a pooled connection or a commit. Kept
+# below the connection pool size so the writers cannot exhaust it.
+LLM_DB_WORKERS = int(os.getenv("LLM_DB_WORKERS", "4"))
+llm_db_executor = ThreadPoolExecutor(max_workers=LLM_DB_WORKERS, thread_name_prefix="llm-db")
+
+async def run_db(func, *args):
+    """
+    Runs a blocking database function from the LLM loop on llm_db_executor.
+    """
+    return await asyncio.get_running_loop().run_in_executor(llm_db_executor, func, *args)
+
+def start_llm_task(task_id: int):
+    """
+    Marks the task as correcting and returns the fields the LLM stages read,
+    or None if the task does not exist. Uses its own short-lived session.
+    """
+    db = SessionLocal()
+    try:
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if not task:
+            return None
+        task.status = "correcting"
+        db.commit()
+        return {
+            "raw_segments": task.raw_segments,
+            "llm_options": task.llm_options or {},
+            "llm_usage": task.llm_usage or {},
+            "summary_chunks": task.summary_chunks,
+        }
+    finally:
+        db.close()
+
+def write_task_fields(task_id: int, values: dict):
+    db = SessionLocal()
+    try:
+        db.query(Task).filter(Task.id == task_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+class ProgressWriter:
+    """
+    Persists progress snapshots of one task from the LLM loop without blocking it.
+
+    At most one write is in flight. Snapshots that arrive meanwhile are
+    coalesced and only the newest is written next, so a slow database delays
+    progress updates instead of queueing them.
+    """
+    def __init__(self, task_id: int):
+        self.task_id = task_id
+        self.loop = asyncio.get_running_loop()
+        self.pending = None
+        self.in_flight = None
+
+    def submit(self, values: dict):
+        self.pending = values
+        if self.in_flight is None:
+            self._write_next()
+
+    def _write_next(self):
+        values, self.pending = self.pending, None
+        self.in_flight = self.loop.run_in_executor(llm_db_executor, write_task_fields, self.task_id, values)
+        self.in_flight.add_done_callback(self._written)
+
+    def _written(self, future):
+        self.in_flight = None
+        if future.exception():
+            # Progress is best effort; the final write of the stage still happens
+            logger.warning(f"Could not persist progress of task {self.task_id}: {future.exception()}")
+        if self.pending is not None:
+            self._write_next()
+
+    async def flush(self):
+        """
+        Waits until every submitted snapshot is written (or dropped), so a
+        stale snapshot can never land after the stage's final write.
+        """
+        while self.in_flight is not None:
+            await asyncio.wait([self.in_flight])
+            # Let the done callback run and start the next write, if any
+            await asyncio.sleep(0)
+
+async def process_llm_stages(task_id: int, api_key: str):
+    """
+    Correction and summary, run as a coroutine on the LLM loop.
+    """
+    # Runs in its own asyncio task, so the context set here stays with this task
+    with task_context(task_id), LLM_TASKS_IN_FLIGHT.track_inprogress():
+        try:
+            await run_llm_stages(task_id, api_key)
+        except Exception:
+            logger.exception(f"Error in LLM stages of task {task_id}")
+            try:
+                await run_db(write_task_fields, task_id, {"status": "failed", "progress": None})
+            except Exception:
+                logger.exception(f"Could not mark task {task_id} as failed")
+
+async def run_llm_stages(task_id: int, api_key: str):
+    """
+    No database session is held across an await: every read and write is a
+    short-lived session on llm_db_executor.
+    """
+    task = await run_db(start_llm_task, task_id)
+    if task is None:
+        logger.warning(f"Task {task_id} not found in LLM stages.")
+        return
+
+    # --- Step 2: Correct ---
+    raw_segments = task["raw_segments"]
+    llm_options = task["llm_options"]
+    llm_usage = task["llm_usage"]
+    correction_mode = llm_options.get("correction_mode") or CORRECTION_MODE
+    summary_mode = llm_options.get("summary_mode") or SUMMARY_MODE
+    # The single-call pipeline only applies when the summary would be a single call too
+    combined = (
+        (llm_options.get("pipeline_mode") or PIPELINE_MODE) == "combined"
+        and bool(raw_segments)
+        and resolve_summary_mode(raw_segments, summary_mode) == "single"
+    )
+    progress = ProgressWriter(task_id)
+
+    if not raw_segments:
+        logger.info("No segments to correct. Skipping correction.")
+        final_transcription = ""
+        final_subtitles = ""
+        final_segments = []
+    else:
+        def persist_corrections(segments, done, total):
+            # Corrected lines become visible while the LLM response is still streaming
+            progress.submit({
+                "corrected_segments": [dict(seg) for seg in segments],
+                "corrected_subtitles": format_segments(segments),
+                "progress": {"stage": "correcting", "completed": done, "total": total},
+            })
+
+        with stage_span("correct"):
+            if combined:
+                final_segments, correction_stats, combined_summary, summary_usage = await correct_and_summarize(raw_segments, api_key, correction_mode, persist_corrections)
+            else:
+                final_segments, correction_stats = await correct_segments(raw_segments, api_key, correction_mode, persist_corrections)
+        await progress.flush()
+        llm_usage = {**llm_usage, "correction": correction_stats}
+        final_subtitles = format_segments(final_segments)
+        final_transcription = " ".join([s["text"] for s in final_segments])
+
+    await run_db(write_task_fields, task_id, {
+        "corrected_transcription": final_transcription,
+        "corrected_subtitles": final_subtitles,
+        "corrected_segments": final_segments,
+        "version": func.coalesce(Task.version, 0) + 1,
+        "llm_usage": llm_usage,
+        "status": "corrected",
+    })
+
+    # --- Step 3: Summarize ---
+    await run_db(write_task_fields, task_id, {"status": "summarizing", "progress": {"stage": "summarizing"}})
+
+    source_segments = final_segments or raw_segments
+    summary_chunks = task["summary_chunks"]
+
+    if not source_segments:
+        logger.info("Source text is empty. Skipping summary.")
+        summary = "No transcription available."
+    elif combined:
+        # Already produced by the correction call
+        summary = combined_summary
+        llm_usage = {**llm_usage, "summary": summary_usage}
+    else:
+        last_commit = 0.0
+
+        def persist_summary(text):
+            nonlocal last_commit
+            if time.monotonic() - last_commit >= PROGRESS_COMMIT_SECONDS:
+                last_commit = time.monotonic()
+                progress.submit({"summary": text})
+
+        with stage_span("summarize"):
+            summary, summary_usage, summary_chunks = await summarize_segments(source_segments, api_key, summary_mode, summary_chunks, persist_summary)
+        await progress.flush()
+        llm_usage = {**llm_usage, "summary": summary_usage}
+
+    await run_db(write_task_fields, task_id, {
+        "summary": summary,
+        "summary_chunks": summary_chunks,
+        "llm_usage": llm_usage,
+        "status": "completed",
+        "progress": None,
+    })
+
+def build_llm_options(correction_mode: str = None, summary_mode: str = None, pipeline_mode: str = None):
+    options = {}
+    if correction_mode:
+        if correction_mode not in CORRECTION_MODES:
+            raise HTTPException(status_code=400, detail=f"Unknown correction_mode '{correction_mode}'. Available: {', '.join(CORRECTION_MODES)}")
+        options["correction_mode"] = correction_mode
+    if summary_mode:
+        if summary_mode not in SUMMARY_MODES:
+            raise HTTPException(status_code=400, detail=f"Unknown summary_mode '{summary_mode}'. Available: {', '.join(SUMMARY_MODES)}")
+        options["summary_mode"] = summary_mode
+    if pipeline_mode:
+        if pipeline_mode not in PIPELINE_MODES:
+            raise HTTPException(status_code=400, detail=f"Unknown pipeline_mode '{pipeline_mode}'. Available: {', '.join(PIPELINE_MODES)}")
+        options["pipeline_mode"] = pipeline_mode
+    return options
+
+def build_transcription_options(db: Session, user_id: str, **overrides):
+    """
+    The user's saved defaults, overridden by options given with the request.
+    """
+    preference = db.query(UserPreference).filter(UserPreference.user_id == user_id).first()
+    options = dict(preference.transcription_options or {}) if preference else {}
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    try:
+        return validate_transcription_options(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/process")
 async def process_endpoint(
     background_tasks: BackgroundTasks,
@@ -188,17 +446,35 @@ async def process_endpoint(
     api_key: str = Form(...),
     hf_token: str = Form(None),
     num_speakers: int = Form(None),
-    user_id: str = Form(...), # Changed to str (UUID)
     username: str = Form(None), # Optional username for display
+    engine: str = Form(None), # Transcription engine, defaults to TRANSCRIPTION_ENGINE
+    preset: str = Form(None), # fast / balanced / accurate
+    language: str = Form(None), # e.g. "zh"; skips language detection
+    beam_size: int = Form(None),
+    best_of: int = Form(None),
+    temperature_fallback: bool = Form(None),
+    vad: bool = Form(None), # Skip silence before transcription
+    streaming_decode: bool = Form(None), # Bounded-memory windowed decoding; automatic for long files
+    correction_mode: str = Form(None), # selective / full
+    summary_mode: str = Form(None), # auto / single / hierarchical
+    pipeline_mode: str = Form(None), # separate / combined (one LLM call for correction and summary)
+    user: AuthUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    transcription_options = build_transcription_options(
+        db, user.id, engine=engine, preset=preset, language=language,
+        beam_size=beam_size, best_of=best_of, temperature_fallback=temperature_fallback, vad=vad,
+        streaming_decode=streaming_decode
+    )
+    llm_options = build_llm_options(correction_mode, summary_mode, pipeline_mode)
+
     # Generate unique filename
     file_ext = os.path.splitext(file.filename)[1]
     unique_filename = f"{uuid.uuid4()}{file_ext}"
     file_path = os.path.join("media", unique_filename)
     
     # Save file permanently
-    with open(file_path, "wb") as buffer:
+    with stage_timer("upload"), open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
     try:
@@ -207,8 +483,10 @@ async def process_endpoint(
             filename=file.filename,
             audio_path=file_path.replace("\\", "/"),
             status="pending",
-            user_id=user_id, # Link to user (UUID)
-            username=username # Store username
+            user_id=user.id, # Link to user (UUID)
+            username=username, # Store username
+            transcription_options=transcription_options,
+            llm_options=llm_options
         )
         db.add(new_task)
         db.commit()
@@ -222,6 +500,107 @@ async def process_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Number of batch tasks in their local stages at once. Local transcription is
+# still serialized by transcription_lock; LLM stages run on the LLM loop and
+# are not limited by this.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+def process_batch_tasks(task_ids: List[int], api_key: str, hf_token: str = None, num_speakers: int = None):
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+        for task_id in task_ids:
+            executor.submit(process_background_task, task_id, api_key, hf_token, num_speakers)
+
+def resolve_manifest_path(audio_path: str):
+    """
+    Returns the normalized media path for a manifest entry, or None if it is
+    outside the media directory or does not exist.
+    """
+    media_dir = os.path.realpath("media")
+    full_path = os.path.realpath(audio_path)
+    if os.path.commonpath([media_dir, full_path]) != media_dir or not os.path.isfile(full_path):
+        return None
+    return os.path.relpath(full_path).replace("\\", "/")
+
+@app.post("/process/batch")
+async def process_batch_endpoint(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(None),
+    manifest: str = Form(None), # JSON list of {"filename": ..., "audio_path": "media/..."} already on the server
+    api_key: str = Form(...),
+    hf_token: str = Form(None),
+    num_speakers: int = Form(None),
+    username: str = Form(None),
+    engine: str = Form(None),
+    preset: str = Form(None), # fast / balanced / accurate
+    language: str = Form(None), # e.g. "zh"; skips language detection
+    beam_size: int = Form(None),
+    best_of: int = Form(None),
+    temperature_fallback: bool = Form(None),
+    vad: bool = Form(None), # Skip silence before transcription
+    streaming_decode: bool = Form(None), # Bounded-memory windowed decoding; automatic for long files
+    correction_mode: str = Form(None), # selective / full
+    summary_mode: str = Form(None), # auto / single / hierarchical
+    pipeline_mode: str = Form(None), # separate / combined (one LLM call for correction and summary)
+    user: AuthUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    transcription_options = build_transcription_options(
+        db, user.id, engine=engine, preset=preset, language=language,
+        beam_size=beam_size, best_of=best_of, temperature_fallback=temperature_fallback, vad=vad,
+        streaming_decode=streaming_decode
+    )
+    llm_options = build_llm_options(correction_mode, summary_mode, pipeline_mode)
+    entries = []
+
+    if manifest:
+        try:
+            manifest_items = json.loads(manifest)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="manifest must be a JSON list")
+        if not isinstance(manifest_items, list):
+            raise HTTPException(status_code=400, detail="manifest must be a JSON list")
+        for item in manifest_items:
+            audio_path = resolve_manifest_path(item.get("audio_path", "")) if isinstance(item, dict) else None
+            if not audio_path:
+                raise HTTPException(status_code=400, detail=f"Invalid manifest entry: {item}")
+            entries.append((item.get("filename") or os.path.basename(audio_path), audio_path))
+
+    for file in files or []:
+        file_ext = os.path.splitext(file.filename)[1]
+        file_path = os.path.join("media", f"{uuid.uuid4()}{file_ext}")
+        with stage_timer("upload"), open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        entries.append((file.filename, file_path.replace("\\", "/")))
+
+    if not entries:
+        raise HTTPException(status_code=400, detail="No files or manifest entries provided")
+
+    try:
+        # All Task rows are created in one transaction
+        new_tasks = [
+            Task(
+                filename=filename,
+                audio_path=audio_path,
+                status="pending",
+                user_id=user.id,
+                username=username,
+                transcription_options=transcription_options,
+                llm_options=llm_options
+            )
+            for filename, audio_path in entries
+        ]
+        db.add_all(new_tasks)
+        db.commit()
+        task_ids = [task.id for task in new_tasks]
+
+        background_tasks.add_task(process_batch_tasks, task_ids, api_key, hf_token, num_speakers)
+
+        return {"task_ids": task_ids, "message": f"{len(task_ids)} tasks started in background"}
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
 import datetime
 
 def check_timeout(task, db):
@@ -233,108 +612,222 @@ def check_timeout(task, db):
 
 @app.get("/tasks")
 @app.get("/tasks")
-async def get_tasks(user_id: str, is_admin: bool = False, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def get_tasks(skip: int = 0, limit: int = 100, apply_aliases: bool = False, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
     query = db.query(Task)
     
-    # If not admin, filter by user_id
-    if not is_admin:
-        query = query.filter(Task.user_id == user_id)
+    # Admins see all tasks, other users their own
+    if not user.is_admin:
+        query = query.filter(Task.user_id == user.id)
         
     tasks = query.order_by(Task.created_at.desc()).offset(skip).limit(limit).all()
     
     for task in tasks:
         check_timeout(task, db)
+    if apply_aliases:
+        return [render_task_aliases(task) for task in tasks]
     return tasks
 
+def render_task_aliases(task):
+    """
+    Returns the task as a dict with speaker aliases applied to text and segments.
+    """
+    data = {column.name: getattr(task, column.name) for column in Task.__table__.columns}
+    aliases = task.speaker_aliases or {}
+    if not aliases:
+        return data
+
+    for field in ["raw_transcription", "raw_subtitles", "corrected_transcription", "corrected_subtitles", "summary"]:
+        data[field] = apply_speaker_aliases(data[field], aliases)
+    for field in ["raw_segments", "corrected_segments"]:
+        if data[field]:
+            data[field] = [
+                {**seg, "speaker": aliases.get(seg["speaker"], seg["speaker"])} if seg.get("speaker") else seg
+                for seg in data[field]
+            ]
+    return data
+
 @app.get("/tasks/{task_id}")
-async def get_task_details(task_id: int, db: Session = Depends(get_db)):
+async def get_task_details(task_id: int, apply_aliases: bool = False, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
     task = db.query(Task).filter(Task.id == task_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    require_task_access(task, user)
+    if apply_aliases:
+        return render_task_aliases(task)
     return task
 
+# Until correction has finished, the pipeline's final write replaces the
+# corrected segments, so edits made in these states would be lost
+EDIT_LOCKED_STATUSES = ["pending", "transcribing", "transcribed", "correcting"]
+
+def require_editable(task):
+    if task.status in EDIT_LOCKED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Task is {task.status}; edit the transcript once correction has finished.")
+
+def update_if_version(db: Session, task_id: int, version: int, values: dict):
+    """
+    Writes `values` and bumps the version, conditional on the version the
+    client read (and on correction not running). Raises 409 if another edit
+    got there first, so concurrent edits never overwrite each other.
+    """
+    updated = (
+        db.query(Task)
+        .filter(Task.id == task_id, func.coalesce(Task.version, 0) == version, Task.status.notin_(EDIT_LOCKED_STATUSES))
+        .update({**values, "version": func.coalesce(Task.version, 0) + 1}, synchronize_session=False)
+    )
+    db.commit()
+    if not updated:
+        raise HTTPException(status_code=409, detail="Task has been modified by another edit. Reload and retry.")
+
 class TaskUpdate(BaseModel):
     corrected_subtitles: str = None
+    version: int = None # Required with corrected_subtitles: the version the client read
     summary: str = None
     speaker_map: dict = None
     api_key: str = None
     regenerate_summary: bool = False
 
 @app.put("/tasks/{task_id}")
-async def update_task(task_id: int, update_data: TaskUpdate, db: Session = Depends(get_db)):
+async def update_task(task_id: int, update_data: TaskUpdate, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
     task = db.query(Task).filter(Task.id == task_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
+    require_task_access(task, user)
+
     # 1. Update Text Content First
     if update_data.corrected_subtitles:
-        task.corrected_subtitles = update_data.corrected_subtitles
-    
+        require_editable(task)
+        if update_data.version is None:
+            raise HTTPException(status_code=400, detail="version is required with corrected_subtitles")
+        # Re-parse segments from the manually edited text
+        new_values = {"corrected_subtitles": update_data.corrected_subtitles}
+        final_segments = parse_corrected_segments(update_data.corrected_subtitles)
+        if final_segments:
+            new_values["corrected_segments"] = final_segments
+            new_values["corrected_transcription"] = " ".join([s["text"] for s in final_segments])
+        update_if_version(db, task_id, update_data.version, new_values)
+
     if update_data.summary:
         task.summary = update_data.summary
 
-    # 2. Apply Speaker Renaming (to the potentially updated text)
+    # 2. Record Speaker Renaming
+    # Names are stored as an alias map and applied at render/export time, so
+    # renaming is a metadata write and the stored text keeps the speaker codes.
     if update_data.speaker_map:
-        print(f"Applying speaker map: {update_data.speaker_map}")
-        
-        def replace_speakers(text, mapping):
-            if not text: return text
-            for code, name in mapping.items():
-                text = text.replace(code, name)
-            return text
-
-        # Apply to subtitles
-        if task.corrected_subtitles:
-            task.corrected_subtitles = replace_speakers(task.corrected_subtitles, update_data.speaker_map)
-        
-        # Apply to transcription
-        if task.corrected_transcription:
-            task.corrected_transcription = replace_speakers(task.corrected_transcription, update_data.speaker_map)
-            
-        # Apply to summary
-        if task.summary:
-            task.summary = replace_speakers(task.summary, update_data.speaker_map)
-            
-        # Apply to segments (JSON) - Update existing segments
-        if task.corrected_segments:
-            new_segments = []
-            for seg in task.corrected_segments:
-                new_seg = seg.copy()
-                if 'speaker' in new_seg and new_seg['speaker'] in update_data.speaker_map:
-                    new_seg['speaker'] = update_data.speaker_map[new_seg['speaker']]
-                new_segments.append(new_seg)
-            task.corrected_segments = new_segments
-
-    # 3. Re-parse segments if text changed (and not just speaker names in JSON)
-    # If we updated text (either via manual edit or speaker replace), we should sync segments text.
-    # However, simple string replace on segments JSON (above) handles speaker names.
-    # But if user manually edited text, we need to re-parse.
-    
-    if update_data.corrected_subtitles:
-        # Re-parse to get new text structure if manual edits occurred
-        # Note: This might reset speaker labels if the parser doesn't find them, 
-        # BUT our parser looks for [SPEAKER_XX] or [Name].
-        # Since we already replaced SPEAKER_XX with Name in step 2, the parser needs to handle Names.
-        # Our current parser might only expect [SPEAKER_XX]. 
-        # Let's check logic.py. If parser is robust, it's fine.
-        # For now, let's assume the simple replace above is enough for speaker names.
-        # If the user edited text, we re-parse.
-        
-        final_segments = parse_corrected_segments(task.corrected_subtitles)
-        if final_segments:
-             task.corrected_segments = final_segments
-             task.corrected_transcription = " ".join([s["text"] for s in final_segments])
+        logger.info(f"Updating speaker aliases: {update_data.speaker_map}")
+        aliases = dict(task.speaker_aliases or {})
+        for code, name in update_data.speaker_map.items():
+            name = (name or "").strip()
+            if not name or name == code:
+                aliases.pop(code, None)
+            else:
+                aliases[code] = name
+        task.speaker_aliases = aliases
 
-    # 4. Handle Regenerate Summary
+    # 3. Handle Regenerate Summary
     if update_data.regenerate_summary and update_data.api_key:
-        source_text = task.corrected_subtitles if task.corrected_subtitles else task.raw_subtitles
-        if source_text:
-            new_summary = summarize_text(source_text, update_data.api_key)
+        source_segments = task.corrected_segments or task.raw_segments
+        if source_segments:
+            summary_mode = (task.llm_options or {}).get("summary_mode") or SUMMARY_MODE
+            new_summary, summary_usage, task.summary_chunks = await run_llm(summarize_segments(source_segments, update_data.api_key, summary_mode, task.summary_chunks))
             task.summary = new_summary
+            task.llm_usage = {**(task.llm_usage or {}), "summary": summary_usage}
 
     db.commit()
     return {"message": "Task updated successfully", "task": task}
 
+class SegmentEdit(BaseModel):
+    text: str = None
+    speaker: str = None
+    start: float = None
+    end: float = None
+
+class SegmentPatch(SegmentEdit):
+    version: int
+
+class SegmentBatchItem(SegmentEdit):
+    index: int
+
+class SegmentBatchPatch(BaseModel):
+    version: int
+    edits: List[SegmentBatchItem]
+
+def apply_segment_edits(task_id: int, version: int, edits: dict, user: AuthUser, db: Session):
+    """
+    Applies {index: SegmentEdit} to the task's corrected segments and rewrites
+    only the affected subtitle lines. The write is conditional on the version
+    the client read (and on correction not running), so a concurrent edit
+    results in 409 instead of a lost update.
+    """
+    task = db.query(Task).filter(Task.id == task_id).first()
+    require_task_access(task, user)
+    require_editable(task)
+    if (task.version or 0) != version:
+        raise HTTPException(status_code=409, detail=f"Task has been modified (current version {task.version or 0}). Reload and retry.")
+
+    # Segments that were never corrected are edited starting from the raw ones
+    segments = list(task.corrected_segments or task.raw_segments or [])
+    for idx, edit in edits.items():
+        if idx < 0 or idx >= len(segments):
+            raise HTTPException(status_code=404, detail=f"Segment {idx} not found")
+        changes = edit.model_dump(exclude_none=True, exclude={"index", "version"})
+        if "text" in changes:
+            # One segment is one subtitle line
+            changes["text"] = " ".join(changes["text"].splitlines()).strip()
+        segments[idx] = {**segments[idx], **changes}
+
+    subtitles = task.corrected_subtitles or task.raw_subtitles
+    update_if_version(db, task_id, version, {
+        "corrected_segments": segments,
+        "corrected_subtitles": update_subtitle_lines(subtitles, segments, edits.keys()),
+        "corrected_transcription": " ".join([s["text"] for s in segments]),
+    })
+
+    return {
+        "message": "Segments updated successfully",
+        "version": version + 1,
+        "segments": {idx: segments[idx] for idx in edits},
+    }
+
+@app.patch("/tasks/{task_id}/segments/{segment_index}")
+def update_segment(task_id: int, segment_index: int, patch: SegmentPatch, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    return apply_segment_edits(task_id, patch.version, {segment_index: patch}, user, db)
+
+@app.patch("/tasks/{task_id}/segments")
+def update_segments(task_id: int, patch: SegmentBatchPatch, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    edits = {item.index: item for item in patch.edits}
+    if len(edits) != len(patch.edits):
+        raise HTTPException(status_code=400, detail="Duplicate segment index in edits")
+    return apply_segment_edits(task_id, patch.version, edits, user, db)
+
+# --- User Preferences ---
+class UserPreferenceUpdate(BaseModel):
+    transcription_options: dict
+
+def require_same_user(user_id: str, user: AuthUser):
+    if user_id != user.id and not user.is_admin:
+        raise HTTPException(status_code=403, detail="Not allowed to access another user's preferences")
+
+@app.get("/users/{user_id}/preferences")
+def get_user_preferences(user_id: str, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    require_same_user(user_id, user)
+    preference = db.query(UserPreference).filter(UserPreference.user_id == user_id).first()
+    return {"user_id": user_id, "transcription_options": (preference.transcription_options if preference else None) or {}}
+
+@app.put("/users/{user_id}/preferences")
+def update_user_preferences(user_id: str, update_data: UserPreferenceUpdate, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    require_same_user(user_id, user)
+    options = {k: v for k, v in update_data.transcription_options.items() if v is not None}
+    try:
+        # Stored normalized, so "5" is saved as 5
+        options = validate_transcription_options(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    preference = db.query(UserPreference).filter(UserPreference.user_id == user_id).first()
+    if not preference:
+        preference = UserPreference(user_id=user_id)
+        db.add(preference)
+    preference.transcription_options = options
+    db.commit()
+    return {"user_id": user_id, "transcription_options": options}
+
 class RetryTaskRequest(BaseModel):
     api_key: str
     hf_token: str = None
@@ -345,11 +838,11 @@ async def retry_task(
     task_id: int, 
     request: RetryTaskRequest, 
     background_tasks: BackgroundTasks, 
+    user: AuthUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     task = db.query(Task).filter(Task.id == task_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    require_task_access(task, user)
     
     # Reset status
     task.status = "pending"
@@ -359,3 +852,203 @@ async def retry_task(
     background_tasks.add_task(process_background_task, task.id, request.api_key, request.hf_token, request.num_speakers)
     
     return {"message": "Task retry started"}
+
+# --- Live Streaming Transcription ---
+def ingest_streaming_audio(decoder, transcriber, data: bytes):
+    """
+    Feeds a received frame through the decoder into the transcriber. Blocking
+    (ffmpeg pipe and WAV writes), so it runs on the threadpool.
+    """
+    pcm = decoder.feed(data) if decoder else data
+    return transcriber.add_pcm(pcm)
+
+def close_streaming_decoder(decoder, transcriber):
+    transcriber.add_pcm(decoder.close())
+
+def discard_streaming_session(decoder, transcriber):
+    if decoder:
+        decoder.abort()
+    if transcriber:
+        transcriber.discard()
+
+def decode_streaming_step(transcriber, final: bool = False):
+    # Live sessions share the lock (and the model) with file transcription, so
+    # a decode step waits while an uploaded file is being transcribed
+    with transcription_lock:
+        if final:
+            return transcriber.finish(), []
+        return transcriber.step()
+
+@app.websocket("/ws/transcribe")
+async def transcribe_stream(websocket: WebSocket):
+    """
+    Live transcription over WebSocket.
+
+    1. Client sends a JSON text message: {"event": "start", "access_token": ..., "username": ...,
+       "api_key": ..., "hf_token": ..., "num_speakers": ..., "language": ..., "preset": ...,
+       "format": "pcm" | "opus" | "webm" | "ogg", "sample_rate": 16000}
+    2. Client sends audio as binary frames (mono s16le PCM for "pcm", otherwise the encoded stream).
+    3. Server replies with {"type": "partial" | "final", "segments": [...]} as decoding progresses.
+       Final segments are never revised; partial segments are replaced by the next message.
+    4. Client sends {"event": "stop"}; the server persists a normal Task, replies
+       {"type": "completed", "task_id": ...} and runs correction and summary in the background.
+    """
+    await websocket.accept()
+    try:
+        config = json.loads(await websocket.receive_text())
+    except WebSocketDisconnect:
+        return
+    except (KeyError, ValueError):
+        # A binary frame (KeyError) or text that is not JSON
+        config = None
+    if not isinstance(config, dict) or config.get("event") != "start":
+        await websocket.close(code=1008, reason="First message must be a start event with access_token")
+        return
+    # Browsers cannot set headers on a WebSocket, so the token comes with the start event
+    try:
+        # A JWKS cache miss fetches the signing keys over the network
+        user = await run_in_threadpool(authenticate, config.get("access_token"))
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+
+    try:
+        options = validate_transcription_options({"preset": config.get("preset"), "language": config.get("language")})
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    try:
+        sample_rate = int(config.get("sample_rate") or 16000)
+    except (TypeError, ValueError):
+        await websocket.close(code=1008, reason="sample_rate must be an integer")
+        return
+
+    decoding_options = resolve_decoding_options(options["preset"], language=options["language"])
+    decode_options = WhisperEngine.decode_kwargs(decoding_options)
+    # The streaming window manages its own context
+    decode_options.pop("condition_on_previous_text", None)
+    decoder = transcriber = None
+    completed = False
+
+    try:
+        decoder = await run_in_threadpool(make_decoder, config.get("format", "pcm"), sample_rate)
+        model = await run_in_threadpool(load_whisper_model)
+        file_path = os.path.join("media", f"{uuid.uuid4()}.wav")
+        transcriber = StreamingTranscriber(model, file_path, decode_options=decode_options)
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect()
+            if message.get("bytes"):
+                if await run_in_threadpool(ingest_streaming_audio, decoder, transcriber, message["bytes"]):
+                    final, partial = await run_in_threadpool(decode_streaming_step, transcriber)
+                    if final:
+                        await websocket.send_json({"type": "final", "segments": final})
+                    await websocket.send_json({"type": "partial", "segments": partial})
+            elif message.get("text"):
+                try:
+                    event = json.loads(message["text"])
+                except ValueError:
+                    logger.warning("Ignoring a malformed control message on the live transcription socket.")
+                    continue
+                if isinstance(event, dict) and event.get("event") == "stop":
+                    break
+
+        if decoder:
+            await run_in_threadpool(close_streaming_decoder, decoder, transcriber)
+            decoder = None
+        final, _ = await run_in_threadpool(decode_streaming_step, transcriber, True)
+        if final:
+            await websocket.send_json({"type": "final", "segments": final})
+
+        segments = transcriber.final_segments
+        db = SessionLocal()
+        try:
+            new_task = Task(
+                filename=config.get("filename") or f"live-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.wav",
+                audio_path=file_path.replace("\\", "/"),
+                status="transcribed",
+                user_id=user.id,
+                username=config.get("username"),
+                raw_transcription=" ".join([s["text"] for s in segments]),
+                raw_segments=segments,
+                raw_subtitles=format_segments(segments)
+            )
+            db.add(new_task)
+            db.commit()
+            task_id = new_task.id
+        finally:
+            db.close()
+        # The recording now belongs to the task
+        completed = True
+
+        # Correction and summary run exactly as for uploaded files
+        asyncio.get_running_loop().run_in_executor(
+            None, process_background_task, task_id, config.get("api_key"),
+            config.get("hf_token"), config.get("num_speakers"), False
+        )
+        await websocket.send_json({"type": "completed", "task_id": task_id})
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        if not completed:
+            logger.info("Live transcription client disconnected before stop; discarding session.")
+    except Exception:
+        # e.g. ffmpeg exiting on an invalid stream (broken pipe) or a decoding error
+        logger.exception("Live transcription session failed.")
+        try:
+            await websocket.close(code=1011)
+        except RuntimeError:
+            pass # Already closed
+    finally:
+        if not completed:
+            # Stop ffmpeg and delete the partial recording, which /media would otherwise serve
+            await run_in_threadpool(discard_streaming_session, decoder, transcriber)
+
+@app.get("/ready")
+def ready_endpoint():
+    """
+    Readiness probe: 200 once the configured models are loaded and warmed up, 503 before.
+    """
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint: stage durations, real-time factor, Gemini
+    tokens/retries, queue depths and model cache hits.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# --- Admin: Profiling ---
+class ProfilingRequest(BaseModel):
+    tasks: int = 1 # Profile the next N tasks (0 disables)
+    cpu: bool = True # cProfile of the local stages
+    memory: bool = False # tracemalloc allocation diff (process-wide)
+
+@app.post("/admin/profiling")
+def enable_profiling(request: ProfilingRequest, user: AuthUser = Depends(get_current_user)):
+    """
+    Profiles the next N processed tasks. Reports are written to PROFILE_DIR.
+    """
+    require_admin(user)
+    if request.tasks < 0:
+        raise HTTPException(status_code=400, detail="tasks must not be negative")
+    return task_profiler.arm(request.tasks, request.cpu, request.memory)
+
+@app.get("/admin/profiling")
+def get_profiling(user: AuthUser = Depends(get_current_user)):
+    require_admin(user)
+    return task_profiler.status()
+
+@app.get("/admin/profiling/{name}")
+def download_profile(name: str, user: AuthUser = Depends(get_current_user)):
+    require_admin(user)
+    path = task_profiler.report_path(name)
+    if not path or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
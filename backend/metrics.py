@@ -0,0 +1,76 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import event
+
+# Exposed at /metrics. Metrics are per process: with several uvicorn workers,
+# scrape each worker (or run one worker per container).
+
+# Stages: upload, queue_wait, transcribe, diarize, merge, correct, summarize, db_commit
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Duration of each processing stage. In the combined LLM pipeline, correct covers both LLM stages.",
+    ["stage"],
+    buckets=(0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+REAL_TIME_FACTOR = Histogram(
+    "transcription_real_time_factor",
+    "Transcription time divided by audio duration",
+    ["engine", "model_size"],
+    buckets=(0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5),
+)
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Tokens reported by Gemini", ["kind"]) # prompt / response
+GEMINI_REQUESTS = Counter("gemini_requests_total", "Gemini requests by outcome", ["outcome"]) # ok / error
+GEMINI_RETRIES = Counter("gemini_retries_total", "Retried Gemini requests", ["reason"]) # rate_limited / server_error
+GEMINI_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "gemini_rate_limit_wait_seconds",
+    "Time requests waited for the per-key RPM/TPM budget",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300),
+)
+TRANSCRIPTION_QUEUE_DEPTH = Gauge("transcription_queue_depth", "Tasks waiting for the transcription lock")
+BATCH_QUEUE_DEPTH = Gauge("transcription_batch_queue_depth", "Clips waiting for a batched Whisper pass")
+LLM_TASKS_IN_FLIGHT = Gauge("llm_tasks_in_flight", "Tasks currently in the LLM stages")
+MODEL_CACHE_REQUESTS = Counter("model_cache_requests_total", "Model loads served from the in-process cache", ["model", "result"]) # hit / miss
+
+def stage_timer(stage):
+    """
+    Context manager that records the duration of a stage: `with stage_timer("transcribe"): ...`
+    """
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+def observe_real_time_factor(engine, model_size, seconds, audio_seconds):
+    if audio_seconds:
+        REAL_TIME_FACTOR.labels(engine=engine, model_size=model_size).observe(seconds / audio_seconds)
+
+def record_model_cache(model, hit):
+    MODEL_CACHE_REQUESTS.labels(model=model, result="hit" if hit else "miss").inc()
+
+def record_gemini_usage(response):
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return
+    GEMINI_TOKENS.labels(kind="prompt").inc(metadata.prompt_token_count or 0)
+    GEMINI_TOKENS.labels(kind="response").inc(metadata.candidates_token_count or 0)
+
+def instrument_db_commits(session_factory):
+    """
+    Records the duration of every commit (including its flush) made through `session_factory`.
+    """
+    @event.listens_for(session_factory, "before_commit")
+    def before_commit(session):
+        session.info["commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def after_commit(session):
+        started = session.info.pop("commit_started", None)
+        if started is not None:
+            observe_stage("db_commit", time.perf_counter() - started)
+
+def render_metrics():
+    """
+    Returns (body, content_type) in the Prometheus text exposition format.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,257 @@
+import contextvars
+import cProfile
+import datetime
+import io
+import json
+import logging
+import logging.handlers
+import os
+import pstats
+import queue
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from metrics import observe_stage
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for humans, "json" for one structured object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Write OpenTelemetry spans (OTLP JSON, one per line) to this file. Needs opentelemetry-sdk.
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Profile the first N tasks after startup (cProfile, plus tracemalloc with PROFILE_MEMORY=1)
+PROFILE_TASKS = int(os.getenv("PROFILE_TASKS", "0"))
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "0") == "1"
+
+# Set per task/stage and attached to every log record and span. Context
+# variables follow the code across awaits; threads and the LLM loop set them
+# explicitly through task_context().
+task_id_var = contextvars.ContextVar("task_id", default=None)
+stage_var = contextvars.ContextVar("stage", default=None)
+
+tracer = None
+_log_listener = None
+_setup_lock = threading.Lock()
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        record.task_id = task_id_var.get()
+        record.stage = stage_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "task_id": record.task_id,
+            "stage": record.stage,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, traces_file=OTEL_TRACES_FILE):
+    """
+    Routes all log records through a queue to a background listener, so
+    logging never blocks the worker threads or the LLM event loop on I/O.
+    Safe to call more than once.
+    """
+    global _log_listener
+    with _setup_lock:
+        if _log_listener is not None:
+            return
+        handler = logging.StreamHandler()
+        if log_format == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [task=%(task_id)s stage=%(stage)s] %(name)s: %(message)s"))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        # Filter before enqueueing: the context variables belong to the logging thread
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        _log_listener = logging.handlers.QueueListener(log_queue, handler)
+        _log_listener.start()
+
+        if traces_file:
+            setup_tracing(traces_file)
+
+def setup_tracing(traces_file):
+    global tracer
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        logging.getLogger(__name__).warning("OTEL_TRACES_FILE is set but opentelemetry-sdk is not installed; tracing disabled.")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": "transcription-backend"}))
+    exporter = ConsoleSpanExporter(
+        out=open(traces_file, "a", encoding="utf-8"),
+        formatter=lambda span: span.to_json(indent=None) + "\n"
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    tracer = trace.get_tracer(__name__)
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def task_context(task_id):
+    token = task_id_var.set(task_id)
+    try:
+        yield
+    finally:
+        task_id_var.reset(token)
+
+@contextmanager
+def stage_span(stage, metric=True, **attributes):
+    """
+    Marks a pipeline stage: sets the stage for log records, opens a tracing
+    span when tracing is enabled and records the duration in the
+    pipeline_stage_seconds metric (unless `metric` is False).
+    """
+    token = stage_var.set(stage)
+    started = time.perf_counter()
+    span_manager = None
+    if tracer is not None:
+        attributes = {"task_id": task_id_var.get(), **attributes}
+        span_manager = tracer.start_as_current_span(stage, attributes={k: v for k, v in attributes.items() if v is not None})
+        span_manager.__enter__()
+    try:
+        yield
+    except BaseException as e:
+        if span_manager is not None:
+            span_manager.__exit__(type(e), e, e.__traceback__)
+            span_manager = None
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if span_manager is not None:
+            span_manager.__exit__(None, None, None)
+        if metric:
+            observe_stage(stage, elapsed)
+        logger.debug(f"{stage} finished in {elapsed:.2f}s")
+        stage_var.reset(token)
+
+REPORT_NAME = re.compile(r"task-\d+-\d{8}-\d{6}\.(prof|txt)")
+
+class TaskProfiler:
+    """
+    On-demand profiling of the next N tasks, armed from PROFILE_TASKS at startup
+    or from the admin endpoint.
+
+    cProfile covers the local stages of a task (transcription, diarization)
+    on its worker thread. tracemalloc is process-wide, so its snapshot diff
+    also includes allocations of tasks running at the same time.
+    Results are written to PROFILE_DIR as <task>-<time>.prof (pstats) and .txt.
+    """
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.cpu = True
+        self.memory = False
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def arm(self, tasks, cpu=True, memory=False):
+        with self.lock:
+            self.remaining = max(0, tasks)
+            self.cpu = cpu
+            self.memory = memory
+            return self.status()
+
+    def reports(self):
+        """
+        Names of the reports written by the profiler; other files in the directory are never listed or served.
+        """
+        files = os.listdir(self.output_dir) if os.path.isdir(self.output_dir) else []
+        return sorted(name for name in files if REPORT_NAME.fullmatch(name))
+
+    def report_path(self, name):
+        """
+        Returns the path of a report by name, or None if the profiler did not write it.
+        """
+        if name not in self.reports():
+            return None
+        return os.path.join(self.output_dir, name)
+
+    def status(self):
+        files = self.reports()
+        return {"remaining": self.remaining, "active": self.active, "cpu": self.cpu, "memory": self.memory, "files": files}
+
+    def _take(self):
+        with self.lock:
+            if self.remaining <= 0:
+                return None
+            self.remaining -= 1
+            self.active += 1
+            if self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+            return {"cpu": self.cpu, "memory": self.memory}
+
+    def _release(self):
+        with self.lock:
+            self.active -= 1
+            if self.active == 0 and self.remaining == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    @contextmanager
+    def profile(self, task_id):
+        """
+        Profiles the enclosed code if a profiling slot is left, otherwise does nothing.
+        """
+        settings = self._take()
+        if settings is None:
+            yield
+            return
+
+        profiler = cProfile.Profile() if settings["cpu"] else None
+        snapshot = tracemalloc.take_snapshot() if settings["memory"] else None
+        if profiler:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per process
+                logger.warning("Another task is being profiled; skipping cProfile for this one.")
+                profiler = None
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            try:
+                self._dump(task_id, profiler, snapshot)
+            except Exception:
+                logger.exception("Could not write profile")
+            self._release()
+
+    def _dump(self, task_id, profiler, snapshot):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"task-{task_id}-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}")
+        report = io.StringIO()
+        if profiler:
+            profiler.dump_stats(f"{base}.prof")
+            report.write("# cProfile (top 40 by cumulative time)\n")
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+        if snapshot is not None and tracemalloc.is_tracing():
+            report.write("# tracemalloc (top 30 allocation increases)\n")
+            for stat in tracemalloc.take_snapshot().compare_to(snapshot, "lineno")[:30]:
+                report.write(f"{stat}\n")
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        logger.info(f"Profile written to {base}.txt")
+
+task_profiler = TaskProfiler()
+task_profiler.arm(PROFILE_TASKS, memory=PROFILE_MEMORY)
@@ -0,0 +1,192 @@
+import os
+import subprocess
+import threading
+import queue
+import wave
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+class FfmpegDecoder:
+    """
+    Decodes an encoded audio stream (Opus/WebM/Ogg, or PCM at another rate)
+    to 16 kHz mono s16le PCM through a long-running ffmpeg process.
+    """
+    def __init__(self, input_args):
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", *input_args, "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.output = queue.Queue()
+        # Read on a separate thread so a full stdout pipe never blocks our writes
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            chunk = self.process.stdout.read(4096)
+            if not chunk:
+                break
+            self.output.put(chunk)
+        self.output.put(None)
+
+    def _drain(self, block=False):
+        chunks = []
+        while True:
+            try:
+                chunk = self.output.get(block=block)
+            except queue.Empty:
+                break
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def feed(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+        return self._drain()
+
+    def close(self):
+        self.process.stdin.close()
+        pcm = self._drain(block=True)
+        self.process.wait()
+        return pcm
+
+    def abort(self):
+        """
+        Stops ffmpeg without collecting its output, e.g. after it exited on an invalid stream.
+        """
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass # Broken pipe: ffmpeg is already gone
+        self.process.kill()
+        self.process.wait()
+
+def make_decoder(audio_format="pcm", sample_rate=SAMPLE_RATE):
+    """
+    Returns None when frames are already 16 kHz s16le PCM, otherwise an ffmpeg decoder.
+    """
+    if audio_format == "pcm":
+        if sample_rate == SAMPLE_RATE:
+            return None
+        return FfmpegDecoder(["-f", "s16le", "-ac", "1", "-ar", str(sample_rate)])
+    return FfmpegDecoder([])
+
+class StreamingTranscriber:
+    """
+    Incremental Whisper decoding over a sliding window.
+
+    Audio after the last committed segment is kept in `buffer` and re-decoded
+    every `step_seconds`. Segments that end at least `stable_margin` seconds
+    before the end of the buffer are committed as final and their audio is
+    dropped, so final timestamps never change and the window stays bounded.
+    The full recording is written to `wav_path` as it arrives.
+    """
+    def __init__(self, model, wav_path, window_seconds=30.0, step_seconds=2.0, stable_margin=2.0, decode_options=None):
+        self.model = model
+        self.window_seconds = window_seconds
+        self.step_seconds = step_seconds
+        self.stable_margin = stable_margin
+        self.decode_options = decode_options or {}
+
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_offset = 0.0 # Absolute time (s) of buffer[0]
+        self.new_samples = 0
+        self.final_segments = []
+
+        self.wav_path = wav_path
+        self.wav = wave.open(wav_path, "wb")
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(SAMPLE_RATE)
+
+    def add_pcm(self, pcm_bytes):
+        """
+        Appends 16 kHz s16le PCM. Returns True when enough new audio arrived for a decode step.
+        """
+        # Keep whole samples only; odd trailing bytes are extremely rare for PCM framing
+        pcm_bytes = pcm_bytes[:len(pcm_bytes) - len(pcm_bytes) % 2]
+        if not pcm_bytes:
+            return False
+        self.wav.writeframes(pcm_bytes)
+        samples = np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+        self.buffer = np.concatenate([self.buffer, samples])
+        self.new_samples += len(samples)
+        return self.new_samples >= self.step_seconds * SAMPLE_RATE
+
+    def _decode(self):
+        prompt = " ".join(s["text"] for s in self.final_segments[-3:]).strip() or None
+        result = self.model.transcribe(
+            self.buffer,
+            condition_on_previous_text=False,
+            initial_prompt=prompt,
+            **self.decode_options
+        )
+        return [
+            {
+                "start": round(self.buffer_offset + seg["start"], 2),
+                "end": round(self.buffer_offset + seg["end"], 2),
+                "text": seg["text"].strip(),
+            }
+            for seg in result["segments"]
+            if seg["text"].strip()
+        ]
+
+    def _commit(self, segments):
+        if not segments:
+            return []
+        self.final_segments.extend(segments)
+        cut = int((segments[-1]["end"] - self.buffer_offset) * SAMPLE_RATE)
+        cut = max(0, min(cut, len(self.buffer)))
+        self.buffer = self.buffer[cut:]
+        self.buffer_offset += cut / SAMPLE_RATE
+        return segments
+
+    def step(self):
+        """
+        Decodes the current window. Returns (new_final_segments, partial_segments).
+        """
+        self.new_samples = 0
+        buffer_seconds = len(self.buffer) / SAMPLE_RATE
+        segments = self._decode()
+
+        if not segments:
+            # Nothing but silence/noise: keep only the tail so the window stays bounded
+            if buffer_seconds > self.window_seconds:
+                keep = int(self.stable_margin * SAMPLE_RATE)
+                self.buffer_offset += (len(self.buffer) - keep) / SAMPLE_RATE
+                self.buffer = self.buffer[-keep:]
+            return [], []
+
+        buffer_end = self.buffer_offset + buffer_seconds
+        if buffer_seconds >= self.window_seconds:
+            # Window is full: commit everything but the segment still being spoken
+            stable = segments[:-1] or segments
+        else:
+            stable = [s for s in segments[:-1] if s["end"] <= buffer_end - self.stable_margin]
+        final = self._commit(stable)
+        partial = segments[len(stable):]
+        return final, partial
+
+    def finish(self):
+        """
+        Decodes the remaining audio, commits it and closes the recording.
+        Returns the newly committed segments.
+        """
+        final = []
+        if len(self.buffer) > 0:
+            final = self._commit(self._decode())
+        self.wav.close()
+        return final
+
+    def discard(self):
+        """
+        Closes and deletes the recording of an abandoned session.
+        """
+        self.wav.close()
+        if os.path.exists(self.wav_path):
+            os.remove(self.wav_path)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Backend modules import each other by name, as when the app runs from backend/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Never let a developer .env point the tests at the Supabase database
+os.environ["DATABASE_PASSWORD"] = ""
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ["PRELOAD_MODELS"] = "0"
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+
+import auth
+from auth import TokenVerifier, authenticate, user_from_claims
+
+SECRET = "test-secret-with-at-least-32-bytes!"
+
+def claims(**overrides):
+    now = int(time.time())
+    return {"sub": "user-1", "email": "user@example.com", "aud": "authenticated", "iat": now, "exp": now + 3600, **overrides}
+
+def hs256(secret=SECRET, **overrides):
+    return jwt.encode(claims(**overrides), secret, algorithm="HS256")
+
+def test_valid_hs256_token():
+    user = TokenVerifier(SECRET).verify(hs256())
+    assert (user.id, user.email, user.is_admin) == ("user-1", "user@example.com", False)
+
+@pytest.mark.parametrize("token", [
+    hs256(exp=int(time.time()) - 3600),
+    hs256(aud="anon"),
+    hs256(secret="another-secret-with-at-least-32-bytes"),
+    hs256(sub=None),
+    "not a token",
+])
+def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(jwt.InvalidTokenError):
+        TokenVerifier(SECRET).verify(token)
+
+def test_hs256_needs_a_secret():
+    with pytest.raises(jwt.InvalidTokenError):
+        TokenVerifier(None).verify(hs256())
+
+def test_verified_tokens_are_cached_until_they_expire(monkeypatch):
+    verifier = TokenVerifier(SECRET)
+    decode = verifier.decode
+    calls = []
+    monkeypatch.setattr(verifier, "decode", lambda token: calls.append(token) or decode(token))
+    token = hs256()
+    assert verifier.verify(token) == verifier.verify(token)
+    assert len(calls) == 1
+
+    # Past the cached expiry the token is decoded again
+    verifier.cache[token] = (time.time() - 1, verifier.cache[token][1])
+    verifier.verify(token)
+    assert len(calls) == 2
+
+def test_cache_entries_expire_with_the_key_refresh():
+    verifier = TokenVerifier(SECRET, refresh_seconds=60)
+    token = hs256()
+    verifier.verify(token)
+    assert verifier.cache[token][0] <= time.time() + 60
+
+def test_admins_come_from_app_metadata_or_the_email_list():
+    assert user_from_claims({"sub": "a", "app_metadata": {"role": "admin"}}).is_admin
+    assert user_from_claims({"sub": "b", "email": "Admin@Test.com"}).is_admin
+    # user_metadata is editable by the user and does not count
+    assert not user_from_claims({"sub": "c", "email": "user@example.com", "user_metadata": {"role": "admin"}}).is_admin
+    assert user_from_claims({"sub": "d"}).email is None
+
+@pytest.fixture
+def jwks_server():
+    """
+    Serves the "keys" list at http://127.0.0.1:<port>/jwks.json and counts the fetches.
+    """
+    server = HTTPServer(("127.0.0.1", 0), None)
+    server.keys, server.fetches = [], 0
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.fetches += 1
+            body = json.dumps({"keys": server.keys}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server.RequestHandlerClass = Handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_port}/jwks.json"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def es256_key(kid):
+    key = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(key.public_key()))
+    return key, {**jwk, "kid": kid, "alg": "ES256", "use": "sig"}
+
+def test_es256_token_verified_with_the_published_keys(jwks_server):
+    key, jwk = es256_key("key-1")
+    jwks_server.keys.append(jwk)
+    verifier = TokenVerifier(jwks_url=jwks_server.url)
+
+    assert verifier.verify(jwt.encode(claims(), key, algorithm="ES256", headers={"kid": "key-1"})).id == "user-1"
+    assert verifier.verify(jwt.encode(claims(sub="user-2"), key, algorithm="ES256", headers={"kid": "key-1"})).id == "user-2"
+    # Keys are fetched once, not per token
+    assert jwks_server.fetches == 1
+
+    forged = jwt.encode(claims(), ec.generate_private_key(ec.SECP256R1()), algorithm="ES256", headers={"kid": "key-1"})
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(forged)
+
+def test_key_rotation_is_picked_up_on_refresh(jwks_server):
+    old_key, old_jwk = es256_key("old")
+    new_key, new_jwk = es256_key("new")
+    jwks_server.keys.append(old_jwk)
+    verifier = TokenVerifier(jwks_url=jwks_server.url, refresh_seconds=0.2)
+    verifier.verify(jwt.encode(claims(), old_key, algorithm="ES256", headers={"kid": "old"}))
+
+    jwks_server.keys[:] = [new_jwk]
+    time.sleep(0.3)
+    assert verifier.verify(jwt.encode(claims(), new_key, algorithm="ES256", headers={"kid": "new"})).id == "user-1"
+    # The removed key is no longer trusted
+    with pytest.raises(jwt.PyJWKClientError):
+        verifier.verify(jwt.encode(claims(sub="user-2"), old_key, algorithm="ES256", headers={"kid": "old"}))
+
+def test_tokens_verified_before_a_key_is_removed_stop_working(jwks_server):
+    key, jwk = es256_key("old")
+    jwks_server.keys.append(jwk)
+    verifier = TokenVerifier(jwks_url=jwks_server.url, refresh_seconds=0.2)
+    token = jwt.encode(claims(), key, algorithm="ES256", headers={"kid": "old"})
+    verifier.verify(token)
+
+    jwks_server.keys[:] = [es256_key("new")[1]]
+    time.sleep(0.3)
+    with pytest.raises(jwt.PyJWKClientError):
+        verifier.verify(token)
+
+def test_authenticate_turns_failures_into_401(monkeypatch):
+    monkeypatch.setattr(auth, "token_verifier", TokenVerifier(SECRET))
+    assert authenticate(hs256()).id == "user-1"
+    for token in [None, "", hs256(secret="another-secret-with-at-least-32-bytes")]:
+        with pytest.raises(HTTPException) as error:
+            authenticate(token)
+        assert error.value.status_code == 401
@@ -0,0 +1,38 @@
+from logic import decode_compact_speakers, encode_segments_compact, estimate_tokens, format_segments
+
+SEGMENTS = [
+    {"start": 0.4, "end": 3.2, "text": " 你好", "speaker": "SPEAKER_00"},
+    {"start": 3.2, "end": 5.9, "text": "大家好", "speaker": "SPEAKER_00"},
+    {"start": 6.0, "end": 8.0, "text": "hi", "speaker": "SPEAKER_01"},
+    {"start": 8.0, "end": 9.0, "text": "  "},
+]
+
+def test_consecutive_lines_of_a_speaker_are_merged():
+    text, codes = encode_segments_compact(SEGMENTS)
+    assert text == "0-6 S1: 你好 大家好\n6-8 S2: hi"
+    assert codes == {"S1": "SPEAKER_00", "S2": "SPEAKER_01"}
+
+def test_merging_stops_at_the_time_limit():
+    text, _ = encode_segments_compact(SEGMENTS, merge_max_seconds=4)
+    assert text.splitlines()[:2] == ["0-4 S1: 你好", "3-6 S1: 大家好"]
+
+def test_with_ids_keeps_every_segment_and_its_index():
+    text, _ = encode_segments_compact(SEGMENTS, with_ids=True)
+    assert text == "0 0-4 S1: 你好\n1 3-6 S1: 大家好\n2 6-8 S2: hi"
+
+def test_speaker_codes_map_back_without_touching_longer_tokens():
+    _, codes = encode_segments_compact(SEGMENTS)
+    assert decode_compact_speakers("S1 agreed with S2, not S10", codes) == "SPEAKER_00 agreed with SPEAKER_01, not S10"
+
+def test_speaker_codes_map_back_in_chinese_text():
+    _, codes = encode_segments_compact(SEGMENTS)
+    assert decode_compact_speakers("S1提出預算問題，S2同意。", codes) == "SPEAKER_00提出預算問題，SPEAKER_01同意。"
+
+def test_compact_encoding_is_smaller_than_the_subtitle_format():
+    segments = [{"start": i * 2.5, "end": i * 2.5 + 2.5, "text": "今天討論預算", "speaker": f"SPEAKER_0{i % 2}"} for i in range(40)]
+    compact, _ = encode_segments_compact(segments)
+    assert estimate_tokens(compact) < estimate_tokens(format_segments(segments)) * 0.7
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好abcd") == 3
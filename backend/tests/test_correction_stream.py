@@ -0,0 +1,32 @@
+import pytest
+
+from logic import CorrectionStreamParser, parse_corrected_items
+
+RESPONSE = '```json\n[{"id": 0, "text": "你好"}, {"id": "1", "text": " 大家好 "},\n {"id": 2, "text": "a [b], {c}"}]\n```'
+
+def feed_all(chunks):
+    parser = CorrectionStreamParser()
+    corrections = {}
+    for chunk in chunks:
+        corrections.update(parser.feed(chunk))
+    return corrections
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(RESPONSE)])
+def test_any_chunking_gives_the_full_result(size):
+    chunks = [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]
+    assert feed_all(chunks) == {0: "你好", 1: "大家好", 2: "a [b], {c}"}
+
+def test_items_are_returned_as_soon_as_they_are_complete():
+    parser = CorrectionStreamParser()
+    assert parser.feed("Here you go:\n[") == {}
+    assert parser.feed('{"id": 4, "text": "one"}, {"id": 5, "te') == {4: "one"}
+    assert parser.feed('xt": "two"}') == {5: "two"}
+    assert parser.feed("]") == {}
+
+def test_malformed_items_are_skipped():
+    chunks = ['[{"id": "x", "text": "bad id"}, {"id": 1}, 7, {"id": 2, "text": "ok"}]']
+    assert feed_all(chunks) == {2: "ok"}
+
+def test_parse_corrected_items_accepts_fenced_and_wrapped_output():
+    assert parse_corrected_items(RESPONSE) == {0: "你好", 1: "大家好", 2: "a [b], {c}"}
+    assert parse_corrected_items('{"segments": [{"id": 3, "text": "x"}, {"text": "no id"}]}') == {3: "x"}
@@ -0,0 +1,71 @@
+import types
+
+import pytest
+
+import gemini_client
+from gemini_client import RateLimiter, TokenBucket
+
+def bucket(per_minute):
+    bucket = TokenBucket(per_minute)
+    bucket.updated = 0.0
+    return bucket
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(gemini_client, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def test_reservations_within_budget_do_not_wait():
+    b = bucket(60)
+    assert [b.reserve(20, 0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+
+def test_reservations_over_budget_queue_up_in_order():
+    b = bucket(60) # one token per second
+    b.reserve(60, 0.0)
+    assert b.reserve(1, 0.0) == pytest.approx(1.0)
+    assert b.reserve(1, 0.0) == pytest.approx(2.0)
+    # Time passing pays the debt back
+    assert b.reserve(1, 3.0) == pytest.approx(0.0)
+
+def test_refill_is_capped_at_the_budget():
+    b = bucket(60)
+    b.reserve(60, 0.0)
+    assert b.reserve(60, 3600.0) == 0.0
+    assert b.reserve(1, 3600.0) == pytest.approx(1.0)
+
+def test_an_oversized_request_waits_for_a_full_bucket_only():
+    b = bucket(600)
+    b.reserve(600, 0.0)
+    assert b.reserve(10000, 0.0) == pytest.approx(60.0)
+
+def test_adjust_and_drain():
+    b = bucket(60)
+    b.reserve(30, 0.0)
+    b.adjust(40, 0.0) # used 40 more than estimated
+    assert b.tokens == pytest.approx(-10.0)
+    b.adjust(-20, 0.0)
+    b.drain(0.0)
+    assert b.reserve(1, 0.0) == pytest.approx(1.0)
+
+def test_limiter_waits_for_the_stricter_budget(clock):
+    limiter = RateLimiter(rpm=2, tpm=1000)
+    assert limiter.reserve(100) == 0.0
+    assert limiter.reserve(100) == 0.0
+    # Third request in the minute: RPM budget refills one request per 30 s
+    assert limiter.reserve(100) == pytest.approx(30.0)
+    # Later, the TPM budget is the one that runs out
+    clock.now = 120.0
+    assert limiter.reserve(1000) == 0.0
+    assert limiter.reserve(600) == pytest.approx(36.0)
+
+def test_limiter_corrects_estimates_with_actual_usage(clock):
+    limiter = RateLimiter(rpm=100, tpm=1000)
+    limiter.reserve(100)
+    limiter.record_usage(100, 1100) # 100 tokens over budget
+    assert limiter.reserve(0) == pytest.approx(6.0)
+
+def test_throttled_empties_both_budgets(clock):
+    limiter = RateLimiter(rpm=60, tpm=6000)
+    limiter.throttled()
+    assert limiter.reserve(100) == pytest.approx(1.0)
@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from auth import AuthUser
+from logic import format_segments
+
+SEGMENTS = [
+    {"start": 0.0, "end": 2.0, "text": "第一句", "speaker": "SPEAKER_00"},
+    {"start": 2.0, "end": 4.0, "text": "第二句", "speaker": "SPEAKER_01"},
+    {"start": 4.0, "end": 6.0, "text": "第三句", "speaker": "SPEAKER_00"},
+]
+OWNER = AuthUser(id="owner")
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    # main (and database, which resolves its SQLite path on import) creates
+    # media/ and the fallback tasks.db in the working directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    try:
+        import main
+        yield main
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture
+def db(main):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    main.Task.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def add_task(main, db):
+    task = main.Task(
+        user_id=OWNER.id, status="completed", version=3,
+        corrected_segments=SEGMENTS, corrected_subtitles=format_segments(SEGMENTS)
+    )
+    db.add(task)
+    db.commit()
+    return task.id
+
+def stored(main, db, task_id):
+    db.expire_all()
+    return db.get(main.Task, task_id)
+
+def test_edit_bumps_the_version_and_rewrites_only_its_line(main, db):
+    task_id = add_task(main, db)
+    result = main.apply_segment_edits(task_id, 3, {1: main.SegmentEdit(text="改過\n的句子")}, OWNER, db)
+    assert result["version"] == 4
+    assert result["segments"][1]["text"] == "改過 的句子"
+
+    task = stored(main, db, task_id)
+    assert task.version == 4
+    lines = task.corrected_subtitles.splitlines()
+    original = format_segments(SEGMENTS).splitlines()
+    assert (lines[0], lines[2]) == (original[0], original[2])
+    assert lines[1].endswith("改過 的句子")
+    assert task.corrected_segments[1]["speaker"] == "SPEAKER_01"
+
+def test_stale_version_is_rejected(main, db):
+    task_id = add_task(main, db)
+    main.apply_segment_edits(task_id, 3, {0: main.SegmentEdit(text="first")}, OWNER, db)
+    with pytest.raises(HTTPException) as error:
+        main.apply_segment_edits(task_id, 3, {0: main.SegmentEdit(text="second")}, OWNER, db)
+    assert error.value.status_code == 409
+    assert stored(main, db, task_id).corrected_segments[0]["text"] == "first"
+
+def test_concurrent_edit_loses_the_conditional_write(main, db, monkeypatch):
+    task_id = add_task(main, db)
+    require_editable = main.require_editable
+    def concurrent_write(task):
+        # Another writer commits version 4 after this edit has read version 3
+        db.connection().execute(main.Task.__table__.update().values(version=4, corrected_subtitles="other\n"))
+        require_editable(task)
+    monkeypatch.setattr(main, "require_editable", concurrent_write)
+    with pytest.raises(HTTPException) as error:
+        main.apply_segment_edits(task_id, 3, {0: main.SegmentEdit(text="mine")}, OWNER, db)
+    assert error.value.status_code == 409
+    assert "another edit" in error.value.detail
+    assert stored(main, db, task_id).corrected_subtitles == "other\n"
+
+@pytest.mark.parametrize("status", ["transcribed", "correcting"])
+def test_edits_wait_for_correction_to_finish(main, db, status):
+    task_id = add_task(main, db)
+    stored(main, db, task_id).status = status
+    db.commit()
+    with pytest.raises(HTTPException) as error:
+        main.apply_segment_edits(task_id, 3, {0: main.SegmentEdit(text="x")}, OWNER, db)
+    assert error.value.status_code == 409
+    assert stored(main, db, task_id).version == 3
+
+def test_unknown_segment_and_foreign_task_are_not_found(main, db):
+    task_id = add_task(main, db)
+    for user, edits in [(OWNER, {5: main.SegmentEdit(text="x")}), (AuthUser(id="other"), {0: main.SegmentEdit(text="x")})]:
+        with pytest.raises(HTTPException) as error:
+            main.apply_segment_edits(task_id, 3, edits, user, db)
+        assert error.value.status_code == 404
+    assert stored(main, db, task_id).version == 3
+
+def test_full_subtitle_edit_checks_the_version(main, db):
+    task_id = add_task(main, db)
+    subtitles = "[0.00s -> 2.00s] [SPEAKER_00] 全部重寫\n"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.update_task(task_id, main.TaskUpdate(corrected_subtitles=subtitles), OWNER, db))
+    assert error.value.status_code == 400
+
+    # A segment edit lands first, so a full rewrite based on version 3 is stale
+    main.apply_segment_edits(task_id, 3, {0: main.SegmentEdit(text="first")}, OWNER, db)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.update_task(task_id, main.TaskUpdate(corrected_subtitles=subtitles, version=3), OWNER, db))
+    assert error.value.status_code == 409
+    assert stored(main, db, task_id).corrected_segments[0]["text"] == "first"
+
+    asyncio.run(main.update_task(task_id, main.TaskUpdate(corrected_subtitles=subtitles, version=4), OWNER, db))
+    task = stored(main, db, task_id)
+    assert task.version == 5
+    assert [s["text"] for s in task.corrected_segments] == ["全部重寫"]
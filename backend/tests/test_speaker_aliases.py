@@ -0,0 +1,18 @@
+from logic import apply_speaker_aliases
+
+def test_codes_followed_by_chinese_text_are_renamed():
+    text = "SPEAKER_00說：今天開會。（SPEAKER_01）同意"
+    assert apply_speaker_aliases(text, {"SPEAKER_00": "王小明", "SPEAKER_01": "李四"}) == "王小明說：今天開會。（李四）同意"
+
+def test_longer_codes_are_left_alone():
+    text = "[SPEAKER_1] hi, SPEAKER_10 and SPEAKER_1a"
+    assert apply_speaker_aliases(text, {"SPEAKER_1": "Alice"}) == "[Alice] hi, SPEAKER_10 and SPEAKER_1a"
+
+def test_aliases_are_applied_in_one_pass():
+    # A name that looks like another code is not renamed again
+    aliases = {"SPEAKER_00": "SPEAKER_01", "SPEAKER_01": "Bob"}
+    assert apply_speaker_aliases("SPEAKER_00 SPEAKER_01", aliases) == "SPEAKER_01 Bob"
+
+def test_nothing_to_apply():
+    assert apply_speaker_aliases(None, {"SPEAKER_00": "A"}) is None
+    assert apply_speaker_aliases("SPEAKER_00", {}) == "SPEAKER_00"
@@ -0,0 +1,29 @@
+import pytest
+
+from engines import WhisperEngine, resolve_decoding_options, validate_transcription_options
+
+def test_numbers_and_flags_sent_as_strings_are_normalized():
+    options = validate_transcription_options({"beam_size": "5", "best_of": 3, "temperature_fallback": "false", "vad": 1, "preset": "accurate"})
+    assert options == {"beam_size": 5, "best_of": 3, "temperature_fallback": False, "vad": True, "preset": "accurate"}
+    # The normalized options can be decoded with
+    kwargs = WhisperEngine.decode_kwargs(resolve_decoding_options(options["preset"], beam_size=options["beam_size"]))
+    assert kwargs["beam_size"] == 5
+
+@pytest.mark.parametrize("options", [
+    {"beam_size": "five"},
+    {"beam_size": 0},
+    {"best_of": [5]},
+    {"beam_size": True},
+    {"temperature_fallback": "maybe"},
+    {"engine": ["whisper"]},
+    {"preset": "fastest"},
+    {"preset": {"fast": 1}},
+    {"unknown": 1},
+])
+def test_invalid_options_raise_value_error(options):
+    with pytest.raises(ValueError):
+        validate_transcription_options(options)
+
+def test_options_must_be_an_object():
+    with pytest.raises(ValueError):
+        validate_transcription_options(["beam_size"])
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from vad import SAMPLE_RATE, build_speech_audio, detect_speech_regions, remap_segments, to_original_time
+
+def tone(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+def test_energy_vad_finds_speech_between_silences():
+    audio = np.concatenate([silence(2), tone(1.5), silence(3), tone(1)])
+    regions = detect_speech_regions(audio, backend="energy", padding=0.0)
+    assert len(regions) == 2
+    assert regions[0] == pytest.approx((2.0, 3.5), abs=0.05)
+    assert regions[1] == pytest.approx((6.5, 7.5), abs=0.05)
+
+def test_build_speech_audio_timeline():
+    audio = silence(10)
+    speech, timeline = build_speech_audio(audio, [(2.0, 4.0), (7.0, 8.0)], gap=0.5)
+    # 2 s + gap + 1 s + gap
+    assert len(speech) == int(4.0 * SAMPLE_RATE)
+    assert timeline == [(0.0, 2.0, 2.0), (2.5, 7.0, 1.0)]
+
+def test_build_speech_audio_without_regions():
+    speech, timeline = build_speech_audio(silence(1), [])
+    assert len(speech) == 0 and timeline == []
+
+def test_remap_segments_to_original_times():
+    timeline = [(0.0, 2.0, 2.0), (2.5, 7.0, 1.0)]
+    segments = [
+        {"start": 0.5, "end": 1.5, "text": "a"},
+        {"start": 2.6, "end": 3.4, "text": "b", "words": [{"start": 2.6, "end": 3.0, "word": "b"}]},
+    ]
+    remapped = remap_segments(segments, timeline)
+    assert [(s["start"], s["end"]) for s in remapped] == [(2.5, 3.5), (7.1, 7.9)]
+    assert (remapped[1]["words"][0]["start"], remapped[1]["words"][0]["end"]) == (7.1, 7.5)
+
+def test_times_inside_a_gap_snap_to_the_nearest_region():
+    timeline = [(0.0, 2.0, 2.0), (2.5, 7.0, 1.0)]
+    # 2.2 s lies in the inserted gap: a start snaps forward, an end back
+    assert to_original_time(2.2, timeline, is_start=True) == 7.0
+    assert to_original_time(2.2, timeline) == 4.0
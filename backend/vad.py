@@ -0,0 +1,124 @@
+import os
+import threading
+import numpy as np
+
+from metrics import record_model_cache
+
+SAMPLE_RATE = 16000
+
+# Skip silence before transcription unless a task says otherwise
+VAD_ENABLED = os.getenv("VAD_ENABLED", "0") == "1"
+
+# "energy" needs only numpy; "silero" (pip install silero-vad) also rejects music and noise
+VAD_BACKEND = os.getenv("VAD_BACKEND", "energy")
+
+def detect_speech_energy(audio, sample_rate=SAMPLE_RATE, frame_ms=30, threshold_db=12.0, min_level_db=-55.0):
+    """
+    Marks frames whose energy is `threshold_db` above the recording's noise floor.
+    Returns a list of (start, end) in seconds.
+    """
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return []
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    noise_floor = np.percentile(energy_db, 10)
+    is_speech = energy_db > max(noise_floor + threshold_db, min_level_db)
+
+    regions = []
+    start = None
+    for i, speech in enumerate(is_speech):
+        if speech and start is None:
+            start = i
+        elif not speech and start is not None:
+            regions.append((start * frame / sample_rate, i * frame / sample_rate))
+            start = None
+    if start is not None:
+        regions.append((start * frame / sample_rate, n_frames * frame / sample_rate))
+    return regions
+
+# Loaded once per process; the model keeps recurrent state between chunks,
+# so it is used by one caller at a time
+silero_model = None
+silero_lock = threading.Lock()
+
+def load_silero_model():
+    global silero_model
+    record_model_cache("silero-vad", silero_model is not None)
+    if silero_model is None:
+        from silero_vad import load_silero_vad
+        silero_model = load_silero_vad()
+    return silero_model
+
+def detect_speech_silero(audio, sample_rate=SAMPLE_RATE):
+    from silero_vad import get_speech_timestamps
+    import torch
+
+    with silero_lock:
+        model = load_silero_model()
+        timestamps = get_speech_timestamps(torch.from_numpy(audio), model, sampling_rate=sample_rate, return_seconds=True)
+    return [(ts["start"], ts["end"]) for ts in timestamps]
+
+def detect_speech_regions(audio, sample_rate=SAMPLE_RATE, backend=VAD_BACKEND, min_speech=0.25, min_silence=0.6, padding=0.2):
+    """
+    Returns merged, padded speech regions as a list of (start, end) in seconds.
+    Gaps shorter than `min_silence` are bridged and blips shorter than `min_speech` dropped.
+    """
+    if backend == "silero":
+        raw_regions = detect_speech_silero(audio, sample_rate)
+    else:
+        raw_regions = detect_speech_energy(audio, sample_rate)
+
+    duration = len(audio) / sample_rate
+    regions = []
+    for start, end in raw_regions:
+        start, end = max(0.0, start - padding), min(duration, end + padding)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return [(start, end) for start, end in regions if end - start >= min_speech]
+
+def build_speech_audio(audio, regions, sample_rate=SAMPLE_RATE, gap=0.3):
+    """
+    Concatenates the speech regions with a short silence between them so Whisper
+    still sees segment boundaries. Returns (speech_audio, timeline), where each
+    timeline entry is (compact_start, original_start, duration) in seconds.
+    """
+    silence = np.zeros(int(gap * sample_rate), dtype=audio.dtype)
+    pieces = []
+    timeline = []
+    compact_start = 0.0
+    for start, end in regions:
+        piece = audio[int(start * sample_rate):int(end * sample_rate)]
+        timeline.append((compact_start, start, len(piece) / sample_rate))
+        pieces.extend([piece, silence])
+        compact_start += (len(piece) + len(silence)) / sample_rate
+    if not pieces:
+        return np.zeros(0, dtype=audio.dtype), []
+    return np.concatenate(pieces), timeline
+
+def to_original_time(t, timeline, is_start=False):
+    """
+    Maps a time on the concatenated speech audio back to the original recording.
+    Times that fall into an inserted gap snap to the next region (for starts) or
+    the end of the previous region (for ends).
+    """
+    for i in range(len(timeline) - 1, -1, -1):
+        compact_start, original_start, duration = timeline[i]
+        if t >= compact_start:
+            offset = t - compact_start
+            if offset > duration and is_start and i + 1 < len(timeline):
+                return timeline[i + 1][1]
+            return original_start + min(offset, duration)
+    return timeline[0][1] if timeline else t
+
+def remap_segments(segments, timeline):
+    for segment in segments:
+        segment["start"] = round(to_original_time(segment["start"], timeline, is_start=True), 3)
+        segment["end"] = round(to_original_time(segment["end"], timeline), 3)
+        for word in segment.get("words") or []:
+            word["start"] = round(to_original_time(word["start"], timeline, is_start=True), 3)
+            word["end"] = round(to_original_time(word["end"], timeline), 3)
+    return segments
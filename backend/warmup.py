@@ -0,0 +1,90 @@
+import os
+import logging
+import threading
+import time
+
+import numpy as np
+
+from engines import get_engine, DEFAULT_MODEL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Load models at startup so the first task does not pay for it (0 = load on first use)
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") == "1"
+# Comma-separated model sizes of the default engine to preload
+PRELOAD_MODEL_SIZES = [size.strip() for size in os.getenv("PRELOAD_MODEL_SIZES", DEFAULT_MODEL_SIZE).split(",") if size.strip()]
+# With a Hugging Face token, the diarization pipeline is preloaded too.
+# Pipelines are cached per token, so tasks using this token skip the load.
+PRELOAD_HF_TOKEN = os.getenv("HF_TOKEN")
+
+WARMUP_SECONDS = 1.0
+SAMPLE_RATE = 16000
+
+class Readiness:
+    """
+    Startup state reported by /ready.
+    """
+    def __init__(self):
+        self.ready = False
+        self.models = {} # name -> load + warm-up seconds
+        self.error = None
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def loaded(self, name, seconds):
+        with self.lock:
+            self.models[name] = round(seconds, 3)
+
+    def status(self):
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "models": dict(self.models),
+                "error": self.error,
+                "uptime_seconds": round(time.monotonic() - self.started, 1),
+            }
+
+readiness = Readiness()
+
+def warm_up_transcription(model_size):
+    engine = get_engine()
+    start = time.perf_counter()
+    engine.preload(model_size)
+    # A short inference allocates the runtime's buffers and kernels
+    engine.transcribe(np.zeros(int(WARMUP_SECONDS * SAMPLE_RATE), dtype=np.float32), model_size=model_size)
+    readiness.loaded(f"{engine.name}:{model_size}", time.perf_counter() - start)
+
+def warm_up_diarization(hf_token):
+    import logic
+    start = time.perf_counter()
+    with logic.diarization_lock:
+        pipeline = logic.load_diarization_pipeline(hf_token)
+        if pipeline is None:
+            raise RuntimeError("Could not load the diarization pipeline. Check HF_TOKEN.")
+        import torch
+        pipeline({"waveform": torch.zeros(1, int(WARMUP_SECONDS * SAMPLE_RATE)), "sample_rate": SAMPLE_RATE})
+    readiness.loaded("diarization", time.perf_counter() - start)
+
+def warm_up_models(transcription_lock):
+    """
+    Loads and warms up the configured models, then marks the process ready.
+    Holds the transcription lock, so tasks arriving meanwhile wait for the
+    models instead of loading them a second time.
+    """
+    if not PRELOAD_MODELS:
+        readiness.ready = True
+        return
+    try:
+        with transcription_lock:
+            for model_size in PRELOAD_MODEL_SIZES:
+                logger.info(f"Preloading transcription model {model_size}...")
+                warm_up_transcription(model_size)
+            if PRELOAD_HF_TOKEN:
+                logger.info("Preloading diarization pipeline...")
+                warm_up_diarization(PRELOAD_HF_TOKEN)
+        readiness.ready = True
+        logger.info(f"Models ready: {readiness.models}")
+    except Exception as e:
+        # Stay unready so the instance is not put into rotation
+        readiness.error = str(e)
+        logger.exception("Model warm-up failed")
@@ -0,0 +1,183 @@
+"""
+Benchmarks the transcription pipeline on synthetic multi-speaker recordings.
+
+For each duration, a deterministic conversation is generated (see
+synthetic_audio.py) and the following are timed:
+  - transcribe_audio per model size (real-time factor; the model is loaded first)
+  - diarize_audio (only with --hf-token or HF_TOKEN)
+  - merge_diarization_with_transcript, format_segments, parse_corrected_segments
+    and VTT generation, on synthetic segments matching the recording length
+
+Tones give the transcriber little to decode; pass --fixtures with real speech
+clips for representative transcription timings. Results are written as JSON;
+--compare prints the change against an earlier result file.
+
+Usage:
+    python benchmarks/bench_pipeline.py --durations 60 600 --model-sizes tiny base
+    python benchmarks/bench_pipeline.py --skip-transcribe --compare benchmarks/results/pipeline-old.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "frontend"))
+
+from synthetic_audio import generate_conversation, transcript_segments, load_clip, write_wav
+
+def time_call(function, repeat):
+    """
+    Runs `function` `repeat` times. Returns timings in seconds and the last result.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return {"median": statistics.median(timings), "min": min(timings), "runs": repeat}, result
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit or None,
+    }
+
+def bench_text_stages(turns, diarization, duration, repeat):
+    from logic import merge_diarization_with_transcript, format_segments, parse_corrected_segments
+    from exports import generate_vtt
+
+    segments = transcript_segments(turns, seed=int(duration))
+    # The merge writes speakers into the segments, so every run gets fresh copies
+    merge_timing, merged = time_call(lambda: merge_diarization_with_transcript([dict(s) for s in segments], diarization), repeat)
+    format_timing, subtitles = time_call(lambda: format_segments(merged), repeat)
+    parse_timing, parsed = time_call(lambda: parse_corrected_segments(subtitles), repeat)
+    vtt_timing, _ = time_call(lambda: generate_vtt(merged), repeat)
+    if len(parsed) != len(merged):
+        print(f"Warning: parse_corrected_segments returned {len(parsed)} of {len(merged)} segments")
+    return {
+        "segments": len(segments),
+        "merge_diarization_with_transcript": merge_timing,
+        "format_segments": format_timing,
+        "parse_corrected_segments": parse_timing,
+        "generate_vtt": vtt_timing,
+    }
+
+def run(durations, model_sizes, engine, num_speakers, fixtures, hf_token, skip_transcribe, repeat, seed, output):
+    results = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "environment": environment(),
+        "settings": {"engine": engine, "model_sizes": model_sizes, "num_speakers": num_speakers, "fixtures": fixtures, "repeat": repeat, "seed": seed},
+        "load_seconds": {},
+        "recordings": [],
+    }
+    fixture_clips = [load_clip(path) for path in fixtures] or None
+
+    if not skip_transcribe:
+        from engines import get_engine
+        from logic import load_whisper_model
+        transcription_engine = get_engine(engine)
+        for model_size in model_sizes:
+            start = time.perf_counter()
+            if transcription_engine.name == "whisper":
+                load_whisper_model(model_size)
+            else:
+                transcription_engine.load_model(model_size)
+            results["load_seconds"][model_size] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for duration in durations:
+            audio, turns = generate_conversation(duration, num_speakers, seed + int(duration), fixture_clips)
+            path = os.path.join(workdir, f"conversation-{int(duration)}s.wav")
+            write_wav(path, audio)
+            entry = {"duration": duration, "speaker_turns": len(turns), "transcribe": {}}
+
+            if not skip_transcribe:
+                from logic import transcribe_audio
+                for model_size in model_sizes:
+                    timing, result = time_call(lambda: transcribe_audio(path, engine=engine, model_size=model_size), 1)
+                    entry["transcribe"][model_size] = {
+                        "seconds": timing["median"],
+                        "rtf": timing["median"] / duration,
+                        "segments": len(result["segments"]),
+                    }
+                    print(f"{duration:.0f}s: transcribe {model_size} RTF {timing['median'] / duration:.3f}")
+
+            diarization = turns
+            if hf_token:
+                from logic import diarize_audio
+                timing, diarization = time_call(lambda: diarize_audio(path, hf_token, num_speakers), 1)
+                entry["diarize"] = {"seconds": timing["median"], "rtf": timing["median"] / duration, "turns": len(diarization)}
+                print(f"{duration:.0f}s: diarize RTF {timing['median'] / duration:.3f}")
+                # An empty result means the pipeline could not run; keep the ground truth for the merge
+                diarization = diarization or turns
+
+            entry["text"] = bench_text_stages(turns, diarization, duration, repeat)
+            print(f"{duration:.0f}s: " + ", ".join(
+                f"{name} {value['median'] * 1000:.2f}ms" for name, value in entry["text"].items() if isinstance(value, dict)
+            ))
+            results["recordings"].append(entry)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+    return results
+
+def flatten_timings(results):
+    """
+    {"600s transcribe tiny": seconds, "600s generate_vtt": seconds, ...} for comparisons.
+    """
+    timings = {}
+    for entry in results["recordings"]:
+        prefix = f"{entry['duration']:.0f}s"
+        for model_size, value in entry.get("transcribe", {}).items():
+            timings[f"{prefix} transcribe {model_size}"] = value["seconds"]
+        if "diarize" in entry:
+            timings[f"{prefix} diarize"] = entry["diarize"]["seconds"]
+        for name, value in entry["text"].items():
+            if isinstance(value, dict):
+                timings[f"{prefix} {name}"] = value["median"]
+    return timings
+
+def compare(baseline_path, results):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = flatten_timings(json.load(f))
+    current = flatten_timings(results)
+    print(f"Compared with {baseline_path} (ratio < 1 is faster):")
+    for name, seconds in current.items():
+        if baseline.get(name):
+            print(f"  {name}: {baseline[name] * 1000:.3f}ms -> {seconds * 1000:.3f}ms ({seconds / baseline[name]:.2f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", nargs="+", type=float, default=[60, 600], help="Recording lengths in seconds")
+    parser.add_argument("--model-sizes", nargs="+", default=["tiny"])
+    parser.add_argument("--engine", default=None, help="Transcription engine (default: TRANSCRIPTION_ENGINE)")
+    parser.add_argument("--num-speakers", type=int, default=2)
+    parser.add_argument("--fixtures", nargs="*", default=[], help="Speech clips used for the speaker turns instead of tones")
+    parser.add_argument("--hf-token", default=os.getenv("HF_TOKEN"), help="Enables the diarization benchmark")
+    parser.add_argument("--skip-transcribe", action="store_true", help="Only run the diarization and text-processing benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per text-processing benchmark (the median is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", f"pipeline-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"))
+    args = parser.parse_args()
+    results = run(args.durations, args.model_sizes, args.engine, args.num_speakers, args.fixtures, args.hf_token, args.skip_transcribe, args.repeat, args.seed, args.output)
+    if args.compare:
+        compare(args.compare, results)
@@ -0,0 +1,98 @@
+"""
+Compares the fp32 and dynamic-int8 PyTorch Whisper models on CPU.
+
+For every audio file given, reports the real-time factor (transcription time /
+audio duration) of both models and, when a reference transcript exists next to
+the audio (same name, .txt), the error rate of each. Word error rate is used for
+space-separated languages and character error rate otherwise (e.g. Mandarin).
+
+Usage:
+    python benchmarks/bench_quantization.py audio1.wav audio2.mp3 --model-size base
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+def error_rate(reference, hypothesis):
+    """
+    Levenshtein distance between token sequences divided by the reference length.
+    """
+    ref_tokens = reference.split() if " " in reference.strip() else list(reference.replace(" ", ""))
+    hyp_tokens = hypothesis.split() if " " in reference.strip() else list(hypothesis.replace(" ", ""))
+    if not ref_tokens:
+        return 0.0 if not hyp_tokens else 1.0
+
+    previous = list(range(len(hyp_tokens) + 1))
+    for i, ref_token in enumerate(ref_tokens, 1):
+        current = [i] + [0] * len(hyp_tokens)
+        for j, hyp_token in enumerate(hyp_tokens, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_token != hyp_token)
+            )
+        previous = current
+    return previous[-1] / len(ref_tokens)
+
+def run(audio_paths, model_size, num_threads, output):
+    import whisper
+    from logic import load_whisper_model, configure_torch_threads
+
+    configure_torch_threads(num_threads=num_threads)
+
+    results = {
+        "benchmark": "quantization",
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "model_size": model_size,
+        "num_threads": num_threads,
+        "files": [],
+    }
+
+    for mode in [None, "int8"]:
+        start = time.perf_counter()
+        load_whisper_model(model_size, quantize=mode)
+        results[f"load_seconds_{mode or 'fp32'}"] = time.perf_counter() - start
+
+    for path in audio_paths:
+        audio = whisper.load_audio(path)
+        duration = len(audio) / whisper.audio.SAMPLE_RATE
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        reference = open(reference_path, encoding="utf-8").read() if os.path.exists(reference_path) else None
+
+        entry = {"file": path, "duration": duration}
+        for mode in [None, "int8"]:
+            label = mode or "fp32"
+            model = load_whisper_model(model_size, quantize=mode)
+            start = time.perf_counter()
+            result = model.transcribe(audio, fp16=False)
+            elapsed = time.perf_counter() - start
+            entry[label] = {
+                "seconds": elapsed,
+                "rtf": elapsed / duration if duration else None,
+                "error_rate": error_rate(reference, result["text"]) if reference else None,
+            }
+        entry["speedup"] = entry["fp32"]["seconds"] / entry["int8"]["seconds"]
+        if reference:
+            entry["error_rate_delta"] = entry["int8"]["error_rate"] - entry["fp32"]["error_rate"]
+        results["files"].append(entry)
+        print(f"{path}: fp32 RTF {entry['fp32']['rtf']:.3f}, int8 RTF {entry['int8']['rtf']:.3f}, speedup {entry['speedup']:.2f}x")
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", nargs="+", help="Audio files to transcribe")
+    parser.add_argument("--model-size", default="tiny")
+    parser.add_argument("--num-threads", type=int, default=0, help="torch.set_num_threads (0 = default)")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", f"quantization-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"))
+    args = parser.parse_args()
+    run(args.audio, args.model_size, args.num_threads, args.output)
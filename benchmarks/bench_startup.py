@@ -0,0 +1,103 @@
+"""
+Measures backend startup: the time to import the FastAPI app (`import main`),
+the process RSS afterwards, and which heavy ML/LLM modules were imported.
+
+Each run is a fresh interpreter in a temporary directory (SQLite database,
+no model preloading unless --warmup). With --warmup, the model warm-up
+(see warmup.py) is run too and timed separately, which shows the cost a
+worker pays before it reports ready.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 3 --warmup
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BACKEND_DIR = os.path.abspath(os.path.join(ROOT, "backend"))
+
+HEAVY_MODULES = ["torch", "whisper", "faster_whisper", "pyannote.audio", "google.generativeai", "grpc", "supabase"]
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = """
+import json, sys, time, threading
+start = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import main
+import_seconds = time.perf_counter() - start
+
+def rss_mb():
+    # Current RSS on Linux, peak RSS elsewhere
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+result = {{"import_seconds": import_seconds, "rss_mb": rss_mb()}}
+result["heavy_modules"] = [m for m in {heavy!r} if m in sys.modules]
+if {warmup!r}:
+    import warmup
+    start = time.perf_counter()
+    warmup.warm_up_models(threading.Lock())
+    result["warmup_seconds"] = time.perf_counter() - start
+    result["warmup_ready"] = warmup.readiness.ready
+    result["rss_mb_after_warmup"] = rss_mb()
+print(json.dumps(result))
+"""
+
+def probe(warmup):
+    env = dict(os.environ)
+    env["PRELOAD_MODELS"] = "1" if warmup else "0"
+    env["DATABASE_PASSWORD"] = "" # SQLite in the temporary directory
+    env.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    env.setdefault("SUPABASE_KEY", "startup-benchmark")
+    code = PROBE.format(backend=BACKEND_DIR, heavy=HEAVY_MODULES, warmup=warmup)
+    with tempfile.TemporaryDirectory() as workdir:
+        output = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def run(runs, warmup, output):
+    samples = [probe(warmup) for _ in range(runs)]
+    results = {
+        "benchmark": "startup",
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "runs": runs,
+        "import_seconds": statistics.median(s["import_seconds"] for s in samples),
+        "rss_mb": statistics.median(s["rss_mb"] for s in samples),
+        "heavy_modules": samples[-1]["heavy_modules"],
+        "samples": samples,
+    }
+    print(f"import main: {results['import_seconds']:.2f}s, RSS {results['rss_mb']:.0f} MB, heavy modules: {', '.join(results['heavy_modules']) or 'none'}")
+    if warmup:
+        results["warmup_seconds"] = statistics.median(s["warmup_seconds"] for s in samples)
+        results["rss_mb_after_warmup"] = statistics.median(s["rss_mb_after_warmup"] for s in samples)
+        print(f"warm-up: {results['warmup_seconds']:.2f}s, RSS {results['rss_mb_after_warmup']:.0f} MB")
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start (the median is reported)")
+    parser.add_argument("--warmup", action="store_true", help="Also run and time the model warm-up")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", f"startup-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"))
+    args = parser.parse_args()
+    run(args.runs, args.warmup, args.output)
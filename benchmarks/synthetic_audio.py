@@ -0,0 +1,98 @@
+"""
+Deterministic multi-speaker test audio, without TTS.
+
+Each speaker is a voiced-sounding tone (its own pitch and harmonics, amplitude
+modulated at a syllable-like rate) over background noise. Fixture clips (real
+speech recordings) can be mixed in so the transcriber has something to decode.
+The same seed always gives the same audio and the same ground truth.
+"""
+import os
+import random
+import subprocess
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+SPEAKER_PITCHES = [110.0, 210.0, 150.0, 260.0, 95.0, 180.0]
+SYLLABLE_RATE = 4.0 # Hz
+NOISE_LEVEL = 0.01
+# Placeholder transcript text for the text-processing benchmarks
+SAMPLE_TEXT = "今天的會議討論專案進度預算與下一季的產品規劃請大家準備報告"
+
+def load_clip(path):
+    """
+    Decodes any audio file to 16 kHz mono float32 with ffmpeg.
+    """
+    output = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+        capture_output=True, check=True
+    ).stdout
+    return np.frombuffer(output, dtype=np.int16).astype(np.float32) / 32768.0
+
+def speaker_tone(speaker, seconds, rng):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = SPEAKER_PITCHES[speaker % len(SPEAKER_PITCHES)]
+    # Slow vibrato keeps it from being a pure stationary tone
+    phase = 2 * np.pi * pitch * t + 0.5 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 2 * np.pi))
+    voice = sum(np.sin(k * phase) / k for k in range(1, 5))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * SYLLABLE_RATE * t + rng.uniform(0, 2 * np.pi)))
+    return (0.2 * voice * envelope).astype(np.float32)
+
+def generate_conversation(seconds, num_speakers=2, seed=0, fixture_clips=None, min_turn=2.0, max_turn=12.0):
+    """
+    Returns (audio, turns) where turns is the ground truth
+    [{"start", "end", "speaker"}] in the diarization result shape.
+    Fixture clips, if given, are used in turn instead of tones (cut to the turn length).
+    """
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    total = int(seconds * SAMPLE_RATE)
+    audio = (NOISE_LEVEL * rng.standard_normal(total)).astype(np.float32)
+    turns = []
+    position = 0.0
+    speaker = 0
+    while position < seconds:
+        length = min(picker.uniform(min_turn, max_turn), seconds - position)
+        if fixture_clips:
+            clip = fixture_clips[len(turns) % len(fixture_clips)][:int(length * SAMPLE_RATE)]
+        else:
+            clip = speaker_tone(speaker, length, rng)
+        start = int(position * SAMPLE_RATE)
+        audio[start:start + len(clip)] += clip[:total - start]
+        turns.append({"start": round(position, 3), "end": round(position + length, 3), "speaker": f"SPEAKER_{speaker:02d}"})
+        # Short pause, then usually another speaker
+        position += length + picker.uniform(0.2, 1.0)
+        if num_speakers > 1 and picker.random() < 0.8:
+            speaker = (speaker + picker.randrange(1, num_speakers)) % num_speakers
+    return np.clip(audio, -1.0, 1.0), turns
+
+def transcript_segments(turns, segment_seconds=3.0, seed=0):
+    """
+    Whisper-shaped segments covering the turns, with placeholder text and
+    boundaries that do not line up exactly with the speaker changes.
+    """
+    picker = random.Random(seed)
+    segments = []
+    for turn in turns:
+        position = turn["start"] + picker.uniform(0, 0.3)
+        while position < turn["end"]:
+            end = min(position + picker.uniform(0.5, 1.5) * segment_seconds, turn["end"] + 0.2)
+            offset = picker.randrange(len(SAMPLE_TEXT))
+            text = (SAMPLE_TEXT[offset:] + SAMPLE_TEXT)[:max(4, int((end - position) * 4))]
+            segments.append({"id": len(segments), "start": round(position, 2), "end": round(end, 2), "text": text})
+            position = end
+    return segments
+
+def write_wav(path, audio):
+    """
+    Writes 16-bit PCM. `path` may also be a binary file object.
+    """
+    if isinstance(path, str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((audio * 32767).astype(np.int16).tobytes())
@@ -9,82 +9,29 @@ import time
 import io
 import zipfile
 
+from exports import generate_vtt, convert_summary_to_vtt
+
 st.set_page_config(page_title="Whisper & Gemini POC", layout="wide")
 
 # --- Helper Functions ---
 def get_backend_url():
     return "http://localhost:8000"
 
-def generate_vtt(segments):
-    if not segments:
-        return "WEBVTT\n\n"
-    vtt_content = "WEBVTT\n\n"
-    for seg in segments:
-        start = seg['start']
-        end = seg['end']
-        text = seg['text']
-        speaker = seg.get('speaker', '')
-        
-        # Format time: HH:MM:SS.mmm
-        def format_time(seconds):
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = seconds % 60
-            return f"{hours:02}:{minutes:02}:{secs:06.3f}"
-        
-        start_str = format_time(start)
-        end_str = format_time(end)
-        
-        if speaker:
-            text = f"[{speaker}] {text}"
-            
-        vtt_content += f"{start_str} --> {end_str}\n{text}\n\n"
-    return vtt_content
+def auth_headers():
+    """
+    The backend identifies the user by the Supabase access token from /login.
+    """
+    return {"Authorization": f"Bearer {st.session_state.user['access_token']}"}
 
-def convert_summary_to_vtt(summary_text):
+def format_progress(progress):
     """
-    Converts summary text with timestamps [start -> end] to VTT format.
+    e.g. "correcting 20/57" for the task's `progress` field.
     """
-    if not summary_text:
-        return "WEBVTT\n\n"
-        
-    vtt_content = "WEBVTT\n\n"
-    import re
-    
-    # Regex to find timestamps: [0.00s -> 5.00s] or [0.00 -> 5.00]
-    pattern = re.compile(r'\[\s*(\d+\.?\d*)\s*s?\s*->\s*(\d+\.?\d*)\s*s?\s*\]\s*(.*)')
-    
-    lines = summary_text.strip().split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line: continue
-        
-        match = pattern.match(line)
-        if match:
-            start_sec = float(match.group(1))
-            end_sec = float(match.group(2))
-            text = match.group(3).strip()
-            
-            # Format time: HH:MM:SS.mmm
-            def format_time(seconds):
-                hours = int(seconds // 3600)
-                minutes = int((seconds % 3600) // 60)
-                secs = seconds % 60
-                return f"{hours:02}:{minutes:02}:{secs:06.3f}"
-            
-            start_str = format_time(start_sec)
-            end_str = format_time(end_sec)
-            
-            vtt_content += f"{start_str} --> {end_str}\n{text}\n\n"
-        else:
-            # If line doesn't match timestamp format, maybe just append it as a note or skip
-            # For VTT, we need timestamps. If no timestamp, we can't really place it.
-            # But we could append it to the previous cue if we wanted, or just ignore.
-            # Let's try to be safe: if it looks like text, maybe give it a dummy timestamp or skip.
-            # For now, we only convert lines with timestamps.
-            pass
-            
-    return vtt_content
+    if not progress:
+        return ""
+    if progress.get('total'):
+        return f"{progress['stage']} {progress.get('completed', 0)}/{progress['total']}"
+    return progress.get('stage', "")
 
 def add_task_to_zip(zip_file, task, folder_prefix=""):
     """
@@ -420,6 +367,26 @@ if num_speakers_input.strip():
             st.sidebar.error("Number of speakers must be between 1 and 10.")
     except ValueError:
         st.sidebar.error("Please enter a valid number.")
+engine_choice = st.sidebar.selectbox("Transcription Engine", ["Default", "whisper", "faster-whisper"], help="faster-whisper (CTranslate2, int8) is usually several times faster on CPU.")
+engine = None if engine_choice == "Default" else engine_choice
+preset_choice = st.sidebar.selectbox("Decoding Preset", ["Default", "fast", "balanced", "accurate"], help="fast: greedy, no temperature fallback. accurate: beam search with fallback. Default uses your saved preference.")
+preset = None if preset_choice == "Default" else preset_choice
+language = st.sidebar.text_input("Language (Optional)", value="", help="e.g. 'zh' or 'en'. Setting it skips automatic language detection.").strip() or None
+vad_choice = st.sidebar.selectbox("Skip silence (VAD)", ["Default", "On", "Off"], help="Detect speech first and only transcribe those parts. Faster on recordings with long pauses and avoids hallucinated text in silence. Default uses your saved preference or the server setting.")
+vad = {"On": True, "Off": False}.get(vad_choice)
+if st.sidebar.button("Save as my default", help="Use this engine, preset, language and VAD setting for all new tasks."):
+    try:
+        pref_resp = requests.put(
+            f"{get_backend_url()}/users/{st.session_state.user['id']}/preferences",
+            json={"transcription_options": {"engine": engine, "preset": preset, "language": language, "vad": vad}},
+            headers=auth_headers()
+        )
+        if pref_resp.status_code == 200:
+            st.sidebar.success("Default saved.")
+        else:
+            st.sidebar.error(f"Failed to save default: {pref_resp.text}")
+    except Exception as e:
+        st.sidebar.error(f"Connection error: {str(e)}")
 st.sidebar.markdown("[Get your API Key here](https://aistudio.google.com/api-keys)")
 
 # --- Page: Home ---
@@ -434,7 +401,7 @@ elif page == "API Doc":
     
     st.info(f"**Base URL**: `{get_backend_url()}`")
     
-    st.warning("⚠️ **Authentication**: 本系統目前使用 `user_id` (UUID) 進行用戶識別與資料隔離。請確保在請求中包含正確的 `user_id`。")
+    st.warning("⚠️ **Authentication**: 除 `/register` 與 `/login` 外，所有請求需帶上 `Authorization: Bearer <access_token>` 標頭 (`access_token` 由 `POST /login` 回傳)。伺服器在本地驗證 Supabase 簽發的 token，並由其中的用戶 ID 與角色進行資料隔離；token 過期後回傳 `401`，請重新登入。")
     
     st.header("1. 上傳與處理 (Upload & Process)")
     st.markdown("**Endpoint**: `POST /process`")
@@ -443,45 +410,74 @@ elif page == "API Doc":
     st.subheader("請求參數 (Request Parameters)")
     st.markdown("""
     - `file`: (File, Required) 要處理的音頻文件 (mp3, wav, m4a, mp4)。
-    - `user_id`: (String, Required) 用戶的 UUID (從 Supabase Auth 獲取)。
     - `api_key`: (String, Required) Google Gemini API Key。
     - `hf_token`: (String, Optional) Hugging Face Token (用於說話者區分)。
     - `num_speakers`: (Integer, Optional) 指定說話者人數。
+    - `engine`: (String, Optional) 轉錄引擎：`whisper` 或 `faster-whisper` (CPU 上較快)。預設依伺服器設定。
+    - `preset`: (String, Optional) 解碼預設：`fast` (貪婪解碼、無溫度回退)、`balanced`、`accurate` (beam search)。
+    - `language`: (String, Optional) 語言代碼 (例如 `zh`)，指定後略過語言偵測。
+    - `beam_size` / `best_of`: (Integer, Optional) 覆寫預設的解碼參數。
+    - `temperature_fallback`: (Boolean, Optional) 是否在結果不佳時以較高溫度重新解碼。
+    - `vad`: (Boolean, Optional) 先偵測語音區段，只轉錄有人說話的部分 (時間戳記會對應回原始音檔)。
+    - `streaming_decode`: (Boolean, Optional) 分段串流解碼長音檔以限制記憶體用量 (預設依音檔長度自動判斷)。
+    - `correction_mode`: (String, Optional) `selective` (本地簡轉繁，只將低信心段落送 LLM 修正) 或 `full` (整份逐字稿送 LLM)。
+    - `summary_mode`: (String, Optional) `auto` (預設，長錄音自動分段)、`single` (單次摘要) 或 `hierarchical` (依時段分段並行摘要後再彙整；各段摘要會快取，編輯後重新生成只會重做受影響的時段)。
+    - `pipeline_mode`: (String, Optional) `separate` (預設，錯字修正與摘要分兩次呼叫 LLM) 或 `combined` (以單次呼叫同時取得修正結果與摘要，逐字稿只上傳一次；僅適用於單次摘要，長錄音的分段摘要仍分開執行)。
+    
+    未指定的參數會使用 `PUT /users/{user_id}/preferences` 儲存的個人預設值，例如 `{"transcription_options": {"preset": "fast", "language": "zh"}}`。
     """)
     
     st.code("""
 import requests
 
 url = "http://localhost:8000/process"
+headers = {"Authorization": "Bearer YOUR_ACCESS_TOKEN"} # From POST /login
 files = {'file': open('audio.mp3', 'rb')}
 data = {
-    'user_id': 'YOUR_USER_UUID', # Required
     'api_key': 'YOUR_GEMINI_API_KEY',
     'hf_token': 'YOUR_HF_TOKEN', # Optional
     'num_speakers': 2 # Optional
 }
 
-response = requests.post(url, files=files, data=data)
+response = requests.post(url, files=files, data=data, headers=headers)
 print(response.json())
 # Output: {'task_id': 1, 'message': 'Processing started in background'}
     """, language="python")
 
+    st.subheader("批次上傳 (Batch Upload)")
+    st.markdown("**Endpoint**: `POST /process/batch`")
+    st.markdown("""
+    一次請求上傳多個音檔 (`files`，可重複)，或以 `manifest` (JSON 列表，`[{"filename": "a.mp3", "audio_path": "media/xxx.mp3"}]`) 指定已上傳至伺服器的檔案。
+    所有任務會在同一個交易中建立並一起排入處理，其餘參數與 `/process` 相同。
+    """)
+    
+    st.code("""
+files = [
+    ('files', open('meeting1.mp3', 'rb')),
+    ('files', open('meeting2.mp3', 'rb')),
+]
+data = {'api_key': 'YOUR_GEMINI_API_KEY'}
+
+response = requests.post("http://localhost:8000/process/batch", files=files, data=data, headers=headers)
+print(response.json())
+# Output: {'task_ids': [1, 2], 'message': '2 tasks started in background'}
+    """, language="python")
+
     st.divider()
 
     st.header("2. 獲取任務列表 (Get Tasks)")
     st.markdown("**Endpoint**: `GET /tasks`")
-    st.markdown("獲取指定用戶的所有任務列表。")
+    st.markdown("獲取目前登入用戶的所有任務列表 (管理員可看到所有用戶的任務)。")
     
     st.subheader("請求參數 (Query Parameters)")
     st.markdown("""
-    - `user_id`: (String, Required) 用戶的 UUID。
     - `skip`: (Integer, Default=0) 跳過的筆數。
     - `limit`: (Integer, Default=100) 返回的筆數限制。
+    - `apply_aliases`: (Boolean, Default=false) 回傳時套用說話者名稱 (同 `GET /tasks/{task_id}`)。
     """)
     
     st.code("""
-user_id = "YOUR_USER_UUID"
-response = requests.get(f"http://localhost:8000/tasks?user_id={user_id}&limit=5")
+response = requests.get("http://localhost:8000/tasks", params={"limit": 5}, headers=headers)
 print(response.json())
     """, language="python")
 
@@ -490,10 +486,17 @@ print(response.json())
     st.header("3. 獲取任務詳情 (Get Task Details)")
     st.markdown("**Endpoint**: `GET /tasks/{task_id}`")
     st.markdown("獲取指定任務的詳細資訊，包括轉錄結果、字幕和摘要。")
+    st.markdown("""
+    - `apply_aliases`: (Boolean, Default=false) 回傳時將 `speaker_aliases` 中的說話者名稱套用至文本與字幕。
+
+    處理中的任務會在 `progress` 欄位回報目前 LLM 階段的進度 (例如 `{"stage": "correcting", "completed": 20, "total": 57}`)；修正結果以串流方式分批寫入 `corrected_segments`，摘要也會在生成過程中逐步更新。
+
+    回傳的 `llm_usage` 記錄 LLM 階段統計：`correction` (送往 LLM 的段落數) 與 `summary` (精簡格式與原格式的估計 token 數、節省比例，以及 Gemini 回報的實際 token 數)。
+    """)
     
     st.code("""
 task_id = 1
-response = requests.get(f"http://localhost:8000/tasks/{task_id}")
+response = requests.get(f"http://localhost:8000/tasks/{task_id}", params={"apply_aliases": True}, headers=headers)
 task = response.json()
 
 print(f"Status: {task['status']}")
@@ -509,9 +512,10 @@ print(f"Summary: {task['summary']}")
     
     st.subheader("請求主體 (JSON Body)")
     st.markdown("""
-    - `corrected_subtitles`: (String, Optional) 修正後的字幕文本。
+    - `corrected_subtitles`: (String, Optional) 修正後的字幕文本。需同時提供 `version`。
+    - `version`: (Integer, 提供 `corrected_subtitles` 時必填) 讀取任務時的 `version`。若任務已被其他編輯修改或錯字修正尚未完成，回傳 `409 Conflict`。
     - `summary`: (String, Optional) 修正後的摘要。
-    - `speaker_map`: (Dictionary, Optional) 說話者映射，例如 `{"SPEAKER_00": "Alice"}`。
+    - `speaker_map`: (Dictionary, Optional) 說話者映射，例如 `{"SPEAKER_00": "Alice"}`。名稱儲存於 `speaker_aliases`，於顯示/匯出時套用 (原文保留說話者代碼)；將名稱設回代碼即可取消。
     - `regenerate_summary`: (Boolean, Optional) 是否重新生成摘要 (需提供 `api_key`)。
     - `api_key`: (String, Optional) 用於重新生成的 API Key。
     """)
@@ -523,10 +527,69 @@ payload = {
     "regenerate_summary": True,
     "api_key": "YOUR_GEMINI_API_KEY"
 }
-response = requests.put(url, json=payload)
+response = requests.put(url, json=payload, headers=headers)
 print(response.json())
     """, language="python")
 
+    st.divider()
+
+    st.header("5. 編輯字幕段落 (Patch Segments)")
+    st.markdown("**Endpoint**: `PATCH /tasks/{task_id}/segments/{index}` 或 `PATCH /tasks/{task_id}/segments` (批次)")
+    st.markdown("只更新被修改的段落，`corrected_subtitles` 與 `corrected_transcription` 會自動同步。")
+    
+    st.subheader("請求主體 (JSON Body)")
+    st.markdown("""
+    - `version`: (Integer, Required) 讀取任務時的 `version`。若任務已被其他編輯修改，回傳 `409 Conflict`，請重新讀取後再試。錯字修正完成前 (狀態為 `pending`、`transcribing`、`transcribed` 或 `correcting`) 的編輯同樣回傳 `409`，因為修正結果會覆寫段落。
+    - `text` / `speaker` / `start` / `end`: (Optional) 要修改的欄位。
+    - `edits`: (List, 批次版本) 每一項包含 `index` 與要修改的欄位。
+    """)
+    
+    st.code("""
+url = f"http://localhost:8000/tasks/{task_id}/segments"
+payload = {
+    "version": task["version"],
+    "edits": [
+        {"index": 3, "text": "修正後的文字"},
+        {"index": 7, "text": "另一段修正"}
+    ]
+}
+response = requests.patch(url, json=payload, headers=headers)
+print(response.json())
+# Output: {'message': 'Segments updated successfully', 'version': 2, 'segments': {...}}
+    """, language="python")
+
+    st.divider()
+
+    st.header("6. 即時串流轉錄 (Live Streaming)")
+    st.markdown("**Endpoint**: `WebSocket /ws/transcribe`")
+    st.markdown("以 WebSocket 傳送即時音訊 (16 kHz mono s16le PCM 或 Opus/WebM/Ogg)，伺服器會持續回傳暫定 (`partial`) 與確定 (`final`) 的字幕段落。確定段落的時間戳記不會再變動。結束後會建立一般任務，並在背景進行錯字修正與摘要。")
+    st.markdown("限制：即時轉錄與上傳檔案的轉錄共用同一個 Whisper 模型與轉錄鎖，有檔案正在轉錄時，即時字幕會暫停更新直到該檔案完成。無法解碼的音訊串流或轉錄錯誤會以 `1011` 關閉連線，並刪除未完成的錄音。")
+    
+    st.code("""
+import json
+from websockets.sync.client import connect
+
+with connect("ws://localhost:8000/ws/transcribe") as ws:
+    ws.send(json.dumps({
+        "event": "start",
+        "access_token": "YOUR_ACCESS_TOKEN",
+        "api_key": "YOUR_GEMINI_API_KEY",
+        "format": "pcm",        # pcm / opus / webm / ogg
+        "sample_rate": 16000,
+        "language": "zh"        # Optional
+    }))
+    for frame in pcm_frames:    # bytes
+        ws.send(frame)
+    ws.send(json.dumps({"event": "stop"}))
+
+    for message in ws:
+        data = json.loads(message)
+        print(data["type"], data.get("segments"))
+        if data["type"] == "completed":
+            print("Task ID:", data["task_id"])
+            break
+    """, language="python")
+
 
 
 # --- Page: New Task ---
@@ -575,7 +638,8 @@ if page == "New Task":
                 
                 for tid in batch_tasks:
                     try:
-                        resp = requests.get(f"{get_backend_url()}/tasks/{tid}")
+                        # Speaker names are applied by the backend; this view only displays the task
+                        resp = requests.get(f"{get_backend_url()}/tasks/{tid}", params={"apply_aliases": True}, headers=auth_headers())
                         if resp.status_code == 200:
                             t_data = resp.json()
                             current_batch_data.append(t_data)
@@ -602,7 +666,8 @@ if page == "New Task":
                 # 2. Update List View
                 if current_batch_data:
                     df_batch = pd.DataFrame(current_batch_data)
-                    df_batch = df_batch[['filename', 'status']]
+                    df_batch['progress'] = [format_progress(t.get('progress')) for t in current_batch_data]
+                    df_batch = df_batch[['filename', 'status', 'progress']]
                     list_container.dataframe(df_batch, width="stretch", hide_index=True)
 
                 # 3. Update Detail View (Active Task)
@@ -654,30 +719,35 @@ if page == "New Task":
                     st.error("Please enter your Google Gemini API Key in the sidebar.")
                 else:
                     try:
-                        batch_ids = []
-                        progress_bar = st.progress(0)
-                        
-                        for i, uploaded_file in enumerate(uploaded_files):
-                            files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
-                            data = {
-                                "api_key": api_key, 
-                                "hf_token": hf_token,
-                                "user_id": st.session_state.user['id'],
-                                "username": st.session_state.user['username']
-                            }
-                            if num_speakers:
-                                data["num_speakers"] = num_speakers
+                        # Send all files in one request; the backend creates every task at once
+                        files = []
+                        for uploaded_file in uploaded_files:
                             uploaded_file.seek(0)
-                            
-                            response = requests.post(f"{get_backend_url()}/process", files=files, data=data)
-                            
-                            if response.status_code == 200:
-                                task_data = response.json()
-                                batch_ids.append(task_data.get("task_id"))
-                            else:
-                                st.error(f"Failed to upload {uploaded_file.name}: {response.text}")
-                            
-                            progress_bar.progress((i + 1) / len(uploaded_files))
+                            files.append(("files", (uploaded_file.name, uploaded_file, uploaded_file.type)))
+                        data = {
+                            "api_key": api_key, 
+                            "hf_token": hf_token,
+                            "username": st.session_state.user['username']
+                        }
+                        if num_speakers:
+                            data["num_speakers"] = num_speakers
+                        if engine:
+                            data["engine"] = engine
+                        if preset:
+                            data["preset"] = preset
+                        if language:
+                            data["language"] = language
+                        if vad is not None:
+                            data["vad"] = vad
+                        
+                        with st.spinner(f"Uploading {len(uploaded_files)} files..."):
+                            response = requests.post(f"{get_backend_url()}/process/batch", files=files, data=data, headers=auth_headers())
+                        
+                        batch_ids = []
+                        if response.status_code == 200:
+                            batch_ids = response.json().get("task_ids", [])
+                        else:
+                            st.error(f"Failed to upload files: {response.text}")
                         
                         if batch_ids:
                             st.session_state.batch_tasks = batch_ids
@@ -691,18 +761,24 @@ elif page == "History":
     st.title("📜 Transcription History")
     
     try:
-        # Pass user_id and is_admin flag
-        user_id = st.session_state.user['id']
+        # The backend derives the user and admin role from the access token
         is_admin = st.session_state.user.get('is_admin', False)
         
-        response = requests.get(f"{get_backend_url()}/tasks", params={"user_id": user_id, "is_admin": is_admin})
+        response = requests.get(f"{get_backend_url()}/tasks", params={"apply_aliases": True}, headers=auth_headers())
         
-        if response.status_code == 200:
+        if response.status_code == 401:
+            st.warning("Your session has expired. Please log in again.")
+            st.session_state.user = None
+            st.stop()
+        elif response.status_code == 200:
             tasks = response.json()
             
             if not tasks:
                 st.info("No history found.")
             else:
+                # Speaker names are already applied by the backend (apply_aliases)
+                export_tasks = tasks
+
                 # Create a DataFrame for the list
                 df = pd.DataFrame(tasks)
                 df['created_at'] = pd.to_datetime(df['created_at'])
@@ -729,7 +805,7 @@ elif page == "History":
                     # Prepare ZIP data
                     zip_buffer = io.BytesIO()
                     with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                        for t in tasks:
+                        for t in export_tasks:
                             segs = t.get('corrected_segments') or t.get('raw_segments')
                             if segs:
                                 vtt_data = generate_vtt(segs)
@@ -741,7 +817,7 @@ elif page == "History":
                     
                     with btn_col1:
                         # Download Single Selected
-                        selected_task_data = next((t for t in tasks if t['id'] == task_id), None)
+                        selected_task_data = next((t for t in export_tasks if t['id'] == task_id), None)
                         if selected_task_data:
                             zip_data = create_task_zip(selected_task_data)
                             st.download_button(
@@ -758,7 +834,7 @@ elif page == "History":
                         # Prepare ZIP data for ALL tasks
                         zip_buffer_all = io.BytesIO()
                         with zipfile.ZipFile(zip_buffer_all, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                            for t in tasks:
+                            for t in export_tasks:
                                 # Create a folder name: {id}_{filename}/
                                 folder_name = f"{t['id']}_{t['filename']}/"
                                 add_task_to_zip(zip_file, t, folder_prefix=folder_name)
@@ -783,7 +859,7 @@ elif page == "History":
                     active_id = st.session_state.history_active_task_id
                     
                     with st.spinner("Loading details..."):
-                        detail_response = requests.get(f"{get_backend_url()}/tasks/{active_id}")
+                        detail_response = requests.get(f"{get_backend_url()}/tasks/{active_id}", headers=auth_headers())
                         if detail_response.status_code == 200:
                             task = detail_response.json()
                             
@@ -801,7 +877,7 @@ elif page == "History":
                                                 "hf_token": hf_token,
                                                 "num_speakers": num_speakers
                                             }
-                                            retry_resp = requests.post(f"{get_backend_url()}/tasks/{active_id}/retry", json=retry_payload)
+                                            retry_resp = requests.post(f"{get_backend_url()}/tasks/{active_id}/retry", json=retry_payload, headers=auth_headers())
                                             if retry_resp.status_code == 200:
                                                 st.success("Retry started! Reloading...")
                                                 time.sleep(1)
@@ -812,13 +888,16 @@ elif page == "History":
                                             st.error(f"Error triggering retry: {str(e)}")
                             
                             audio_url = f"{get_backend_url()}/{task['audio_path']}"
+                            # Displayed with speaker names; `task` keeps the speaker codes for editing
+                            display_response = requests.get(f"{get_backend_url()}/tasks/{active_id}", params={"apply_aliases": True}, headers=auth_headers())
+                            display_task = display_response.json() if display_response.status_code == 200 else task
                             
                             render_unified_player(
                                 audio_url,
-                                task.get('corrected_transcription') or task.get('raw_transcription'),
-                                task.get('corrected_subtitles') or task.get('raw_subtitles'),
-                                task.get('corrected_segments') or task.get('raw_segments'),
-                                task.get('summary')
+                                display_task.get('corrected_transcription') or display_task.get('raw_transcription'),
+                                display_task.get('corrected_subtitles') or display_task.get('raw_subtitles'),
+                                display_task.get('corrected_segments') or display_task.get('raw_segments'),
+                                display_task.get('summary')
                             )
 
                             st.divider()
@@ -826,7 +905,7 @@ elif page == "History":
                             # --- Edit Mode ---
                             with st.expander("✏️ Edit Corrected Content", expanded=False):
                                 with st.form(key=f"edit_form_{active_id}"):
-                                    st.info("ℹ️ Note: Editing the **Corrected Subtitles** will automatically update the **Transcription** view above upon saving.")
+                                    st.info("ℹ️ Note: Only the segments you change are saved, and the **Transcription** view above is updated automatically.")
                                     
                                     # --- Speaker Renaming ---
                                     st.subheader("Rename Speakers")
@@ -834,19 +913,33 @@ elif page == "History":
                                     # Extract unique speakers
                                     unique_speakers = sorted(list(set(s.get('speaker') for s in current_segments if s.get('speaker'))))
                                     
+                                    speaker_aliases = task.get('speaker_aliases') or {}
                                     speaker_map = {}
                                     if unique_speakers:
                                         cols = st.columns(2)
                                         for i, spk in enumerate(unique_speakers):
                                             with cols[i % 2]:
-                                                new_name = st.text_input(f"Name for {spk}", value=spk, key=f"spk_{active_id}_{spk}")
-                                                if new_name != spk:
+                                                current_name = speaker_aliases.get(spk, spk)
+                                                new_name = st.text_input(f"Name for {spk}", value=current_name, key=f"spk_{active_id}_{spk}")
+                                                if new_name != current_name:
                                                     speaker_map[spk] = new_name
                                     else:
                                         st.caption("No speakers detected.")
 
                                     st.subheader("Edit Text")
-                                    new_subtitles = st.text_area("Corrected Subtitles", value=task.get('corrected_subtitles') or task.get('raw_subtitles') or "", height=300)
+                                    # Only the text column is editable; changed rows are sent as segment patches
+                                    segments_df = pd.DataFrame(
+                                        [{"start": s['start'], "end": s['end'], "speaker": s.get('speaker', ''), "text": s['text']} for s in current_segments],
+                                        columns=["start", "end", "speaker", "text"]
+                                    )
+                                    edited_df = st.data_editor(
+                                        segments_df,
+                                        disabled=["start", "end", "speaker"],
+                                        num_rows="fixed",
+                                        width="stretch",
+                                        height=300,
+                                        key=f"segments_editor_{active_id}"
+                                    )
                                     
                                     # Regeneration Checkbox
                                     regenerate_summary = st.checkbox("🔄 Regenerate AI Summary based on new content", help="If checked, the AI will re-summarize the text after you save. This requires your API Key.")
@@ -860,8 +953,12 @@ elif page == "History":
                                     submit_button = st.form_submit_button(label="Save Changes")
                                     
                                     if submit_button:
+                                        segment_edits = [
+                                            {"index": int(idx), "text": row['text']}
+                                            for idx, row in edited_df.iterrows()
+                                            if row['text'] != current_segments[idx]['text']
+                                        ]
                                         update_payload = {
-                                            "corrected_subtitles": new_subtitles,
                                             "summary": new_summary,
                                             "regenerate_summary": regenerate_summary,
                                             "api_key": api_key # From sidebar
@@ -870,7 +967,20 @@ elif page == "History":
                                             update_payload["speaker_map"] = speaker_map
                                             
                                         try:
-                                            update_resp = requests.put(f"{get_backend_url()}/tasks/{active_id}", json=update_payload)
+                                            if segment_edits:
+                                                patch_resp = requests.patch(
+                                                    f"{get_backend_url()}/tasks/{active_id}/segments",
+                                                    json={"version": task.get('version') or 0, "edits": segment_edits},
+                                                    headers=auth_headers()
+                                                )
+                                                if patch_resp.status_code == 409:
+                                                    # Modified elsewhere, or correction is still running
+                                                    st.error(f"Could not save your edits: {patch_resp.json().get('detail')}")
+                                                    st.stop()
+                                                elif patch_resp.status_code != 200:
+                                                    st.error(f"Failed to save segment edits: {patch_resp.text}")
+                                                    st.stop()
+                                            update_resp = requests.put(f"{get_backend_url()}/tasks/{active_id}", json=update_payload, headers=auth_headers())
                                             if update_resp.status_code == 200:
                                                 st.success("Changes saved successfully! Reloading...")
                                                 time.sleep(1)
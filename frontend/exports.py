@@ -0,0 +1,75 @@
+"""
+Subtitle exports. Kept free of Streamlit so they can be benchmarked and reused.
+"""
+import re
+
+def generate_vtt(segments):
+    if not segments:
+        return "WEBVTT\n\n"
+    vtt_content = "WEBVTT\n\n"
+    for seg in segments:
+        start = seg['start']
+        end = seg['end']
+        text = seg['text']
+        speaker = seg.get('speaker', '')
+        
+        # Format time: HH:MM:SS.mmm
+        def format_time(seconds):
+            hours = int(seconds // 3600)
+            minutes = int((seconds % 3600) // 60)
+            secs = seconds % 60
+            return f"{hours:02}:{minutes:02}:{secs:06.3f}"
+        
+        start_str = format_time(start)
+        end_str = format_time(end)
+        
+        if speaker:
+            text = f"[{speaker}] {text}"
+            
+        vtt_content += f"{start_str} --> {end_str}\n{text}\n\n"
+    return vtt_content
+
+def convert_summary_to_vtt(summary_text):
+    """
+    Converts summary text with timestamps [start -> end] to VTT format.
+    """
+    if not summary_text:
+        return "WEBVTT\n\n"
+        
+    vtt_content = "WEBVTT\n\n"
+    import re
+    
+    # Regex to find timestamps: [0.00s -> 5.00s] or [0.00 -> 5.00]
+    pattern = re.compile(r'\[\s*(\d+\.?\d*)\s*s?\s*->\s*(\d+\.?\d*)\s*s?\s*\]\s*(.*)')
+    
+    lines = summary_text.strip().split('\n')
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+        
+        match = pattern.match(line)
+        if match:
+            start_sec = float(match.group(1))
+            end_sec = float(match.group(2))
+            text = match.group(3).strip()
+            
+            # Format time: HH:MM:SS.mmm
+            def format_time(seconds):
+                hours = int(seconds // 3600)
+                minutes = int((seconds % 3600) // 60)
+                secs = seconds % 60
+                return f"{hours:02}:{minutes:02}:{secs:06.3f}"
+            
+            start_str = format_time(start_sec)
+            end_str = format_time(end_sec)
+            
+            vtt_content += f"{start_str} --> {end_str}\n{text}\n\n"
+        else:
+            # If line doesn't match timestamp format, maybe just append it as a note or skip
+            # For VTT, we need timestamps. If no timestamp, we can't really place it.
+            # But we could append it to the previous cue if we wanted, or just ignore.
+            # Let's try to be safe: if it looks like text, maybe give it a dummy timestamp or skip.
+            # For now, we only convert lines with timestamps.
+            pass
+            
+    return vtt_content
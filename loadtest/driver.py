@@ -0,0 +1,186 @@
+"""
+Simulates concurrent users against a running backend: register, log in,
+upload, poll until the task finishes, edit (segment patch and speaker
+rename) and export (task with aliases applied, plus the audio file).
+
+Reports p50/p99 latency and throughput per endpoint and end-to-end task
+times. Normally started by run.py, which also brings up the stubs and the
+backend; use it directly against a backend that is already running offline.
+
+Usage:
+    python loadtest/driver.py --base-url http://127.0.0.1:8000 --users 20 --tasks-per-user 2
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+FINAL_STATUSES = ["completed", "failed"]
+
+def percentile(values, p):
+    # Nearest-rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def synthetic_upload(seconds, seed=0):
+    import io
+    from synthetic_audio import generate_conversation, write_wav
+    audio, _ = generate_conversation(seconds, seed=seed)
+    buffer = io.BytesIO()
+    write_wav(buffer, audio)
+    return buffer.getvalue()
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.task_seconds = []
+        self.failed_tasks = 0
+
+    async def call(self, client, endpoint, method, url, **kwargs):
+        """
+        Sends one request and records it under `endpoint`. Returns the response, or None on a connection error.
+        """
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response is None or response.status_code >= 400:
+            self.errors[endpoint] += 1
+        return response
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "throughput_rps": len(latencies) / wall_seconds,
+            }
+        tasks = {"completed": len(self.task_seconds), "failed": self.failed_tasks, "throughput_per_minute": len(self.task_seconds) / wall_seconds * 60}
+        if self.task_seconds:
+            tasks["p50_seconds"] = percentile(self.task_seconds, 50)
+            tasks["p99_seconds"] = percentile(self.task_seconds, 99)
+        return {"wall_seconds": wall_seconds, "endpoints": endpoints, "tasks": tasks}
+
+async def wait_for_task(client, recorder, headers, task_id, poll_interval, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+        response = await recorder.call(client, "GET /tasks/{id}", "GET", f"/tasks/{task_id}", headers=headers)
+        if response is not None and response.status_code == 200 and response.json()["status"] in FINAL_STATUSES:
+            return response.json()
+    return None
+
+async def simulate_user(client, recorder, index, audio, args):
+    email = f"user{index}@loadtest.local"
+    credentials = {"email": email, "password": "loadtest-password"}
+    await recorder.call(client, "POST /register", "POST", "/register", json=credentials)
+    response = await recorder.call(client, "POST /login", "POST", "/login", json=credentials)
+    if response is None or response.status_code != 200:
+        recorder.failed_tasks += args.tasks_per_user
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for n in range(args.tasks_per_user):
+        started = time.perf_counter()
+        form = {"api_key": args.api_key, "username": f"user{index}"}
+        if args.diarize:
+            form["hf_token"] = "stub"
+        if args.pipeline_mode:
+            form["pipeline_mode"] = args.pipeline_mode
+        response = await recorder.call(
+            client, "POST /process", "POST", "/process",
+            data=form, files={"file": (f"user{index}-{n}.wav", audio, "audio/wav")}, headers=headers
+        )
+        if response is None or response.status_code != 200:
+            recorder.failed_tasks += 1
+            continue
+        task_id = response.json()["task_id"]
+
+        task = await wait_for_task(client, recorder, headers, task_id, args.poll_interval, args.task_timeout)
+        if task is None or task["status"] != "completed":
+            recorder.failed_tasks += 1
+            continue
+        recorder.task_seconds.append(time.perf_counter() - started)
+        await recorder.call(client, "GET /tasks", "GET", "/tasks", params={"limit": 20}, headers=headers)
+
+        # Edit: fix one line, then rename a speaker
+        if task.get("corrected_segments"):
+            await recorder.call(
+                client, "PATCH /tasks/{id}/segments/{index}", "PATCH", f"/tasks/{task_id}/segments/0",
+                json={"version": task.get("version") or 0, "text": "已編輯的第一行"}, headers=headers
+            )
+        await recorder.call(client, "PUT /tasks/{id}", "PUT", f"/tasks/{task_id}", json={"speaker_map": {"SPEAKER_00": f"User {index}"}}, headers=headers)
+
+        # Export: what the frontend downloads for the zip
+        await recorder.call(client, "GET /tasks/{id} (export)", "GET", f"/tasks/{task_id}", params={"apply_aliases": True}, headers=headers)
+        await recorder.call(client, "GET /media/{file}", "GET", "/" + task["audio_path"].lstrip("/"))
+
+async def run(args):
+    audio = synthetic_upload(args.audio_seconds)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.request_timeout, limits=limits) as client:
+        start = time.perf_counter()
+
+        async def delayed_user(index):
+            # Spread user arrivals over the ramp-up period
+            await asyncio.sleep(args.ramp_up * index / max(1, args.users))
+            await simulate_user(client, recorder, index, audio, args)
+
+        await asyncio.gather(*(delayed_user(i) for i in range(args.users)))
+        wall_seconds = time.perf_counter() - start
+
+    report = recorder.report(wall_seconds)
+    report["settings"] = {k: v for k, v in vars(args).items() if k not in ["api_key", "output"]}
+    report["timestamp"] = datetime.datetime.utcnow().isoformat()
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.output}")
+    return report
+
+def print_report(report):
+    print(f"{'endpoint':<36}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>8}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<36}{stats['requests']:>9}{stats['errors']:>8}{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['throughput_rps']:>8.2f}")
+    tasks = report["tasks"]
+    line = f"Tasks: {tasks['completed']} completed, {tasks['failed']} failed, {tasks['throughput_per_minute']:.1f}/min"
+    if "p50_seconds" in tasks:
+        line += f", end-to-end p50 {tasks['p50_seconds']:.1f}s p99 {tasks['p99_seconds']:.1f}s"
+    print(f"{line} (wall time {report['wall_seconds']:.1f}s)")
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--tasks-per-user", type=int, default=1)
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which users start")
+    parser.add_argument("--audio-seconds", type=float, default=60, help="Length of the synthetic upload")
+    parser.add_argument("--diarize", action="store_true", help="Send an hf_token so tasks run diarization")
+    parser.add_argument("--pipeline-mode", choices=["separate", "combined"])
+    parser.add_argument("--api-key", default="loadtest-key")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--task-timeout", type=float, default=600)
+    parser.add_argument("--request-timeout", type=float, default=60)
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", f"loadtest-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.json"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    add_arguments(parser)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,102 @@
+"""
+Deterministic stand-ins for Whisper and pyannote with configurable latency.
+
+install() registers the "fake" transcription engine and replaces the
+diarization pipeline loader, so the backend runs its normal code paths
+without models or GPUs.
+"""
+import os
+import time
+import wave
+from collections import namedtuple
+
+# Simulated processing time per second of audio
+FAKE_TRANSCRIBE_RTF = float(os.getenv("FAKE_TRANSCRIBE_RTF", "0.05"))
+FAKE_DIARIZE_RTF = float(os.getenv("FAKE_DIARIZE_RTF", "0.02"))
+FAKE_SEGMENT_SECONDS = 4.0
+FAKE_TURN_SECONDS = 10.0
+# Used when the duration of an upload cannot be read
+FAKE_DEFAULT_SECONDS = 60.0
+SAMPLE_RATE = 16000
+
+FAKE_TEXT = "今天的會議討論專案進度預算與下一季的產品規劃請大家準備報告"
+
+Turn = namedtuple("Turn", ["start", "end"])
+
+def audio_duration(audio):
+    if isinstance(audio, dict):
+        # In-memory input of the diarization pipeline, e.g. the startup warm-up
+        return audio["waveform"].shape[-1] / audio["sample_rate"]
+    if not isinstance(audio, str):
+        return len(audio) / SAMPLE_RATE
+    try:
+        with wave.open(audio, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError, OSError):
+        from longform import probe_duration
+        return probe_duration(audio) or FAKE_DEFAULT_SECONDS
+
+def fake_engine_class():
+    from engines import TranscriptionEngine
+
+    class FakeEngine(TranscriptionEngine):
+        """
+        Sleeps for duration * FAKE_TRANSCRIBE_RTF and returns one segment per
+        FAKE_SEGMENT_SECONDS with fixed text.
+        """
+        name = "fake"
+
+        def transcribe(self, audio, model_size=None, **decoding_options):
+            duration = audio_duration(audio)
+            time.sleep(duration * FAKE_TRANSCRIBE_RTF)
+            segments = []
+            start = 0.0
+            while start < duration:
+                end = min(start + FAKE_SEGMENT_SECONDS, duration)
+                offset = len(segments) % len(FAKE_TEXT)
+                segments.append({
+                    "id": len(segments),
+                    "start": round(start, 3),
+                    "end": round(end, 3),
+                    "text": (FAKE_TEXT[offset:] + FAKE_TEXT)[:12],
+                    "avg_logprob": -0.2 if len(segments) % 3 else -1.2, # Every third segment goes to the LLM in selective mode
+                    "compression_ratio": 1.5,
+                    "no_speech_prob": 0.01,
+                })
+                start = end
+            return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": "zh"}
+
+    return FakeEngine
+
+class FakeAnnotation:
+    def __init__(self, turns):
+        self.turns = turns
+
+    def itertracks(self, yield_label=False):
+        for start, end, speaker in self.turns:
+            yield (Turn(start, end), None, speaker) if yield_label else (Turn(start, end), None)
+
+class FakeDiarizationPipeline:
+    """
+    Alternates speakers every FAKE_TURN_SECONDS after sleeping duration * FAKE_DIARIZE_RTF.
+    """
+    def __call__(self, audio, num_speakers=None, **kwargs):
+        duration = audio_duration(audio)
+        time.sleep(duration * FAKE_DIARIZE_RTF)
+        speakers = num_speakers or 2
+        turns = []
+        start = 0.0
+        while start < duration:
+            end = min(start + FAKE_TURN_SECONDS, duration)
+            turns.append((start, end, f"SPEAKER_{len(turns) % speakers:02d}"))
+            start = end
+        return FakeAnnotation(turns)
+
+def install():
+    import engines
+    import logic
+
+    engine_class = fake_engine_class()
+    engines.ENGINES[engine_class.name] = engine_class
+    pipeline = FakeDiarizationPipeline()
+    logic.load_diarization_pipeline = lambda hf_token: pipeline
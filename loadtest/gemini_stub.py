@@ -0,0 +1,122 @@
+"""
+Local Gemini stand-in: a plaintext gRPC server implementing GenerateContent
+and StreamGenerateContent of the v1beta GenerativeService.
+
+Point the backend at it with GEMINI_API_ENDPOINT=127.0.0.1:<port>. Responses
+are deterministic and shaped like the real ones for each prompt the backend
+sends: corrections echo the submitted segments, the combined call returns
+an empty correction list plus one key point, and summaries are fixed lines.
+
+Usage:
+    python loadtest/gemini_stub.py --port 50051 --latency-ms 300 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+
+SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+def prompt_text(request):
+    return "".join(part.text for content in request.contents for part in content.parts)
+
+def stub_reply(prompt, json_mode):
+    if json_mode and "段落：\n" in prompt:
+        # Index-aligned correction: return every item unchanged
+        items = json.loads(prompt.split("段落：\n", 1)[1].strip())
+        return json.dumps(items, ensure_ascii=False)
+    if json_mode and "key_points" in prompt:
+        return json.dumps({"segments": [], "key_points": [{"start": 0, "end": 10, "text": "S1 說明會議目的"}]}, ensure_ascii=False)
+    if json_mode:
+        return "[]"
+    lines = re.findall(r"^(\d+)-(\d+) (S\d+):", prompt, re.MULTILINE)[:3]
+    if not lines:
+        return "[0s -> 10s] 會議重點摘要"
+    return "\n".join(f"[{start}s -> {end}s] {speaker} 提出重點 {i + 1}" for i, (start, end, speaker) in enumerate(lines))
+
+class GeminiStub:
+    def __init__(self, latency_ms=200, chunk_ms=20, chunk_chars=40, error_rate=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.chunk_delay = chunk_ms / 1000
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    def response(self, text, prompt=None):
+        from google.ai import generativelanguage as glm
+        response = glm.GenerateContentResponse(candidates=[
+            glm.Candidate(content=glm.Content(parts=[glm.Part(text=text)], role="model"), index=0)
+        ])
+        if prompt is not None:
+            # Only the final chunk carries usage, like the real API
+            response.candidates[0].finish_reason = glm.Candidate.FinishReason.STOP
+            response.usage_metadata = glm.GenerateContentResponse.UsageMetadata(
+                prompt_token_count=len(prompt) // 4,
+                candidates_token_count=len(text) // 4,
+                total_token_count=(len(prompt) + len(text)) // 4
+            )
+        return response
+
+    async def handle(self, request, context):
+        import grpc
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self.random.random() < self.error_rate:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Stub quota exceeded")
+        prompt = prompt_text(request)
+        return prompt, stub_reply(prompt, request.generation_config.response_mime_type == "application/json")
+
+    async def generate_content(self, request, context):
+        prompt, text = await self.handle(request, context)
+        return self.response(text, prompt)
+
+    async def stream_generate_content(self, request, context):
+        prompt, text = await self.handle(request, context)
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            yield self.response(chunk, prompt if i == len(chunks) - 1 else None)
+
+async def serve(port, stub, ready=None):
+    """
+    Runs the stub until cancelled. `ready` (threading.Event) is set once it accepts connections.
+    """
+    import grpc
+    from google.ai import generativelanguage as glm
+
+    handler = grpc.method_handlers_generic_handler(SERVICE, {
+        "GenerateContent": grpc.unary_unary_rpc_method_handler(
+            stub.generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize
+        ),
+        "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+            stub.stream_generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize
+        ),
+    })
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(f"127.0.0.1:{port}")
+    await server.start()
+    if ready:
+        ready.set()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(None)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=50051)
+    parser.add_argument("--latency-ms", type=float, default=200, help="Delay before the first chunk")
+    parser.add_argument("--chunk-ms", type=float, default=20, help="Delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with RESOURCE_EXHAUSTED (429)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(f"Gemini stub listening on 127.0.0.1:{args.port}")
+    asyncio.run(serve(args.port, GeminiStub(args.latency_ms, args.chunk_ms, error_rate=args.error_rate, seed=args.seed)))
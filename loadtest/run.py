@@ -0,0 +1,108 @@
+"""
+Offline load test: starts the Supabase auth stub, the Gemini stub and the
+backend (with fake Whisper/pyannote, SQLite, in a temporary directory), runs
+the user driver against it and shuts everything down.
+
+Latencies of every stand-in are configurable, so the backend's own overhead
+(request handling, queues, DB commits, LLM loop) can be measured in isolation
+or under realistic delays. The backend log is kept in the work directory.
+
+Usage:
+    python loadtest/run.py --users 20 --tasks-per-user 2 --gemini-latency-ms 800 --transcribe-rtf 0.1
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, LOADTEST_DIR)
+
+import driver
+from gemini_stub import GeminiStub, serve as serve_gemini
+from supabase_stub import AuthStub, make_server, anon_key
+
+JWT_SECRET = "loadtest-jwt-secret"
+
+def start_stubs(args):
+    auth_server = make_server(args.supabase_port, AuthStub(JWT_SECRET, args.supabase_latency_ms))
+    threading.Thread(target=auth_server.serve_forever, daemon=True).start()
+
+    gemini = GeminiStub(args.gemini_latency_ms, args.gemini_chunk_ms, error_rate=args.gemini_error_rate)
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(serve_gemini(args.gemini_port, gemini, ready)), daemon=True).start()
+    if not ready.wait(10):
+        raise RuntimeError("Gemini stub did not start")
+    return auth_server, gemini
+
+def start_backend(args, workdir):
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": f"http://127.0.0.1:{args.supabase_port}",
+        "SUPABASE_KEY": anon_key(JWT_SECRET),
+        "SUPABASE_JWT_SECRET": JWT_SECRET, # Access tokens are verified locally with the stub's secret
+        "DATABASE_PASSWORD": "", # Always SQLite in the work directory, even if .env sets a password
+        "GEMINI_API_ENDPOINT": f"127.0.0.1:{args.gemini_port}",
+        "TRANSCRIPTION_ENGINE": "fake",
+        "FAKE_TRANSCRIBE_RTF": str(args.transcribe_rtf),
+        "FAKE_DIARIZE_RTF": str(args.diarize_rtf),
+    })
+    # The stub has no quota; keep the client-side limiter out of the way unless set explicitly
+    env.setdefault("GEMINI_RPM", "100000")
+    env.setdefault("GEMINI_TPM", "1000000000")
+    env.setdefault("GEMINI_BACKOFF_SECONDS", "0.2")
+
+    log_path = os.path.join(workdir, "backend.log")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--app-dir", LOADTEST_DIR,
+         "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=open(log_path, "w"), stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited during startup, see {log_path}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/ready", timeout=1).status_code == 200:
+                return process, log_path
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Backend did not become ready in {args.startup_timeout}s, see {log_path}")
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    auth_server, gemini = start_stubs(args)
+    backend, log_path = start_backend(args, workdir)
+    print(f"Backend ready (work directory {workdir})")
+    try:
+        args.base_url = f"http://127.0.0.1:{args.port}"
+        asyncio.run(driver.run(args))
+        print(f"Gemini stub requests: {gemini.requests}")
+    finally:
+        backend.terminate()
+        backend.wait(10)
+        auth_server.shutdown()
+    print(f"Backend log: {log_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    driver.add_arguments(parser)
+    parser.add_argument("--port", type=int, default=18000, help="Backend port")
+    parser.add_argument("--supabase-port", type=int, default=54321)
+    parser.add_argument("--gemini-port", type=int, default=50051)
+    parser.add_argument("--supabase-latency-ms", type=float, default=30)
+    parser.add_argument("--gemini-latency-ms", type=float, default=500, help="Delay before the first response chunk")
+    parser.add_argument("--gemini-chunk-ms", type=float, default=20)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Fraction of Gemini requests rejected with 429")
+    parser.add_argument("--transcribe-rtf", type=float, default=0.05, help="Fake transcription seconds per audio second")
+    parser.add_argument("--diarize-rtf", type=float, default=0.02)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    main(parser.parse_args())
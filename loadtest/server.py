@@ -0,0 +1,19 @@
+"""
+The backend with the fake transcription engine and diarization pipeline
+installed. run.py starts it with uvicorn against the local stubs:
+    uvicorn server:app --app-dir loadtest
+"""
+import os
+import sys
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(LOADTEST_DIR, "..", "backend"))
+sys.path.insert(0, LOADTEST_DIR)
+
+os.environ.setdefault("TRANSCRIPTION_ENGINE", "fake")
+
+from fakes import install
+
+install()
+
+from main import app
@@ -0,0 +1,151 @@
+"""
+Local Supabase Auth (GoTrue) stand-in for /register and /login.
+
+Implements the endpoints the backend's Supabase client calls: sign-up
+(auto-confirmed), password sign-in and user lookup. Users live in memory;
+access tokens are HS256 JWTs signed with --jwt-secret, like Supabase's.
+
+Point the backend at it with SUPABASE_URL=http://127.0.0.1:<port> and
+SUPABASE_KEY set to the printed anon key.
+
+Usage:
+    python loadtest/supabase_stub.py --port 54321 --latency-ms 50
+"""
+import argparse
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+TOKEN_SECONDS = 3600
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def sign_jwt(claims, secret):
+    header = b64url(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    payload = b64url(json.dumps(claims).encode())
+    signature = hmac.new(secret.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+    return f"{header}.{payload}.{b64url(signature)}"
+
+def anon_key(secret):
+    return sign_jwt({"iss": "supabase", "role": "anon", "iat": 0, "exp": 4102444800}, secret)
+
+def decode_jwt_payload(token):
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+class AuthStub:
+    def __init__(self, jwt_secret, latency_ms=0):
+        self.jwt_secret = jwt_secret
+        self.latency = latency_ms / 1000
+        self.users = {} # email -> (password, user)
+        self.lock = threading.Lock()
+
+    def create_user(self, email, password):
+        with self.lock:
+            if email not in self.users:
+                now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+                user = {
+                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, email)),
+                    "aud": "authenticated",
+                    "role": "authenticated",
+                    "email": email,
+                    "email_confirmed_at": now,
+                    "confirmed_at": now,
+                    "created_at": now,
+                    "updated_at": now,
+                    "app_metadata": {"provider": "email", "providers": ["email"]},
+                    "user_metadata": {},
+                    "identities": [],
+                }
+                self.users[email] = (password, user)
+            return self.users[email][1]
+
+    def session(self, user):
+        now = int(time.time())
+        claims = {
+            "sub": user["id"],
+            "email": user["email"],
+            "aud": "authenticated",
+            "role": "authenticated",
+            "iat": now,
+            "exp": now + TOKEN_SECONDS,
+            "app_metadata": user["app_metadata"],
+            "user_metadata": user["user_metadata"],
+        }
+        return {
+            "access_token": sign_jwt(claims, self.jwt_secret),
+            "token_type": "bearer",
+            "expires_in": TOKEN_SECONDS,
+            "expires_at": now + TOKEN_SECONDS,
+            "refresh_token": uuid.uuid4().hex,
+            "user": user,
+        }
+
+    def handle(self, method, path, query, body, headers):
+        """
+        Returns (status, json body).
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "POST" and path == "/auth/v1/signup":
+            return 200, self.session(self.create_user(body.get("email"), body.get("password")))
+        if method == "POST" and path == "/auth/v1/token" and query.get("grant_type") == ["password"]:
+            password, user = self.users.get(body.get("email"), (None, None))
+            if user is None or password != body.get("password"):
+                return 400, {"error": "invalid_grant", "error_description": "Invalid login credentials", "code": 400, "msg": "Invalid login credentials"}
+            return 200, self.session(user)
+        if method == "GET" and path == "/auth/v1/user":
+            token = headers.get("Authorization", "").removeprefix("Bearer ").strip()
+            try:
+                email = decode_jwt_payload(token).get("email")
+            except (IndexError, ValueError):
+                email = None
+            if email not in self.users:
+                return 401, {"code": 401, "msg": "Invalid token"}
+            return 200, self.users[email][1]
+        if method == "POST" and path == "/auth/v1/logout":
+            return 204, None
+        return 404, {"code": 404, "msg": f"Not implemented in stub: {method} {path}"}
+
+def make_server(port, stub):
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            status, payload = stub.handle(method, url.path, parse_qs(url.query), body, self.headers)
+            data = json.dumps(payload).encode() if payload is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--jwt-secret", default="loadtest-jwt-secret")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    print(f"Supabase auth stub listening on http://127.0.0.1:{args.port}")
+    print(f"SUPABASE_KEY={anon_key(args.jwt_secret)}")
+    make_server(args.port, AuthStub(args.jwt_secret, args.latency_ms)).serve_forever()
@@ -1,14 +1,28 @@
 from backend.database import engine
 from sqlalchemy import text
 
+# Columns added to the tasks table after it was first created.
+# init_db() only creates missing tables, so existing databases need these.
+COLUMNS = [
+    ("username", "text"),
+    ("speaker_aliases", "json"),
+    ("version", "integer default 0"),
+    ("transcription_options", "json"),
+    ("llm_options", "json"),
+    ("llm_usage", "json"),
+    ("summary_chunks", "json"),
+    ("progress", "json"),
+]
+
 def add_column():
     try:
         print("Connecting to DB...")
         with engine.connect() as connection:
-            print("Adding username column...")
-            connection.execute(text("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS username text;"))
+            for name, column_type in COLUMNS:
+                print(f"Adding {name} column...")
+                connection.execute(text(f"ALTER TABLE tasks ADD COLUMN IF NOT EXISTS {name} {column_type};"))
             connection.commit()
-            print("Column added successfully.")
+            print("Columns added successfully.")
     except Exception as e:
         print(f"Error: {e}")
 